@@ -0,0 +1,40 @@
+"""
+Feature hashing shared by lab 4's offline embedder and lab 9's memory index.
+
+Text is lowercased and split into word tokens, stopwords are dropped, and the
+remaining unigrams and adjacent bigrams are counted. Each feature is hashed
+into a bucket with ``zlib.crc32`` instead of ``hash()``, so vectors stay
+stable across processes (Python randomizes string hashes per interpreter).
+"""
+
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "do", "for", "from",
+    "has", "have", "he", "her", "his", "i", "in", "is", "it", "its", "me", "my",
+    "of", "on", "or", "she", "so", "that", "the", "their", "they", "this", "to",
+    "was", "we", "what", "with", "you", "your",
+})
+
+
+def tokenize(text: str, stopwords=STOPWORDS) -> list[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in stopwords]
+
+
+def ngram_counts(text: str, stopwords=STOPWORDS) -> Counter:
+    """Unigram and bigram counts of the tokens left after dropping ``stopwords``."""
+    tokens = tokenize(text, stopwords)
+    counts = Counter(tokens)
+    counts.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return counts
+
+
+@lru_cache(maxsize=1 << 16)
+def bucket(feature: str, dims: int) -> tuple[int, float]:
+    """Stable bucket and random sign for ``feature``."""
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dims, 1.0 if (h >> 31) & 1 else -1.0
@@ -1,5 +1,6 @@
 import streamlit as st
-import anthropic
+
+from labs.startup import get_anthropic_client
 
 st.set_page_config(page_title="Humanizer", layout="centered")
 
@@ -103,7 +104,7 @@ if st.button("Humanize →"):
     else:
         with st.spinner("Rewriting..."):
             try:
-                client = anthropic.Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
+                client = get_anthropic_client(st.secrets["ANTHROPIC_API_KEY"], page="humanize")
                 message = client.messages.create(
                     model="claude-opus-4-5",
                     max_tokens=4096,
@@ -0,0 +1,511 @@
+"""
+Latency / token / cost instrumentation shared by every page.
+
+Wrap a client once where the page creates it and every call through it is
+recorded as a span (page, kind, model, seconds, time to first token, tokens,
+estimated cost, cache hit, error):
+
+    client = instrument_openai(OpenAI(api_key=...), page="lab4")
+    collection = instrument_collection(collection, page="lab4")
+    with span("pdf", "extract", page="lab4"):
+        ...
+
+Recent spans are kept in memory (for quantiles) next to running totals that
+are never evicted (for counters). Spans are appended to
+``$LAB_TELEMETRY_DIR/spans.jsonl`` by a background writer (default
+``telemetry/``; set ``LAB_TELEMETRY=0`` to disable), and everything is exposed
+in Prometheus text format on ``http://127.0.0.1:$LAB_METRICS_PORT/metrics``
+when that variable is set.
+
+Offline reports from the JSONL file:
+
+    python -m labs.instrumentation report telemetry/spans.jsonl
+    python -m labs.instrumentation prom telemetry/spans.jsonl > metrics.prom
+"""
+
+import argparse
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+TELEMETRY_DIR = Path(os.getenv("LAB_TELEMETRY_DIR", "telemetry"))
+TELEMETRY_ENABLED = os.getenv("LAB_TELEMETRY", "1") != "0"
+
+# Estimated USD per 1M tokens (input, output); unknown models are costed at 0
+PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4": (30.00, 60.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-3-small": (0.02, 0.0),
+    "claude-sonnet-4": (3.00, 15.00),
+    "claude-haiku-4-5": (1.00, 5.00),
+    "claude-opus-4-5": (5.00, 25.00),
+}
+
+_lock = threading.Lock()
+_spans: deque = deque(maxlen=20000)
+_totals: dict[tuple, dict] = {}
+_gauges: list = []
+_server = None
+_pending: queue.Queue = queue.Queue()
+_writer = None
+
+
+def estimate_cost(model: str | None, input_tokens: int | None, output_tokens: int | None) -> float:
+    if not model:
+        return 0.0
+    # Longest matching prefix, so dated ids like "claude-haiku-4-5-20251001" resolve
+    matches = [m for m in PRICES if model.startswith(m)]
+    if not matches:
+        return 0.0
+    price_in, price_out = PRICES[max(matches, key=len)]
+    return ((input_tokens or 0) * price_in + (output_tokens or 0) * price_out) / 1_000_000
+
+
+def estimate_tokens(text: str) -> int:
+    # Same rough rule as lab 3: 1 token ≈ 4 characters
+    return len(text or "") // 4
+
+
+def _accumulate(totals: dict, span_data: dict) -> None:
+    """Add one span to the per (page, kind, model) running totals."""
+    key = (span_data["page"], span_data["kind"], span_data.get("model") or "")
+    t = totals.setdefault(key, {"count": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0,
+                                "cost": 0.0, "cache_hits": 0, "coalesced": 0, "errors": 0})
+    t["count"] += 1
+    t["seconds"] += span_data.get("seconds") or 0.0
+    t["input_tokens"] += span_data.get("input_tokens") or 0
+    t["output_tokens"] += span_data.get("output_tokens") or 0
+    t["cost"] += span_data.get("cost") or 0.0
+    t["cache_hits"] += 1 if span_data.get("cache_hit") else 0
+    t["coalesced"] += 1 if span_data.get("coalesced") else 0
+    t["errors"] += 1 if span_data.get("error") else 0
+
+
+def _write_spans() -> None:
+    """Drain queued spans into ``spans.jsonl``, a batch per write, off the request threads."""
+    while True:
+        batch = [_pending.get()]
+        while True:
+            try:
+                batch.append(_pending.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            TELEMETRY_DIR.mkdir(parents=True, exist_ok=True)
+            with open(TELEMETRY_DIR / "spans.jsonl", "a") as f:
+                f.writelines(json.dumps(s) + "\n" for s in batch)
+        except OSError:
+            pass   # telemetry must never break a page
+        for _ in batch:
+            _pending.task_done()
+
+
+def flush(timeout: float = 5.0) -> None:
+    """Wait until queued spans are on disk (called at exit)."""
+    deadline = time.monotonic() + timeout
+    while _pending.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def record(span_data: dict) -> None:
+    global _writer
+    span_data["cost"] = round(estimate_cost(
+        span_data.get("model"), span_data.get("input_tokens"), span_data.get("output_tokens")
+    ), 8)
+    with _lock:
+        _spans.append(span_data)
+        _accumulate(_totals, span_data)
+        if TELEMETRY_ENABLED and _writer is None:
+            _writer = threading.Thread(target=_write_spans, name="lab-telemetry", daemon=True)
+            _writer.start()
+            atexit.register(flush)
+    if TELEMETRY_ENABLED:
+        _pending.put(span_data)
+
+
+def _new_span(kind: str, name: str, page: str, model: str | None) -> dict:
+    return {
+        "ts": time.time(), "page": page, "kind": kind, "name": name, "model": model,
+        "seconds": None, "ttft": None, "input_tokens": None, "output_tokens": None,
+        "cache_hit": None, "error": None,
+    }
+
+
+@contextmanager
+def span(kind: str, name: str, page: str, model: str | None = None, **fields):
+    """Time a block and record it; the yielded dict can be filled in (tokens, cache_hit, ...)."""
+    data = {**_new_span(kind, name, page, model), **fields}
+    start = time.perf_counter()
+    try:
+        yield data
+    except BaseException as e:
+        data["error"] = type(e).__name__
+        raise
+    finally:
+        data["seconds"] = round(time.perf_counter() - start, 6)
+        record(data)
+
+
+def event(kind: str, name: str, page: str, model: str | None = None, **fields) -> None:
+    """Record a zero-duration span, e.g. a cache lookup that made no call."""
+    record({**_new_span(kind, name, page, model), "seconds": 0.0, **fields})
+
+
+def _traced_stream(iterator, data: dict, start: float, text_of):
+    """Pass stream chunks through, noting time to first chunk and output size."""
+    chars = 0
+    try:
+        for chunk in iterator:
+            if data["ttft"] is None:
+                data["ttft"] = round(time.perf_counter() - start, 6)
+            chars += len(text_of(chunk) or "")
+            yield chunk
+    except BaseException as e:
+        data["error"] = type(e).__name__
+        raise
+    finally:
+        data["seconds"] = round(time.perf_counter() - start, 6)
+        if data["output_tokens"] is None:
+            data["output_tokens"] = chars // 4
+        record(data)
+
+
+# ── OpenAI ───────────────────────────────────────────────────────────────────
+def _openai_chunk_text(chunk):
+    if not getattr(chunk, "choices", None):
+        return ""
+    return getattr(chunk.choices[0].delta, "content", "") or ""
+
+
+def instrument_openai(client, page: str):
+    """Record every ``chat.completions.create`` and ``embeddings.create`` made through ``client``."""
+    if getattr(client, "_lab_instrumented", False):
+        return client
+    chat_create = client.chat.completions.create
+    embed_create = client.embeddings.create
+
+    def traced_chat(*args, **kwargs):
+        model = kwargs.get("model")
+        prompt_chars = sum(len(str(m.get("content", "")) if isinstance(m, dict) else "")
+                           for m in kwargs.get("messages", []))
+        if kwargs.get("stream"):
+            data = _new_span("openai.chat", "stream", page, model)
+            data["input_tokens"] = prompt_chars // 4
+            start = time.perf_counter()
+            return _traced_stream(chat_create(*args, **kwargs), data, start, _openai_chunk_text)
+        with span("openai.chat", "create", page, model) as data:
+            response = chat_create(*args, **kwargs)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                data["input_tokens"] = usage.prompt_tokens
+                data["output_tokens"] = usage.completion_tokens
+            return response
+
+    def traced_embed(*args, **kwargs):
+        with span("openai.embedding", "create", page, kwargs.get("model")) as data:
+            response = embed_create(*args, **kwargs)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                data["input_tokens"] = usage.prompt_tokens
+                data["output_tokens"] = 0
+            return response
+
+    client.chat.completions.create = traced_chat
+    client.embeddings.create = traced_embed
+    client._lab_instrumented = True
+    return client
+
+
+# ── Anthropic ────────────────────────────────────────────────────────────────
+class _TracedMessageStream:
+    """Wraps ``client.messages.stream(...)`` so ``text_stream`` is timed and usage recorded."""
+
+    def __init__(self, manager, data: dict):
+        self._manager = manager
+        self._data = data
+        self._stream = None
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._stream = self._manager.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        data = self._data
+        data["seconds"] = round(time.perf_counter() - self._start, 6)
+        if exc_type is not None:
+            data["error"] = exc_type.__name__
+        else:
+            try:
+                usage = self._stream.get_final_message().usage
+                data["input_tokens"] = usage.input_tokens
+                data["output_tokens"] = usage.output_tokens
+            except Exception:
+                pass
+        record(data)
+        return self._manager.__exit__(exc_type, exc, tb)
+
+    @property
+    def text_stream(self):
+        for text in self._stream.text_stream:
+            if self._data["ttft"] is None:
+                self._data["ttft"] = round(time.perf_counter() - self._start, 6)
+            yield text
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def instrument_anthropic(client, page: str, name: str = "create"):
+    """Record every ``messages.create`` / ``messages.stream`` made through ``client``."""
+    if getattr(client, "_lab_instrumented", False):
+        return client
+    create = client.messages.create
+    stream = client.messages.stream
+
+    def traced_create(*args, **kwargs):
+        with span("anthropic.messages", name, page, kwargs.get("model")) as data:
+            response = create(*args, **kwargs)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                data["input_tokens"] = usage.input_tokens
+                data["output_tokens"] = usage.output_tokens
+            return response
+
+    def traced_stream(*args, **kwargs):
+        return _TracedMessageStream(
+            stream(*args, **kwargs), _new_span("anthropic.messages", "stream", page, kwargs.get("model"))
+        )
+
+    client.messages.create = traced_create
+    client.messages.stream = traced_stream
+    client._lab_instrumented = True
+    return client
+
+
+# ── LangChain ────────────────────────────────────────────────────────────────
+class TracedChain:
+    """Wraps a runnable chain; ``invoke``/``stream``/``batch`` are recorded as spans.
+
+    ``StrOutputParser`` drops provider usage, so tokens are estimated from text.
+    """
+
+    def __init__(self, chain, page: str, model: str, name: str):
+        self.chain = chain
+        self.page = page
+        self.model = model
+        self.name = name
+
+    def invoke(self, inputs, **kwargs):
+        with span("langchain", f"{self.name}.invoke", self.page, self.model) as data:
+            data["input_tokens"] = estimate_tokens(json.dumps(inputs, default=str))
+            output = self.chain.invoke(inputs, **kwargs)
+            data["output_tokens"] = estimate_tokens(str(output))
+            return output
+
+    def stream(self, inputs, **kwargs):
+        data = _new_span("langchain", f"{self.name}.stream", self.page, self.model)
+        data["input_tokens"] = estimate_tokens(json.dumps(inputs, default=str))
+        return _traced_stream(self.chain.stream(inputs, **kwargs), data, time.perf_counter(), str)
+
+    def batch(self, inputs, **kwargs):
+        with span("langchain", f"{self.name}.batch", self.page, self.model, batch_size=len(inputs)) as data:
+            data["input_tokens"] = sum(estimate_tokens(json.dumps(i, default=str)) for i in inputs)
+            outputs = self.chain.batch(inputs, **kwargs)
+            data["output_tokens"] = sum(estimate_tokens(o) for o in outputs if isinstance(o, str))
+            return outputs
+
+
+def instrument_chain(chain, page: str, model: str, name: str = "chain") -> TracedChain:
+    return TracedChain(chain, page, model, name)
+
+
+# ── Chroma ───────────────────────────────────────────────────────────────────
+class TracedCollection:
+    """Wraps a Chroma collection so ``query``/``add``/``get``/``count`` are recorded."""
+
+    TRACED = {"query", "add", "upsert", "get", "count", "delete"}
+
+    def __init__(self, collection, page: str):
+        self._collection = collection
+        self._page = page
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in self.TRACED:
+            return attr
+
+        def traced(*args, **kwargs):
+            with span("chroma", name, self._page, None):
+                return attr(*args, **kwargs)
+        return traced
+
+
+def instrument_collection(collection, page: str):
+    if isinstance(collection, TracedCollection):
+        return collection
+    return TracedCollection(collection, page)
+
+
+# ── Reporting ────────────────────────────────────────────────────────────────
+def _quantile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def summarize(spans) -> list[dict]:
+    """Per (page, kind, model) count, p50/p95 seconds, p95 TTFT, tokens, cost and errors."""
+    groups: dict[tuple, list[dict]] = {}
+    for s in spans:
+        groups.setdefault((s["page"], s["kind"], s.get("model") or ""), []).append(s)
+    rows = []
+    for (page, kind, model), items in sorted(groups.items()):
+        seconds = [s["seconds"] for s in items if s["seconds"] is not None]
+        ttfts = [s["ttft"] for s in items if s.get("ttft") is not None]
+        hits = [s["cache_hit"] for s in items if s.get("cache_hit") is not None]
+        rows.append({
+            "page": page, "kind": kind, "model": model, "count": len(items),
+            "p50": round(_quantile(seconds, 0.50), 4), "p95": round(_quantile(seconds, 0.95), 4),
+            "ttft_p95": round(_quantile(ttfts, 0.95), 4) if ttfts else None,
+            "input_tokens": sum(s.get("input_tokens") or 0 for s in items),
+            "output_tokens": sum(s.get("output_tokens") or 0 for s in items),
+            "cost": round(sum(s.get("cost") or 0 for s in items), 6),
+            "cache_hits": sum(hits),
+            "cache_hit_rate": round(sum(hits) / len(hits), 3) if hits else None,
+            "coalesced": sum(1 for s in items if s.get("coalesced")),
+            "errors": sum(1 for s in items if s.get("error")),
+        })
+    return rows
+
+
+def label_value(value) -> str:
+    """``value`` escaped for use inside a quoted Prometheus label."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def add_gauges(lines_fn) -> None:
+    """Append ``lines_fn()`` (Prometheus text lines for live state, e.g. queue depth) to ``/metrics``."""
+    with _lock:
+        if lines_fn not in _gauges:
+            _gauges.append(lines_fn)
+
+
+def snapshot() -> list[dict]:
+    with _lock:
+        return list(_spans)
+
+
+def totals() -> dict[tuple, dict]:
+    """Running totals per (page, kind, model) since the process started."""
+    with _lock:
+        return {key: dict(t) for key, t in _totals.items()}
+
+
+def prometheus_text(spans=None) -> str:
+    """Prometheus exposition format (summaries + counters) for ``spans`` (default: in-memory).
+
+    Quantiles come from the recent spans; counters and the summary's
+    ``_count``/``_sum`` come from running totals, so they never go down when
+    old spans are evicted.
+    """
+    if spans is None:
+        rows, counts = summarize(snapshot()), totals()
+    else:
+        rows, counts = summarize(spans), {}
+        for s in spans:
+            _accumulate(counts, s)
+    quantiles = {(r["page"], r["kind"], r["model"]): r for r in rows}
+    lines = [
+        "# HELP lab_call_seconds Call latency by page, kind and model.",
+        "# TYPE lab_call_seconds summary",
+    ]
+    for key, t in sorted(counts.items()):
+        labels = 'page="{}",kind="{}",model="{}"'.format(*map(label_value, key))
+        r = quantiles.get(key)
+        if r is not None:
+            lines.append(f'lab_call_seconds{{{labels},quantile="0.5"}} {r["p50"]}')
+            lines.append(f'lab_call_seconds{{{labels},quantile="0.95"}} {r["p95"]}')
+        lines.append(f"lab_call_seconds_sum{{{labels}}} {round(t['seconds'], 6)}")
+        lines.append(f"lab_call_seconds_count{{{labels}}} {t['count']}")
+    for metric, key, help_text in (
+        ("lab_input_tokens_total", "input_tokens", "Input tokens (estimated where the API gives none)."),
+        ("lab_output_tokens_total", "output_tokens", "Output tokens (estimated where the API gives none)."),
+        ("lab_cost_usd_total", "cost", "Estimated spend in USD."),
+        ("lab_cache_hits_total", "cache_hits", "Lookups answered from a cache."),
+        ("lab_cache_coalesced_total", "coalesced", "Lookups that waited on another caller's request."),
+        ("lab_errors_total", "errors", "Calls that raised."),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for labels_key, t in sorted(counts.items()):
+            labels = 'page="{}",kind="{}",model="{}"'.format(*map(label_value, labels_key))
+            lines.append(f"{metric}{{{labels}}} {round(t[key], 8) if key == 'cost' else t[key]}")
+    if spans is None:
+        for lines_fn in list(_gauges):
+            lines += lines_fn()
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int | None = None):
+    """Serve ``/metrics`` on 127.0.0.1 (once per process); ``port`` defaults to ``$LAB_METRICS_PORT``."""
+    global _server
+    port = port or int(os.getenv("LAB_METRICS_PORT", "0") or 0)
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        _server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="lab-metrics", daemon=True).start()
+    return _server
+
+
+def load_jsonl(path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize recorded spans.")
+    parser.add_argument("command", choices=["report", "prom"])
+    parser.add_argument("path", nargs="?", default=str(TELEMETRY_DIR / "spans.jsonl"))
+    args = parser.parse_args(argv)
+
+    spans = load_jsonl(args.path)
+    if args.command == "prom":
+        print(prometheus_text(spans), end="")
+        return
+    header = f"{'page':<10} {'kind':<20} {'model':<28} {'n':>5} {'p50':>8} {'p95':>8} {'ttft95':>8} {'tok in':>8} {'tok out':>8} {'$':>9}"
+    print(header)
+    for r in summarize(spans):
+        ttft = f"{r['ttft_p95']:.3f}" if r["ttft_p95"] is not None else "-"
+        print(f"{r['page']:<10} {r['kind']:<20} {r['model'][:28]:<28} {r['count']:>5} {r['p50']:>8.3f} "
+              f"{r['p95']:>8.3f} {ttft:>8} {r['input_tokens']:>8} {r['output_tokens']:>8} {r['cost']:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
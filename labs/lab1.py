@@ -1,12 +1,17 @@
 import streamlit as st
-from openai import OpenAI
-from pypdf import PdfReader
+
+from labs.instrumentation import span
+from labs.routing import complete
+from labs.startup import get_openai_client
 
 def read_pdf(file):
-    reader = PdfReader(file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
+    from pypdf import PdfReader
+
+    with span("pdf", "extract", page="lab1"):
+        reader = PdfReader(file)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text() or ""
     return text
 
 
@@ -17,7 +22,7 @@ def validate_api_key(api_key):
         return
     
     try:
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client(api_key, page="lab1")
         client.models.list()
         st.session_state.api_key_valid = True
         st.success("✅ API key is valid!", icon="✓")
@@ -43,7 +48,7 @@ if not st.session_state.api_key_valid:
     st.info("Please enter a valid OpenAI API key to continue.", icon="🗝️")
     st.stop()
 
-client = OpenAI(api_key=openai_api_key)
+client = get_openai_client(openai_api_key, page="lab1")
 
 uploaded_file = st.file_uploader(
     "Upload a document (.txt or .pdf)", type=("txt", "pdf")
@@ -68,18 +73,20 @@ if uploaded_file and question:
         st.error("Unsupported file type.")
         st.stop()
 
-    messages = [
-        {
-            "role": "user",
-            "content": f"Here is the document:\n\n{document}\n\n---\n\n{question}",
-        }
-    ]
+    def build_messages(document):
+        return [
+            {
+                "role": "user",
+                "content": f"Here is the document:\n\n{document}\n\n---\n\n{question}",
+            }
+        ]
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=messages,
-    )
+    # Pick the cheapest model that fits the document and the question
+    response, decision = complete(client, build_messages, document, task=question, page="lab1")
 
     st.write(response.choices[0].message.content)
+    st.caption(f"Model: {decision['model']} — {decision['reason']}")
+    if decision["truncated"]:
+        st.warning("The document was too long for any model and was truncated.")
 
 
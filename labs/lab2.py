@@ -1,20 +1,24 @@
 import streamlit as st
-from openai import OpenAI
-from PyPDF2 import PdfReader
+
+from labs.instrumentation import span
+from labs.routing import complete
+from labs.startup import get_openai_client
 
 secret_key = st.secrets.OPENAI_API_KEY
 
 def read_pdf(file):
-    reader = PdfReader(file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
+    from PyPDF2 import PdfReader
+
+    with span("pdf", "extract", page="lab2"):
+        reader = PdfReader(file)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text() or ""
     return text
 
 st.title("📄 Lab 2")
 
 openai_api_key = secret_key
-client = OpenAI(api_key=openai_api_key)
 
 uploaded_file = st.file_uploader(
     "Upload a document (.txt or .pdf)", type=("txt", "pdf")
@@ -31,6 +35,7 @@ summary_type = st.sidebar.selectbox(
     ],
 )
 
+# Models are picked automatically by document size and task; this forces the top tier
 use_advanced = st.sidebar.checkbox("Use advanced model")
 
 generate = st.sidebar.button("Generate Summary")
@@ -50,31 +55,30 @@ if uploaded_file and generate:
         st.error("Unsupported file type.")
         st.stop()
 
-    # Choose model based on user selection
-    if use_advanced:
-        model = "gpt-4o"
-    else:
-        model = 'gpt-3.5-turbo'
-
     # Include the summary type explicitly in the LLM instructions
     instruction = (
         f"{summary_type}. Provide the summary only and do not include the original document text."
     )
 
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant that summarizes documents."},
-        {"role": "user", "content": f"{instruction}\n\nDocument:\n\n{document}"},
-    ]
+    def build_messages(document):
+        return [
+            {"role": "system", "content": "You are a helpful assistant that summarizes documents."},
+            {"role": "user", "content": f"{instruction}\n\nDocument:\n\n{document}"},
+        ]
 
     with st.spinner("Generating summary..."):
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
+        client = get_openai_client(openai_api_key, page="lab2")
+        response, decision = complete(
+            client, build_messages, document, task=summary_type, page="lab2",
+            min_quality=3 if use_advanced else 1,
         )
 
     summary = response.choices[0].message.content
 
     st.subheader("Summary")
     st.write(summary)
+    st.caption(f"Model: {decision['model']} — {decision['reason']}")
+    if decision["truncated"]:
+        st.warning("The document was too long for any model and was truncated.")
 
 
@@ -1,9 +1,9 @@
 import streamlit as st
-from openai import OpenAI
+
+from labs.startup import get_openai_client
 
 # Page config
 st.set_page_config(page_title="Lab 3: Streaming Chatbot", initial_sidebar_state="expanded")
-client = OpenAI(api_key=st.secrets.get("OPENAI_API_KEY", ""))
 
 # ===== BIG TITLE =====
 st.title("CHURCH BOT 🤖⛪️")
@@ -191,6 +191,7 @@ if prompt := st.chat_input("Feel free to open up to me"):
     
     # Get and display assistant response
     with st.chat_message("assistant"):
+        client = get_openai_client(st.secrets.get("OPENAI_API_KEY", ""), page="lab3")
         stream = client.chat.completions.create(
             model=model_option,
             messages=buffered_messages,  # Includes system prompt!
@@ -1,20 +1,49 @@
-import PyPDF2
 import streamlit as st
-from openai import OpenAI
-import sys
+import os
 import shutil
+from contextlib import nullcontext
 from pathlib import Path
 
-# Ensure ChromaDB uses a compatible SQLite
-__import__("pysqlite3")
-sys.modules["sqlite3"] = sys.modules["pysqlite3"]
-
-import chromadb
+from labs.instrumentation import instrument_collection, span
+from labs.lab4_context import hits_from_results, pack_context
+from labs.lab4_courses import backfill_courses, course_code, course_filter, route_query
+from labs.lab4_embed import LOCAL_MODEL, embedder_for
+from labs.lab4_index import DB_PATH, EMBED_MODEL, FULL_DIMS, IndexSettings
+from labs.lab4_snapshot import Snapshot, resolve as resolve_snapshot
+from labs.lab4_store import BACKENDS
+from labs.lab4_versions import ChromaCatalog, MemmapCatalog, VersionedStore
+from labs.scheduler import BACKGROUND, priority
+from labs.startup import get_chroma_client, get_openai_client
 
 
 # Page config
 st.set_page_config(page_title="lab 4", initial_sidebar_state="expanded")
-client = OpenAI(api_key=st.secrets.get("OPENAI_API_KEY", ""))
+openai_api_key = st.secrets.get("OPENAI_API_KEY", "")
+
+# Embedder: "openai" (text-embedding-3-small) or "local" (offline feature
+# hashing, no API calls). It is recorded on the collection, so switching rebuilds.
+EMBEDDER = st.secrets.get("LAB4_EMBEDDER", "") or os.getenv("LAB4_EMBEDDER", "openai")
+
+# Vector index settings. Changing the embedder, dimensions, M or ef_construction
+# rebuilds the index; ef_search and int8 quantization apply without re-embedding.
+# int8 is a storage form of the memmap backend, so LAB4_QUANTIZE=int8 selects it.
+# Embeddings keep their full 1536 dimensions unless LAB4_EMBED_DIMS opts into
+# truncation (less memory, lower recall: see `python -m labs.lab4_index report`).
+index_settings = IndexSettings(
+    dims=int(st.secrets.get("LAB4_EMBED_DIMS", "") or os.getenv("LAB4_EMBED_DIMS", FULL_DIMS)),
+    m=int(st.secrets.get("LAB4_HNSW_M", "") or os.getenv("LAB4_HNSW_M", 16)),
+    ef_construction=int(st.secrets.get("LAB4_HNSW_EF_CONSTRUCTION", "") or os.getenv("LAB4_HNSW_EF_CONSTRUCTION", 100)),
+    ef_search=int(st.secrets.get("LAB4_HNSW_EF_SEARCH", "") or os.getenv("LAB4_HNSW_EF_SEARCH", 50)),
+    quantize=st.secrets.get("LAB4_QUANTIZE", "") or os.getenv("LAB4_QUANTIZE", "none"),
+    model=LOCAL_MODEL if EMBEDDER.lower() == "local" else EMBED_MODEL,
+)
+
+# Context packing: retrieve this many candidates, then fill a token budget with
+# the most relevant, least redundant text (MMR_LAMBDA=1 means relevance only).
+# The budget is also capped at the cost of the top 5 chunks verbatim.
+CONTEXT_CANDIDATES = 10
+CONTEXT_BUDGET = int(st.secrets.get("LAB4_CONTEXT_TOKENS", "") or os.getenv("LAB4_CONTEXT_TOKENS", 1500))
+MMR_LAMBDA = 0.7
 
 # ===== BIG TITLE =====
 st.title("Lab 4: Chatbot using RAG")
@@ -46,102 +75,196 @@ def chunk_text(text, chunk_size=1000, overlap=200):
     return chunks
 
 
-# ===== ChromaDB Setup ====
-# Create ChromaDB client with a stable, writable path
-db_path = Path.home() / ".cache" / "lab4_chroma"
-db_path.mkdir(parents=True, exist_ok=True)
-chroma_client = chromadb.PersistentClient(path=str(db_path))
-collection = chroma_client.get_or_create_collection(name="Lab4Collection")
-
-# Create OpenAI client
-if 'openai_client' not in st.session_state:
-    st.session_state.openai_client = OpenAI(api_key=st.secrets.OPENAI_API_KEY)
-
-# Check if collection is already populated (avoid re-embedding)
-try:
-    existing_count = collection.count()
-except Exception:
-    st.sidebar.warning("ChromaDB failed to load existing data. Rebuilding index.")
-    try:
-        chroma_client.delete_collection(name="Lab4Collection")
-    except Exception:
+# ===== Snapshot (read-only) =====
+# With LAB4_SNAPSHOT set, serve a prebuilt snapshot instead of building the
+# Chroma index on this host (see `python -m labs.lab4_snapshot export`)
+SNAPSHOT = st.secrets.get("LAB4_SNAPSHOT", "") or os.getenv("LAB4_SNAPSHOT", "")
+
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot(path: str):
+    # Keyed by the resolved version directory, so a new LATEST is picked up on the next run
+    snapshot = Snapshot(path)
+    return snapshot, snapshot.is_stale()
+
+
+# ===== Vector store backend =====
+# chroma: persisted HNSW index; memmap: exact NumPy search over a memory-mapped
+# matrix (no chromadb import at all). Both live under ~/.cache.
+STORE_BACKEND = (st.secrets.get("LAB4_STORE", "") or os.getenv("LAB4_STORE", "chroma")).lower()
+if STORE_BACKEND not in BACKENDS:
+    st.sidebar.warning(f"Unknown LAB4_STORE {STORE_BACKEND!r}; using chroma.")
+    STORE_BACKEND = "chroma"
+if index_settings.quantize == "int8" and STORE_BACKEND != "memmap":
+    st.sidebar.info("LAB4_QUANTIZE=int8 keeps int8 codes in the memmap store; using it instead of chroma.")
+    STORE_BACKEND = "memmap"
+STORE_PATHS = {"chroma": DB_PATH, "memmap": DB_PATH.parent / "lab4_memmap"}
+db_path = STORE_PATHS[STORE_BACKEND]
+
+
+# Every rebuild goes into a new versioned collection; sessions query whichever
+# version the ACTIVE pointer names, so a rebuild never serves a half-built index
+@st.cache_resource(show_spinner=False)
+def get_versions(backend: str, quantize: str = "none", rescore: int = 4):
+    root = STORE_PATHS[backend]
+    if backend == "memmap":
+        return VersionedStore(MemmapCatalog(root, quantize=quantize, rescore=rescore), root)
+    return VersionedStore(ChromaCatalog(get_chroma_client(str(root))), root)
+
+
+@st.cache_resource(show_spinner=False)
+def get_version_store(backend: str, version: str, quantize: str = "none", rescore: int = 4):
+    return get_versions(backend, quantize, rescore).catalog.open(version)
+
+
+snapshot = None
+versions = None
+active_version = None
+if SNAPSHOT:
+    snapshot, snapshot_stale = get_snapshot(str(resolve_snapshot(SNAPSHOT)))
+    collection = snapshot
+    index_settings = snapshot.settings()   # questions must be embedded the way the snapshot was
+    if snapshot_stale:
+        st.sidebar.warning(f"Snapshot {snapshot.version} was built from different PDFs than lab4_data.")
+else:
+    # ===== Vector store setup ====
+    # Open the active version at a stable, writable path (once per server process)
+    db_path.mkdir(parents=True, exist_ok=True)
+    versions = get_versions(STORE_BACKEND, index_settings.quantize, index_settings.rescore)
+    active_version = versions.active()
+
+    # Check if the active version is populated (avoid re-embedding)
+    collection, existing_count = None, 0
+    if active_version:
         try:
-            shutil.rmtree(db_path, ignore_errors=True)
+            collection = get_version_store(STORE_BACKEND, active_version,
+                                           index_settings.quantize, index_settings.rescore)
+            existing_count = collection.count()
         except Exception:
-            pass
-
-    chroma_client = chromadb.PersistentClient(path=str(db_path))
-    collection = chroma_client.get_or_create_collection(name="Lab4Collection")
-    existing_count = 0
-
-# Define the path to PDF files relative to this file
-pdf_folder = Path(__file__).parent / "lab4_data"
-pdf_files = list(pdf_folder.glob("*.pdf")) if pdf_folder.exists() else []
-
-# Rebuild if the persisted DB is missing PDFs
-if existing_count < len(pdf_files):
-    try:
-        chroma_client.delete_collection(name="Lab4Collection")
-    except Exception:
-        shutil.rmtree(db_path, ignore_errors=True)
-
-    chroma_client = chromadb.PersistentClient(path=str(db_path))
-    collection = chroma_client.get_or_create_collection(name="Lab4Collection")
-    existing_count = 0
-
-if existing_count == 0:
-    if pdf_folder.exists() and pdf_folder.is_dir():
-        st.sidebar.info("Processing PDFs with chunking...")
-        
-        # Process each PDF file WITH CHUNKING
-        for pdf_file in pdf_files:
+            st.sidebar.warning("The vector store failed to load existing data. Rebuilding index.")
+            get_version_store.clear()
+            collection, existing_count = None, 0
+
+    # Define the path to PDF files relative to this file
+    pdf_folder = Path(__file__).parent / "lab4_data"
+    pdf_files = list(pdf_folder.glob("*.pdf")) if pdf_folder.exists() else []
+
+    # Rebuild if there is no usable version, it is missing PDFs or was built with other index settings
+    if collection is None or existing_count < len(pdf_files) or index_settings.needs_rebuild(collection.metadata):
+        build = versions.begin(index_settings.collection_metadata())
+        if build is None:
+            # Another session (or server process) is rebuilding; keep serving what is active
+            if collection is None:
+                st.info("The course index is being built in another session. Try again in a minute.")
+                st.stop()
+            st.sidebar.info("A rebuilt index is on its way; answering from the current one meanwhile.")
+        else:
+            import PyPDF2
+
+            version, new_store = build
+            embedder = embedder_for(index_settings, lambda: get_openai_client(openai_api_key, page="lab4"))
+            target = instrument_collection(new_store, page="lab4")
+            expected = {}   # chunks ingested per PDF, checked before the switch
             try:
-                # Read PDF and extract text
-                st.sidebar.info(f"Processing {pdf_file.name}...")
-                pdf_reader = PyPDF2.PdfReader(str(pdf_file))
-                text_content = ""
-                
-                # Extract text from all pages
-                for page in pdf_reader.pages:
-                    text_content += page.extract_text() + "\n"
+                if pdf_folder.exists() and pdf_folder.is_dir():
+                    st.sidebar.info("Processing PDFs with chunking...")
+        
+                    # Process each PDF file WITH CHUNKING
+                    for pdf_file in pdf_files:
+                        try:
+                            # Read PDF and extract text
+                            st.sidebar.info(f"Processing {pdf_file.name}...")
+                            with span("pdf", "extract", page="lab4"):
+                                pdf_reader = PyPDF2.PdfReader(str(pdf_file))
+                                text_content = ""
+                    
+                                # Extract text from all pages
+                                for page in pdf_reader.pages:
+                                    text_content += page.extract_text() + "\n"
                 
-                # CHUNK THE TEXT
-                if text_content.strip():
-                    chunks = chunk_text(text_content, chunk_size=1000, overlap=200)
-                    st.sidebar.info(f"  → Split into {len(chunks)} chunks")
+                            # CHUNK THE TEXT
+                            if text_content.strip():
+                                chunks = chunk_text(text_content, chunk_size=1000, overlap=200)
+                                st.sidebar.info(f"  → Split into {len(chunks)} chunks")
                     
-                    # Add each chunk to the collection
-                    for i, chunk in enumerate(chunks):
-                        # Create embedding for this chunk
-                        embedding = st.session_state.openai_client.embeddings.create(
-                            input=chunk,
-                            model="text-embedding-3-small"
-                        ).data[0].embedding
-                        
-                        # Add to ChromaDB collection with unique ID per chunk
-                        collection.add(
-                            documents=[chunk],
-                            embeddings=[embedding],
-                            ids=[f"{pdf_file.name}_chunk_{i}"],
-                            metadatas=[{
-                                "filename": pdf_file.name,
-                                "chunk_index": i,
-                                "total_chunks": len(chunks)
-                            }]
-                        )
+                                # Embed all chunks in one batched call and add them together;
+                                # ingestion queues behind any session's chat calls
+                                with priority(BACKGROUND):
+                                    embeddings = embedder.embed(chunks)
+                                target.add(
+                                    documents=chunks,
+                                    embeddings=embeddings,
+                                    ids=[f"{pdf_file.name}_chunk_{i}" for i in range(len(chunks))],
+                                    metadatas=[{
+                                        "filename": pdf_file.name,
+                                        "course": course_code(pdf_file.name),
+                                        "chunk_index": i,
+                                        "total_chunks": len(chunks)
+                                    } for i in range(len(chunks))]
+                                )
                     
-                    st.sidebar.success(f"✅ Loaded: {pdf_file.name} ({len(chunks)} chunks)")
+                                expected[pdf_file.name] = len(chunks)
+                                st.sidebar.success(f"✅ Loaded: {pdf_file.name} ({len(chunks)} chunks)")
+                            else:
+                                expected[pdf_file.name] = 0
+                                st.sidebar.warning(f"No extractable text in {pdf_file.name}; skipped.")
                     
+                        except Exception as e:
+                            # A partial index must never go live: abandon the whole build
+                            raise RuntimeError(f"Error loading {pdf_file.name}: {e}") from e
+
+                # Never replace a working index with an empty or incomplete one
+                versions.validate(new_store, expected=expected, min_count=1 if pdf_files else 0,
+                                  metadata=index_settings.collection_metadata())
             except Exception as e:
-                st.sidebar.error(f"Error loading {pdf_file.name}: {str(e)}")
+                versions.abort(version)
+                st.sidebar.error(f"Rebuilt index was discarded: {e}")
+                if collection is None:
+                    st.stop()
+            except BaseException:
+                versions.abort(version)   # the script was stopped mid-ingest
+                raise
+            else:
+                versions.commit(version)
+                active_version = version
+                collection = get_version_store(STORE_BACKEND, version,
+                                               index_settings.quantize, index_settings.rescore)
+    elif not collection.set_search_ef(index_settings.ef_search):
+        st.sidebar.warning(f"Couldn't apply ef_search={index_settings.ef_search}; searching with the stored value.")
+
+    # Still serving an older version (rebuild elsewhere or failed validation):
+    # questions must be embedded the way that version was
+    if index_settings.needs_rebuild(collection.metadata):
+        index_settings = IndexSettings.from_metadata(
+            collection.metadata, quantize=index_settings.quantize, rescore=index_settings.rescore
+        )
+
+    # Drop retired versions once their grace period has passed
+    versions.maybe_collect()
 
 
 # Store collection in session state
-st.session_state.Lab4_VectorDB = collection
+st.session_state.Lab4_VectorDB = instrument_collection(collection, page="lab4")
+chunk_count = st.session_state.Lab4_VectorDB.count()
+
+
+# Courses in the index, for routing questions that name one
+@st.cache_resource(show_spinner=False)
+def get_known_courses(_collection, collection_id: str, count: int) -> set[str]:
+    # Also tags chunks indexed before routing existed (metadata only, no re-embedding)
+    return backfill_courses(_collection)
+
+
+known_courses = get_known_courses(st.session_state.Lab4_VectorDB, str(collection.id), chunk_count)
 
 st.sidebar.write(
-    f"📚 Chunks in database: {st.session_state.Lab4_VectorDB.count()}"
+    f"📚 Chunks in database: {chunk_count}"
 )
+st.sidebar.caption(f"📐 {index_settings.describe()}")
+if snapshot is not None:
+    st.sidebar.caption(f"📦 Snapshot {snapshot.version} (read-only)")
+else:
+    st.sidebar.caption(f"🗄️ Store: {STORE_BACKEND} · version {active_version}")
 
 # Initialize chat history
 if "messages" not in st.session_state:
@@ -162,26 +285,33 @@ if prompt := st.chat_input("Ask me anything about IST courses"):
     
     # ALWAYS QUERY THE VECTOR DATABASE FIRST
     # Step 1: Create embedding for user's question
-    query_embedding = st.session_state.openai_client.embeddings.create(
-        input=prompt,
-        model="text-embedding-3-small"
-    ).data[0].embedding
+    client = get_openai_client(openai_api_key, page="lab4")
+    query_embedding = embedder_for(index_settings, lambda: client).embed([prompt])[0]
     
-    # Step 2: Search the vector database for relevant chunks
-    results = st.session_state.Lab4_VectorDB.query(
-        query_embeddings=[query_embedding],
-        n_results=5  # Get top 5 most relevant chunks
-    )
-    
-    # Step 3: Extract the relevant context
-    relevant_docs = results.get("documents", [[]])[0]
-    context = "\n\n---\n\n".join(relevant_docs) if relevant_docs else ""
+    # Step 2: Search the vector database for relevant chunks, only within the
+    # named course(s) when the question mentions any; otherwise search everything
+    def search(where):
+        return st.session_state.Lab4_VectorDB.query(
+            query_embeddings=[query_embedding],
+            n_results=CONTEXT_CANDIDATES,
+            where=where,
+            include=["documents", "metadatas", "distances", "embeddings"]
+        )
+
+    # Hold the version being queried so a concurrent rebuild can't garbage-collect it mid-search
+    with versions.lease(active_version) if versions is not None else nullcontext():
+        routed_courses = route_query(prompt, known_courses)
+        results = search(course_filter(routed_courses))
+        if routed_courses and not results["ids"][0]:
+            routed_courses = []
+            results = search(None)
     
-    # Get unique filenames from chunks
-    filenames = set()
-    for metadata in results.get("metadatas", [[]])[0]:
-        filenames.add(metadata.get("filename", "Unknown"))
-    files_used = ", ".join(sorted(filenames))
+    # Step 3: Pack the relevant context into the token budget, merging
+    # neighbouring chunks and skipping redundant ones
+    packed = pack_context(query_embedding, hits_from_results(results), budget_tokens=CONTEXT_BUDGET,
+                          lambda_=MMR_LAMBDA)
+    context = packed["context"]
+    files_used = ", ".join(sorted(packed["files"]))
     
     # Step 4: Create system prompt that handles BOTH cases
     system_prompt = """You are an IST course information assistant with access to course syllabus documents.
@@ -231,14 +361,26 @@ Instructions:
     # Save assistant response
     st.session_state.messages.append({"role": "assistant", "content": response})
     
-    # Store results for sidebar display
-    st.session_state.last_results = results
+    # Store the packed selection (not the raw candidates and their vectors) for sidebar display
+    st.session_state.last_results = {
+        "metadatas": [[hit["metadata"] for hit in packed["selected"]]],
+        "tokens": packed["tokens"],
+        "naive_tokens": packed["naive_tokens"],
+        "saved_tokens": packed["saved_tokens"],
+        "courses": routed_courses,
+    }
 
 # Sidebar to show retrieved chunks
 if st.sidebar.checkbox("Show retrieved chunks"):
     if hasattr(st.session_state, 'last_results') and st.session_state.last_results:
         results = st.session_state.last_results
         st.sidebar.write("### Retrieved Chunks:")
+        st.sidebar.caption(
+            f"Context: ~{results['tokens']} tokens (top 5 verbatim: ~{results['naive_tokens']}, "
+            f"saved ~{results.get('saved_tokens', 0)})"
+        )
+        routed = results.get("courses")
+        st.sidebar.caption(f"🎯 Searched only {', '.join(routed)}" if routed else "🌐 Searched all courses")
         
         for i, metadata in enumerate(results["metadatas"][0], 1):
             filename = metadata.get("filename", "Unknown")
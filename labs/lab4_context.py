@@ -0,0 +1,125 @@
+"""
+Context assembly for lab 4.
+
+Retrieval returns more candidates than fit in the prompt. This stage:
+
+1. orders them with maximal marginal relevance (MMR), so a near-duplicate of
+   an already chosen chunk ranks below a chunk that adds something new;
+2. takes them in that order while the assembled context stays within a token
+   budget, capped at what the top ``naive_k`` hits would cost verbatim, so
+   packing never sends more context than plain top-k retrieval did;
+3. merges chunks that are neighbours in the same file (by ``chunk_index``)
+   and drops the text they share. ``chunk_text`` overlaps neighbours by 200
+   characters, so without this step every adjacent pair pays for that text
+   twice.
+
+    packed = pack_context(query_embedding, hits_from_results(results), budget_tokens=1500)
+    packed["context"], packed["selected"], packed["tokens"], packed["naive_tokens"], packed["saved_tokens"]
+"""
+
+import numpy as np
+
+from labs.instrumentation import estimate_tokens
+
+SEPARATOR = "\n\n---\n\n"
+GAP = " […] "
+
+
+def hits_from_results(results: dict) -> list[dict]:
+    """Flatten a Chroma-style ``query`` result (one query) into a list of hits, best first."""
+    ids = results.get("ids", [[]])[0]
+    documents = results.get("documents", [[]])[0]
+    metadatas = results.get("metadatas", [[]])[0]
+    distances = (results.get("distances") or [[None] * len(ids)])[0]
+    embeddings = results.get("embeddings")
+    embeddings = embeddings[0] if embeddings is not None else [None] * len(ids)
+    return [
+        {"id": i, "document": doc, "metadata": meta or {}, "distance": dist, "embedding": emb}
+        for i, doc, meta, dist, emb in zip(ids, documents, metadatas, distances, embeddings)
+    ]
+
+
+def mmr_order(query_embedding, hits: list[dict], lambda_: float = 0.7) -> list[dict]:
+    """Hits reordered by maximal marginal relevance; unchanged if any embedding is missing."""
+    if len(hits) < 2 or any(h["embedding"] is None for h in hits):
+        return list(hits)
+    vectors = np.array([h["embedding"] for h in hits], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.array(query_embedding, dtype=np.float32)
+    query /= max(np.linalg.norm(query), 1e-12)
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    remaining = list(range(len(hits)))
+    chosen = []
+    redundancy = np.zeros(len(hits), dtype=np.float32)
+    while remaining:
+        scores = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy[remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        chosen.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return [hits[i] for i in chosen]
+
+
+def merge_overlap(left: str, right: str, max_overlap: int = 400, min_overlap: int = 20) -> str:
+    """Join two consecutive chunks, keeping the text they share only once."""
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + " " + right
+
+
+def _file_block(filename: str, hits: list[dict]) -> str:
+    """One file's selected chunks in document order, neighbours merged and gaps marked."""
+    hits = sorted(hits, key=lambda h: h["metadata"].get("chunk_index", 0))
+    text, previous = "", None
+    for hit in hits:
+        index = hit["metadata"].get("chunk_index", 0)
+        if previous is None:
+            text = hit["document"]
+        elif index == previous + 1:
+            text = merge_overlap(text, hit["document"])
+        else:
+            text += GAP + hit["document"]
+        previous = index
+    return f"[{filename}]\n{text}"
+
+
+def _assemble(groups: dict[str, list[dict]]) -> str:
+    return SEPARATOR.join(_file_block(name, hits) for name, hits in groups.items())
+
+
+def pack_context(query_embedding, hits: list[dict], budget_tokens: int = 1500, lambda_: float = 0.7,
+                 naive_k: int = 5) -> dict:
+    """Fill ``budget_tokens`` with the most useful, least redundant retrieved text.
+
+    The budget is capped at what joining the top ``naive_k`` hits verbatim
+    would cost. Returns the context string, the selected hits (in MMR order)
+    and its token estimate, plus that naive cost, ``saved_tokens`` (naive
+    minus packed) and ``coverage``: the share of those top hits that made it
+    into the context.
+    """
+    naive_tokens = estimate_tokens(SEPARATOR.join(h["document"] for h in hits[:naive_k]))
+    budget_tokens = min(budget_tokens, naive_tokens)
+    groups: dict[str, list[dict]] = {}   # insertion order = order each file was first picked
+    selected = []
+    tokens = 0
+    for hit in mmr_order(query_embedding, hits, lambda_):
+        filename = hit["metadata"].get("filename", "Unknown")
+        trial = {**groups, filename: groups.get(filename, []) + [hit]}
+        trial_tokens = estimate_tokens(_assemble(trial))
+        if trial_tokens > budget_tokens:
+            continue   # a smaller or adjacent chunk further down may still fit
+        groups, tokens = trial, trial_tokens
+        selected.append(hit)
+    top_ids = [h["id"] for h in hits[:naive_k]]
+    picked = {h["id"] for h in selected}
+    return {
+        "context": _assemble(groups),
+        "selected": selected,
+        "files": list(groups),
+        "tokens": tokens,
+        "naive_tokens": naive_tokens,
+        "saved_tokens": naive_tokens - tokens,
+        "coverage": sum(i in picked for i in top_ids) / len(top_ids) if top_ids else 1.0,
+    }
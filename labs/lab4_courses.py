@@ -0,0 +1,82 @@
+"""
+Course-code routing for lab 4.
+
+Every chunk carries a ``course`` metadata field (e.g. ``"IST 418"``) taken
+from its PDF's filename at ingest. A question that names one or more indexed
+courses is searched with a Chroma ``where`` filter on that field, so only
+those syllabi are scored. Questions that name no known course fall back to
+searching everything.
+
+    course_code("IST 418 Syllabus - Big Data Analytics.pdf")   # "IST 418"
+    route_query("Compare IST 418 and 488 grading", known)       # ["IST 418", "IST 488"]
+    course_filter(["IST 418", "IST 488"])                       # {"course": {"$in": [...]}}
+"""
+
+import re
+
+# "IST 418", "ist418", "IST-418", optionally followed by more numbers
+# sharing the prefix: "IST 418 and 488", "IST 256/314"
+CODE_PATTERN = re.compile(
+    r"\b([A-Za-z]{2,4})[\s-]?(\d{3})\b((?:\s*(?:,|/|&|\band\b|\bor\b|\bvs\.?)\s*\d{3}\b)*)"
+)
+
+
+def canonical(prefix: str, number: str) -> str:
+    return f"{prefix.upper()} {number}"
+
+
+def course_code(filename: str) -> str:
+    """Course code at the start of a syllabus filename, or ``""`` if there isn't one."""
+    match = CODE_PATTERN.match(filename.strip())
+    return canonical(match.group(1), match.group(2)) if match else ""
+
+
+def course_codes(text: str) -> list[str]:
+    """Every course code mentioned in ``text``, in order, without duplicates."""
+    codes = []
+    for prefix, number, more in CODE_PATTERN.findall(text):
+        for n in [number, *re.findall(r"\d{3}", more)]:
+            code = canonical(prefix, n)
+            if code not in codes:
+                codes.append(code)
+    return codes
+
+
+def route_query(text: str, known: set[str]) -> list[str]:
+    """Indexed courses named in ``text``; empty means search everything.
+
+    Only codes that exist in the index count, so phrases like "top 100"
+    don't route anywhere.
+    """
+    return [code for code in course_codes(text) if code in known]
+
+
+def course_filter(codes: list[str]) -> dict | None:
+    """Chroma ``where`` clause restricting a query to ``codes`` (``None`` = no filter)."""
+    if not codes:
+        return None
+    if len(codes) == 1:
+        return {"course": codes[0]}
+    return {"course": {"$in": codes}}
+
+
+def backfill_courses(collection, batch_size: int = 5000) -> set[str]:
+    """Add ``course`` to chunks indexed before it existed; returns every course in the collection."""
+    known = set()
+    offset = 0
+    while True:
+        batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return known
+        missing_ids, missing_meta = [], []
+        for chunk_id, meta in zip(batch["ids"], batch["metadatas"]):
+            meta = meta or {}
+            if "course" not in meta:
+                meta = {**meta, "course": course_code(meta.get("filename", ""))}
+                missing_ids.append(chunk_id)
+                missing_meta.append(meta)
+            if meta["course"]:
+                known.add(meta["course"])
+        if missing_ids:
+            collection.update(ids=missing_ids, metadatas=missing_meta)
+        offset += len(batch["ids"])
@@ -0,0 +1,100 @@
+"""
+Embedders for lab 4.
+
+An embedder turns a batch of texts into one vector per text. Which one a
+collection uses is recorded in its ``embed_model`` metadata (via
+``IndexSettings.model``), so questions are always embedded the same way as
+the stored chunks, and switching embedders rebuilds the index.
+
+- ``OpenAIEmbedder``: ``text-embedding-3-*`` over the network (the default);
+- ``HashingEmbedder`` (``local-hash-v2``): fully offline. The n-gram counts
+  of ``labs.hashing`` (shared with lab 9's memory index) are weighted by
+  sublinear term frequency and hashed with a random sign into ``dims``
+  buckets. That is a sparse random projection of the bag-of-n-grams vector,
+  computed without ever building it. No model files and no network, so
+  ingest and CI runs cost microseconds per chunk.
+
+    embedder = embedder_for(settings, lambda: get_openai_client(api_key, page="lab4"))
+    vectors = embedder.embed(chunks)     # float32 array, one row per text
+"""
+
+import math
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from labs.hashing import bucket, ngram_counts
+from labs.lab4_index import IndexSettings, embed, normalize_rows
+
+# v2: features from labs.hashing; the version bump rebuilds v1 collections
+LOCAL_MODEL = "local-hash-v2"
+
+
+class Embedder(ABC):
+    """Turns texts into vectors; ``model`` and ``dims`` are what gets recorded on the collection."""
+
+    model: str
+    dims: int
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> np.ndarray: ...
+
+
+class OpenAIEmbedder(Embedder):
+    """``labs.lab4_index.embed`` behind the embedder interface."""
+
+    def __init__(self, client, settings: IndexSettings, batch_size: int = 256):
+        self.client = client
+        self.settings = settings
+        self.model = settings.model
+        self.dims = settings.dims
+        self.batch_size = batch_size
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(embed(self.client, texts, self.settings, self.batch_size), dtype=np.float32)
+
+
+class HashingEmbedder(Embedder):
+    """Offline embeddings from signed feature hashing of sublinear-TF n-grams."""
+
+    model = LOCAL_MODEL
+
+    def __init__(self, dims: int = 512, batch_size: int = 1024):
+        self.dims = dims
+        self.batch_size = batch_size
+
+    def _batch(self, texts: list[str]) -> np.ndarray:
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            for feature, count in ngram_counts(text).items():
+                col, sign = bucket(feature, self.dims)
+                rows.append(row)
+                cols.append(col)
+                values.append(sign * (1.0 + math.log(count)))
+        matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+        np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)),
+                  np.array(values, dtype=np.float32))
+        return normalize_rows(matrix)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dims), dtype=np.float32)
+        return np.concatenate([self._batch(texts[i:i + self.batch_size])
+                               for i in range(0, len(texts), self.batch_size)])
+
+
+def is_local(model: str) -> bool:
+    return model.startswith("local-")
+
+
+def embedder_for(settings: IndexSettings, openai_client=None) -> Embedder:
+    """The embedder a collection with these settings was built with.
+
+    ``openai_client`` is a zero-argument callable, only called for network
+    models, so offline runs never need an API key.
+    """
+    if settings.model == LOCAL_MODEL:
+        return HashingEmbedder(settings.dims)
+    if is_local(settings.model):
+        raise ValueError(f"unknown local embedder {settings.model!r}")
+    return OpenAIEmbedder(openai_client(), settings)
@@ -0,0 +1,322 @@
+"""
+Index and embedding settings for lab 4's ``Lab4Collection``.
+
+Everything that trades memory for recall lives here:
+
+- HNSW parameters (``M``, ``ef_construction``, ``ef_search``), passed to
+  Chroma as collection metadata;
+- reduced-dimension embeddings through the ``dimensions`` option of the
+  ``text-embedding-3`` models (the API truncates and renormalizes the vector);
+- int8 storage, served by the memmap store (``LAB4_QUANTIZE=int8`` selects
+  it). Vectors are scalar-quantized into a compact in-memory matrix and the
+  top ``k × rescore`` candidates are found there. Those candidates are then
+  re-scored against the float32 vectors, which stay on disk.
+
+The settings in force are stored on the collection. Changing anything that
+affects the stored vectors rebuilds the index. To see what a setting costs:
+
+    python -m labs.lab4_index report                    # vectors from the persisted collection
+    python -m labs.lab4_index report --synthetic 20000  # synthetic corpus, no API key needed
+"""
+
+import argparse
+import json
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+EMBED_MODEL = "text-embedding-3-small"
+FULL_DIMS = 1536
+COLLECTION = "Lab4Collection"
+DB_PATH = Path.home() / ".cache" / "lab4_chroma"
+
+
+class IndexSettings:
+    """How ``Lab4Collection`` is built and searched."""
+
+    # Changing any of these means the stored vectors/graph are stale
+    REBUILD_KEYS = ("embed_model", "embed_dims", "hnsw:space", "hnsw:M", "hnsw:construction_ef")
+
+    def __init__(self, dims: int = FULL_DIMS, m: int = 16, ef_construction: int = 100, ef_search: int = 50,
+                 quantize: str = "none", rescore: int = 4, model: str = EMBED_MODEL):
+        if quantize not in ("none", "int8"):
+            raise ValueError(f"quantize must be 'none' or 'int8', not {quantize!r}")
+        if not 0 < dims <= FULL_DIMS:
+            raise ValueError(f"dims must be between 1 and {FULL_DIMS}")
+        self.dims = dims
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.quantize = quantize
+        self.rescore = rescore
+        self.model = model
+
+    @classmethod
+    def from_metadata(cls, metadata: dict, **overrides) -> "IndexSettings":
+        """Settings a collection was built with, read back from its metadata."""
+        settings = {
+            "dims": metadata.get("embed_dims", FULL_DIMS),
+            "m": metadata.get("hnsw:M", 16),
+            "ef_construction": metadata.get("hnsw:construction_ef", 100),
+            "ef_search": metadata.get("hnsw:search_ef", 50),
+            "model": metadata.get("embed_model", EMBED_MODEL),
+        }
+        return cls(**{**settings, **overrides})
+
+    def collection_metadata(self) -> dict:
+        return {
+            "hnsw:space": "cosine",
+            "hnsw:M": self.m,
+            "hnsw:construction_ef": self.ef_construction,
+            "hnsw:search_ef": self.ef_search,
+            "embed_model": self.model,
+            "embed_dims": self.dims,
+        }
+
+    def needs_rebuild(self, metadata: dict | None) -> bool:
+        want = self.collection_metadata()
+        # Setting ef_search through metadata drops "hnsw:space"; lab 4 only ever builds cosine indexes
+        have = {"hnsw:space": "cosine", **(metadata or {})}
+        return any(have.get(key) != want[key] for key in self.REBUILD_KEYS)
+
+    def describe(self) -> str:
+        quant = f"int8 ×{self.rescore} rescore" if self.quantize == "int8" else "float32"
+        return f"{self.model} · {self.dims} dims · {quant} · M={self.m} · ef_c={self.ef_construction} · ef_s={self.ef_search}"
+
+
+# ef_search already applied per collection id in this process, so reruns don't call modify again
+_search_ef_applied: dict[str, int] = {}
+
+
+def apply_search_ef(collection, ef_search: int) -> bool:
+    """Change ``ef_search`` in place; it only affects queries, so no rebuild is needed.
+
+    Chroma 1.x takes it as configuration. Older versions only read metadata,
+    which is tried as a fallback without ``hnsw:space`` (Chroma refuses to see
+    the distance function again, even unchanged). Returns whether the setting
+    is in force, and warns if Chroma refused it.
+    """
+    key = str(collection.id)
+    if _search_ef_applied.get(key) == ef_search:
+        return True
+    metadata = dict(collection.metadata or {})
+    try:
+        current = ((collection.configuration or {}).get("hnsw") or {}).get("ef_search")
+    except Exception:
+        current = None
+    if (metadata.get("hnsw:search_ef") if current is None else current) == ef_search:
+        _search_ef_applied[key] = ef_search
+        return True
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+    except Exception:
+        metadata = {k: v for k, v in metadata.items() if k != "hnsw:space"}
+        try:
+            collection.modify(metadata={**metadata, "hnsw:search_ef": ef_search})
+        except Exception as e:
+            warnings.warn(f"could not set ef_search={ef_search} on {collection.name}: {e}", stacklevel=2)
+            return False
+    _search_ef_applied[key] = ef_search
+    return True
+
+
+def embed(client, texts: list[str], settings: IndexSettings, batch_size: int = 256) -> list[list[float]]:
+    """Embed ``texts`` in batches at ``settings.dims`` dimensions."""
+    kwargs = {"model": settings.model}
+    if settings.dims < FULL_DIMS:
+        kwargs["dimensions"] = settings.dims
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        response = client.embeddings.create(input=texts[i:i + batch_size], **kwargs)
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return vectors
+
+
+# ── int8 quantization ────────────────────────────────────────────────────────
+def normalize_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 codes and scales, so ``vector ≈ codes * scale``."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+INT8_BLOCK = 8192   # rows dequantized at a time, bounds per-query scratch memory
+
+
+def int8_search(codes: np.ndarray, scales: np.ndarray, full: np.ndarray, query, k: int = 5, rescore: int = 4,
+                rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Top ``k`` row numbers and cosine similarities for ``query``, optionally only among ``rows``.
+
+    The top ``k × rescore`` candidates are picked from the int8 ``codes``;
+    only those rows of ``full`` (usually a memmap) are read for exact scores.
+    """
+    n = len(codes) if rows is None else len(rows)
+    if not n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    q = normalize_rows(query)
+    approx = np.empty(n, dtype=np.float32)
+    for start in range(0, n, INT8_BLOCK):
+        block = codes[start:start + INT8_BLOCK] if rows is None else codes[rows[start:start + INT8_BLOCK]]
+        approx[start:start + len(block)] = block.astype(np.float32) @ q
+    approx *= scales if rows is None else scales[rows]
+
+    n_candidates = min(n, max(k, k * rescore))
+    candidates = np.argpartition(-approx, n_candidates - 1)[:n_candidates]
+    if rows is not None:
+        candidates = rows[candidates]
+    candidates.sort()   # sequential reads from the memmap
+    exact = np.asarray(full[candidates]) @ q
+    order = np.argsort(-exact)[:k]
+    return candidates[order], exact[order]
+
+
+# ── Memory / recall report ───────────────────────────────────────────────────
+def memory_estimate(n: int, dims: int, m: int = 16, quantize: str = "none") -> dict:
+    """Approximate bytes for ``n`` vectors as lab 4 runs them (HNSW graph ≈ 2·M 4-byte links per node).
+
+    int8 is served by the memmap store, which has no graph: only the codes
+    stay resident, and the float32 file on disk is paged in for the few
+    re-scored rows.
+    """
+    vectors = n * dims * 4
+    if quantize == "int8":
+        codes = n * (dims + 4)
+        return {"resident": codes, "disk": vectors + codes, "graph": 0, "int8": codes}
+    graph = n * (2 * m * 4 + 16)
+    return {"resident": vectors + graph, "disk": vectors, "graph": graph, "int8": 0}
+
+
+def truncate(vectors: np.ndarray, dims: int) -> np.ndarray:
+    """What the ``dimensions`` option returns: the leading ``dims`` components, renormalized."""
+    return normalize_rows(vectors[:, :dims])
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def synthetic_vectors(n: int, dims: int = FULL_DIMS, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors with decaying per-dimension variance.
+
+    Only a rough stand-in: real ``text-embedding-3`` vectors pack more of
+    their signal into the leading dimensions, so truncation costs less recall
+    on a real corpus than on this one.
+    """
+    rng = np.random.default_rng(seed)
+    decay = 1.0 / np.sqrt(1.0 + np.arange(dims) / 64)
+    centers = rng.normal(size=(clusters, dims)) * decay
+    labels = rng.integers(0, clusters, size=n)
+    return normalize_rows(centers[labels] + 0.6 * rng.normal(size=(n, dims)) * decay)
+
+
+def collection_vectors(db_path=DB_PATH, name: str = COLLECTION) -> np.ndarray:
+    """Stored vectors of the version lab 4 is serving (or of ``name`` if nothing is versioned yet)."""
+    from labs.lab4_versions import ChromaCatalog, VersionedStore
+    from labs.startup import use_pysqlite3
+
+    use_pysqlite3()
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(db_path))
+    active = VersionedStore(ChromaCatalog(client, name), db_path).active()
+    collection = client.get_collection(f"{name}-{active}" if active else name)
+    return normalize_rows(collection.get(include=["embeddings"])["embeddings"])
+
+
+def tradeoff_report(vectors: np.ndarray, dims_options=(1536, 1024, 768, 512, 256), k: int = 5,
+                    n_queries: int = 200, rescore: int = 4, hnsw_grid=((8, 32), (16, 50), (16, 100), (32, 100)),
+                    scale: int = 10, seed: int = 0) -> list[dict]:
+    """Recall@k against exact full-dimension search, query time and memory for each setting.
+
+    Queries are perturbed copies of stored vectors. ``scale`` projects the
+    memory figures to ``scale``× the current corpus size.
+    """
+    rng = np.random.default_rng(seed)
+    n, stored_dims = vectors.shape
+    k = min(k, n)
+    picks = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = normalize_rows(vectors[picks] + 0.05 * rng.normal(size=(len(picks), stored_dims)))
+    truth = exact_top_k(vectors, queries, k)
+
+    rows = []
+
+    def row(setting, dims, found, seconds, m=16, quantize="none"):
+        memory = memory_estimate(n * scale, dims, m, quantize)
+        rows.append({
+            "setting": setting, "dims": dims, "recall": round(recall(found, truth), 4),
+            "ms_per_query": round(1000 * seconds / len(queries), 3),
+            "resident_mb": round(memory["resident"] / 2**20, 1), "disk_mb": round(memory["disk"] / 2**20, 1),
+        })
+
+    for dims in [d for d in dims_options if d <= stored_dims]:
+        reduced, q = truncate(vectors, dims), truncate(queries, dims)
+        start = time.perf_counter()
+        found = np.vstack([exact_top_k(reduced, v[None, :], k) for v in q])
+        row("exact float32", dims, found, time.perf_counter() - start)
+
+        codes, scales = quantize_int8(reduced)
+        for factor in (1, rescore):
+            start = time.perf_counter()
+            found = np.array([int8_search(codes, scales, reduced, v, k=k, rescore=factor)[0] for v in q])
+            row(f"int8 ×{factor} rescore", dims, found, time.perf_counter() - start, quantize="int8")
+
+    try:
+        import hnswlib
+    except ImportError:
+        return rows
+    dims = min(512, stored_dims)
+    reduced, q = truncate(vectors, dims), truncate(queries, dims)
+    for m, ef_search in hnsw_grid:
+        index = hnswlib.Index(space="cosine", dim=dims)
+        index.init_index(max_elements=n, M=m, ef_construction=100)
+        index.add_items(reduced, np.arange(n))
+        index.set_ef(max(ef_search, k))
+        start = time.perf_counter()
+        found, _ = index.knn_query(q, k=k)
+        row(f"hnsw M={m} ef={ef_search}", dims, found, time.perf_counter() - start, m=m)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory / recall tradeoffs for Lab4Collection.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("report", help="recall@k and memory for dims / int8 / HNSW settings")
+    r.add_argument("--synthetic", type=int, default=0, metavar="N", help="use N synthetic vectors")
+    r.add_argument("--db", default=str(DB_PATH))
+    r.add_argument("--k", type=int, default=5)
+    r.add_argument("--scale", type=int, default=10, help="project memory to this multiple of the corpus")
+    r.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    vectors = synthetic_vectors(args.synthetic) if args.synthetic else collection_vectors(args.db)
+    rows = tradeoff_report(vectors, k=args.k, scale=args.scale)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{len(vectors)} vectors × {vectors.shape[1]} dims; recall@{args.k} vs exact full-dim search; "
+          f"memory projected to {args.scale}× the corpus")
+    print(f"{'setting':<22} {'dims':>5} {'recall':>7} {'ms/q':>8} {'RAM MB':>8} {'disk MB':>8}")
+    for r in rows:
+        print(f"{r['setting']:<22} {r['dims']:>5} {r['recall']:>7.3f} {r['ms_per_query']:>8.3f} "
+              f"{r['resident_mb']:>8.1f} {r['disk_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
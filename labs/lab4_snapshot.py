@@ -0,0 +1,242 @@
+"""
+Versioned, read-only snapshots of lab 4's index.
+
+A snapshot is a directory holding everything needed to answer queries
+without re-embedding anything:
+
+    snapshots/lab4/
+        LATEST                      name of the current version
+        20261019-142233/
+            manifest.json           format, version, model/dims, index settings,
+                                    row count, checksums, source PDF hashes
+            embeddings.npy          float32 unit vectors, one row per chunk (memory-mapped)
+            records.jsonl           {"id", "document", "metadata"} per row, same order
+
+The layout is a ``labs.lab4_store.MemmapStore`` plus checksums, and
+``Snapshot`` opens one as a read-only store: brute force over the
+memory-mapped matrix, fast for a syllabus-sized corpus, and every process on
+a host shares one page-cached copy. Point ``LAB4_SNAPSHOT`` at a snapshot (or
+at the directory holding ``LATEST``) to start lab 4 from it:
+
+    python -m labs.lab4_snapshot export                       # ~/.cache/lab4_chroma -> snapshots/lab4/<version>
+    python -m labs.lab4_snapshot export --db ChromaDB_for_lab  # any persisted Chroma directory
+    python -m labs.lab4_snapshot import snapshots/lab4         # LATEST as lab 4's active Chroma version (no embedding calls)
+    python -m labs.lab4_snapshot verify snapshots/lab4
+
+``snapshots/`` is git-ignored: snapshots are build artifacts of several MB,
+shipped next to a deployment rather than committed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from labs.lab4_courses import course_code
+from labs.lab4_index import COLLECTION, DB_PATH, EMBED_MODEL, FULL_DIMS, IndexSettings, normalize_rows
+from labs.lab4_store import FORMAT, MemmapStore
+from labs.lab4_versions import ChromaCatalog, VersionedStore
+
+SNAPSHOT_ROOT = Path(__file__).resolve().parent.parent / "snapshots" / "lab4"
+PDF_FOLDER = Path(__file__).parent / "lab4_data"
+
+
+def sha256_file(path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(chunk_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_hashes(pdf_folder=PDF_FOLDER) -> dict[str, str]:
+    """sha256 of every source PDF, to tell whether a snapshot is stale."""
+    folder = Path(pdf_folder)
+    return {p.name: sha256_file(p) for p in sorted(folder.glob("*.pdf"))} if folder.is_dir() else {}
+
+
+def resolve(path) -> Path:
+    """A snapshot directory, following ``LATEST`` when given the root of several versions."""
+    path = Path(path)
+    if (path / "manifest.json").exists():
+        return path
+    if (path / "LATEST").exists():
+        return path / (path / "LATEST").read_text().strip()
+    raise FileNotFoundError(f"no snapshot at {path} (expected manifest.json or LATEST)")
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+# ── Export / import ──────────────────────────────────────────────────────────
+def export_snapshot(collection, root=SNAPSHOT_ROOT, version: str | None = None, pdf_folder=PDF_FOLDER,
+                    batch_size: int = 1000) -> Path:
+    """Write ``collection`` as a new snapshot version under ``root`` and point ``LATEST`` at it."""
+    root = Path(root)
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    final = root / version
+    if final.exists():
+        raise FileExistsError(f"snapshot {final} already exists")
+    staging = root / f".{version}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    ids, vectors = [], []
+    with open(staging / "records.jsonl", "w", encoding="utf-8") as records:
+        offset = 0
+        while True:
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            if not len(batch["ids"]):
+                break
+            for chunk_id, vector, document, meta in zip(
+                batch["ids"], batch["embeddings"], batch["documents"], batch["metadatas"]
+            ):
+                meta = dict(meta or {})
+                meta.setdefault("course", course_code(meta.get("filename", "")))
+                records.write(json.dumps({"id": chunk_id, "document": document, "metadata": meta}) + "\n")
+                ids.append(chunk_id)
+                vectors.append(vector)
+            offset += len(batch["ids"])
+
+    matrix = normalize_rows(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    np.save(staging / "embeddings.npy", matrix)
+    metadata = dict(collection.metadata or {})
+    manifest = {
+        "format": FORMAT,
+        "version": version,
+        "created_at": time.time(),
+        "collection": collection.name,
+        "collection_metadata": metadata,
+        "embed_model": metadata.get("embed_model", EMBED_MODEL),
+        "embed_dims": int(matrix.shape[1]) if len(ids) else 0,
+        "count": len(ids),
+        "files": {name: sha256_file(staging / name) for name in ("embeddings.npy", "records.jsonl")},
+        "sources": source_hashes(pdf_folder),
+    }
+    (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    os.replace(staging, final)
+    _write_atomic(root / "LATEST", version)
+    return final
+
+
+def import_snapshot(snapshot: "Snapshot", store, batch_size: int = 1000):
+    """Copy the snapshot's rows into an empty writable ``store`` (no embedding calls)."""
+    for start in range(0, len(snapshot.ids), batch_size):
+        end = start + batch_size
+        store.add(
+            ids=snapshot.ids[start:end],
+            embeddings=np.asarray(snapshot.embeddings[start:end]).tolist(),
+            documents=snapshot.documents[start:end],
+            metadatas=snapshot.metadatas[start:end],
+        )
+    return store
+
+
+# ── Read-only collection ─────────────────────────────────────────────────────
+class Snapshot(MemmapStore):
+    """A snapshot opened read-only, queried like a Chroma collection."""
+
+    def __init__(self, path, verify: bool = True):
+        self.path = resolve(path)
+        if verify:
+            manifest = json.loads((self.path / "manifest.json").read_text())
+            for name, digest in manifest["files"].items():
+                if sha256_file(self.path / name) != digest:
+                    raise ValueError(f"checksum mismatch for {self.path / name}")
+        super().__init__(self.path, read_only=True)
+
+    @property
+    def id(self) -> str:
+        return f"snapshot-{self.manifest['version']}"
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    def settings(self) -> IndexSettings:
+        """Index settings the snapshot was built with (queries must be embedded the same way)."""
+        return IndexSettings.from_metadata(
+            self.metadata,
+            dims=self.manifest["embed_dims"] or self.metadata.get("embed_dims", FULL_DIMS),
+            model=self.manifest["embed_model"],
+        )
+
+    def is_stale(self, pdf_folder=PDF_FOLDER) -> bool:
+        """Whether the source PDFs on disk differ from the ones the snapshot was built from."""
+        return bool(self.manifest.get("sources")) and source_hashes(pdf_folder) != self.manifest["sources"]
+
+    def _read_only(self, *args, **kwargs):
+        raise PermissionError(f"snapshot {self.path} is read-only")
+
+    upsert = delete = modify = _read_only
+
+
+# ── CLI ──────────────────────────────────────────────────────────────────────
+def _chroma(db_path):
+    from labs.startup import use_pysqlite3
+
+    use_pysqlite3()
+    import chromadb
+
+    return chromadb.PersistentClient(path=str(db_path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / import / verify lab 4 index snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    e = sub.add_parser("export", help="write a persisted Chroma collection as a new snapshot version")
+    e.add_argument("--db", default=str(DB_PATH))
+    e.add_argument("--collection", default=None, help="default: the version lab 4 is serving")
+    e.add_argument("--out", default=str(SNAPSHOT_ROOT))
+    e.add_argument("--version", default=None)
+    i = sub.add_parser("import", help="load a snapshot into a persisted Chroma collection")
+    i.add_argument("snapshot")
+    i.add_argument("--db", default=str(DB_PATH))
+    i.add_argument("--collection", default=COLLECTION)
+    v = sub.add_parser("verify", help="check a snapshot's checksums and source PDFs")
+    v.add_argument("snapshot")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        client = _chroma(args.db)
+        name = args.collection
+        if name is None:   # the version lab 4 is serving, else a pre-versioning collection
+            active = VersionedStore(ChromaCatalog(client), args.db).active()
+            name = f"{COLLECTION}-{active}" if active else COLLECTION
+        collection = client.get_collection(name)
+        path = export_snapshot(collection, args.out, args.version)
+        print(f"exported {collection.count()} chunks to {path}")
+    elif args.command == "import":
+        # Imported as a new version and switched to atomically, like a lab 4 rebuild
+        snapshot = Snapshot(args.snapshot)
+        versions = VersionedStore(ChromaCatalog(_chroma(args.db), args.collection), args.db)
+        build = versions.begin(snapshot.metadata)
+        if build is None:
+            raise SystemExit(f"a rebuild is already running in {args.db}")
+        version, store = build
+        try:
+            import_snapshot(snapshot, store)
+            versions.validate(store, expected=Counter(m["filename"] for m in snapshot.metadatas))
+        except BaseException:
+            versions.abort(version)
+            raise
+        versions.commit(version)
+        print(f"imported snapshot {snapshot.version} ({store.count()} chunks) into {args.db} as version {version}")
+    else:
+        snapshot = Snapshot(args.snapshot)
+        stale = " (source PDFs have changed since export)" if snapshot.is_stale() else ""
+        print(f"snapshot {snapshot.version}: {snapshot.count()} chunks × {snapshot.manifest['embed_dims']} dims, "
+              f"checksums ok{stale}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Vector stores for lab 4.
+
+lab 4 codes against ``VectorStore``, the subset of the Chroma collection API
+it actually uses (``count``/``add``/``update``/``get``/``query`` with
+``where`` filters and Chroma-shaped results). There are two backends:
+
+- ``ChromaStore``: the persisted Chroma collection (SQLite + HNSW);
+- ``MemmapStore``: float32 unit vectors in a memory-mapped ``.npy`` file plus
+  a JSONL file of documents/metadata. A query batch is answered exactly with
+  one matmul and an ``argpartition``. Opening it costs one ``np.load`` and
+  small corpora are searched in well under a millisecond. With
+  ``quantize="int8"`` only int8 codes are kept in memory; candidates found
+  there are re-scored from the float32 file on disk.
+
+Pick one with ``LAB4_STORE=chroma|memmap``. ``MemmapStore``'s directory
+layout is also the snapshot format (see ``labs.lab4_snapshot``).
+"""
+
+import json
+import os
+import shutil
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+from labs.lab4_index import int8_search, normalize_rows, quantize_int8
+
+BACKENDS = ("chroma", "memmap")
+FORMAT = 1
+
+
+class VectorStore(ABC):
+    """Interface lab 4 codes against; results use Chroma's shapes (one inner list per query)."""
+
+    name: str
+
+    @property
+    @abstractmethod
+    def id(self) -> str: ...
+
+    @property
+    @abstractmethod
+    def metadata(self) -> dict: ...
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def add(self, ids: list[str], embeddings, documents: list[str], metadatas: list[dict]) -> None: ...
+
+    @abstractmethod
+    def update(self, ids: list[str], metadatas: list[dict]) -> None: ...
+
+    @abstractmethod
+    def get(self, ids: list[str] | None = None, where: dict | None = None,
+            include=("documents", "metadatas"), limit: int | None = None, offset: int = 0) -> dict: ...
+
+    @abstractmethod
+    def query(self, query_embeddings, n_results: int = 10, where: dict | None = None,
+              include=("documents", "metadatas", "distances")) -> dict: ...
+
+    @abstractmethod
+    def reset(self, metadata: dict) -> None:
+        """Drop every row and start over with new collection metadata."""
+
+    def set_search_ef(self, ef_search: int) -> bool:
+        """Tune approximate search, where the backend has any; ``False`` if it couldn't be applied."""
+        return True
+
+
+# ── Chroma ───────────────────────────────────────────────────────────────────
+class ChromaStore(VectorStore):
+    """A persisted Chroma collection."""
+
+    def __init__(self, client, name: str, metadata: dict | None = None):
+        self.client = client
+        self.name = name
+        self.collection = client.get_or_create_collection(name=name, metadata=metadata)
+
+    @property
+    def id(self) -> str:
+        return str(self.collection.id)
+
+    @property
+    def metadata(self) -> dict:
+        return self.collection.metadata or {}
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update(self, ids, metadatas) -> None:
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0) -> dict:
+        return self.collection.get(ids=ids, where=where, include=list(include), limit=limit, offset=offset or None)
+
+    def query(self, query_embeddings, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")) -> dict:
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where,
+                                     include=list(include))
+
+    def reset(self, metadata: dict) -> None:
+        self.client.delete_collection(name=self.name)
+        self.collection = self.client.get_or_create_collection(name=self.name, metadata=metadata)
+
+    def set_search_ef(self, ef_search: int) -> bool:
+        from labs.lab4_index import apply_search_ef
+
+        return apply_search_ef(self.collection, ef_search)
+
+
+# ── NumPy memmap ─────────────────────────────────────────────────────────────
+class MemmapStore(VectorStore):
+    """Exact cosine search over a memory-mapped float32 matrix.
+
+    ``directory`` holds ``manifest.json`` (name, collection metadata, row
+    count), ``embeddings.npy`` and ``records.jsonl`` (id, document, metadata
+    per row, in matrix order). ``add`` writes new rows into spare capacity at
+    the end of the matrix, growing it geometrically, and appends their
+    records. Ingest I/O is therefore linear in the corpus, not quadratic.
+    The manifest's ``count`` is rewritten atomically last, so readers in
+    other processes never see a half-written row.
+
+    With ``quantize="int8"`` queries scan ``codes.npy``/``scales.npy``, which
+    are derived from the float32 rows and cached next to them; the float32
+    file is only read for the ``n_results × rescore`` candidates.
+    """
+
+    def __init__(self, directory, name: str = "Lab4Collection", metadata: dict | None = None,
+                 read_only: bool = False, quantize: str = "none", rescore: int = 4):
+        if quantize not in ("none", "int8"):
+            raise ValueError(f"quantize must be 'none' or 'int8', not {quantize!r}")
+        self.directory = Path(directory)
+        self.read_only = read_only
+        self.quantize = quantize
+        self.rescore = rescore
+        self._lock = threading.Lock()
+        if not (self.directory / "manifest.json").exists():
+            if read_only:
+                raise FileNotFoundError(f"no vector store at {self.directory}")
+            self._create(name, metadata or {})
+        self._load()
+
+    # Files
+    def _create(self, name: str, metadata: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for filename in ("embeddings.npy", "records.jsonl", "codes.npy", "scales.npy"):
+            (self.directory / filename).unlink(missing_ok=True)
+        self._write_manifest({"format": FORMAT, "uid": uuid.uuid4().hex, "collection": name,
+                              "collection_metadata": metadata, "count": 0, "records_bytes": 0})
+
+    def _write_manifest(self, manifest: dict) -> None:
+        tmp = self.directory / "manifest.json.tmp"
+        tmp.write_text(json.dumps(manifest, indent=2))
+        os.replace(tmp, self.directory / "manifest.json")
+
+    def _load(self) -> None:
+        self.manifest = json.loads((self.directory / "manifest.json").read_text())
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(f"unsupported vector store format {self.manifest.get('format')!r}")
+        # Rows past ``count`` are spare capacity or an add that never committed
+        count = self.manifest.get("count")
+        self.ids, self.documents, self.metadatas = [], [], []
+        records = self.directory / "records.jsonl"
+        if records.exists():
+            with open(records, encoding="utf-8") as f:
+                for line in f:
+                    if count is not None and len(self.ids) >= count:
+                        break
+                    record = json.loads(line)
+                    self.ids.append(record["id"])
+                    self.documents.append(record["document"])
+                    self.metadatas.append(record["metadata"])
+        self._open_matrix()
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._postings: dict[str, dict] = {}
+
+    def _open_matrix(self) -> None:
+        if self.ids:
+            self._matrix = np.load(self.directory / "embeddings.npy", mmap_mode="r")
+            self.embeddings = self._matrix[:len(self.ids)]
+        else:
+            self._matrix = self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._codes = self._scales = None
+
+    def _int8(self) -> tuple[np.ndarray, np.ndarray]:
+        """int8 codes and scales for the committed rows, loaded from disk or quantized once."""
+        if self._codes is None:
+            count = len(self.ids)
+            codes_path, scales_path = self.directory / "codes.npy", self.directory / "scales.npy"
+            try:
+                codes, scales = np.load(codes_path), np.load(scales_path)
+                if codes.shape[1:] != self.embeddings.shape[1:] or len(scales) != len(codes):
+                    raise ValueError("stale int8 codes")
+            except (OSError, ValueError):
+                codes = np.zeros((0, *self.embeddings.shape[1:]), dtype=np.int8)
+                scales = np.zeros(0, dtype=np.float32)
+            if len(codes) < count:
+                # Rows are append-only, so only rows added since the last save need quantizing
+                new_codes, new_scales = quantize_int8(np.asarray(self.embeddings[len(codes):]))
+                codes, scales = np.concatenate([codes, new_codes]), np.concatenate([scales, new_scales])
+                if not self.read_only:
+                    np.save(codes_path, codes)
+                    np.save(scales_path, scales)
+            self._codes, self._scales = codes[:count], scales[:count]
+        return self._codes, self._scales
+
+    @staticmethod
+    def _record_lines(ids, documents, metadatas) -> bytes:
+        return "".join(
+            json.dumps({"id": i, "document": d, "metadata": m}) + "\n" for i, d, m in zip(ids, documents, metadatas)
+        ).encode("utf-8")
+
+    def _write_records(self) -> int:
+        tmp = self.directory / "records.jsonl.tmp"
+        data = self._record_lines(self.ids, self.documents, self.metadatas)
+        tmp.write_bytes(data)
+        os.replace(tmp, self.directory / "records.jsonl")
+        return len(data)
+
+    def _append_rows(self, vectors: np.ndarray) -> None:
+        """Write ``vectors`` after the committed rows, growing the file when it is full."""
+        path = self.directory / "embeddings.npy"
+        count, needed = len(self.ids), len(self.ids) + len(vectors)
+        capacity = self._matrix.shape[0] if count else 0
+        if needed > capacity:
+            capacity = max(needed, 2 * capacity)
+            tmp = self.directory / "embeddings.tmp.npy"
+            grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32,
+                                              shape=(capacity, vectors.shape[1]))
+            if count:
+                grown[:count] = self.embeddings
+            grown[count:needed] = vectors
+            grown.flush()
+            del grown
+            os.replace(tmp, path)
+        else:
+            matrix = np.load(path, mmap_mode="r+")
+            matrix[count:needed] = vectors
+            matrix.flush()
+            del matrix
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise PermissionError(f"vector store {self.directory} is read-only")
+
+    # Interface
+    @property
+    def name(self) -> str:
+        return self.manifest["collection"]
+
+    @property
+    def id(self) -> str:
+        return self.manifest["uid"]
+
+    @property
+    def metadata(self) -> dict:
+        return self.manifest.get("collection_metadata", {})
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        self._check_writable()
+        with self._lock:
+            duplicates = set(ids) & self._rows.keys()
+            if duplicates or len(set(ids)) != len(ids):
+                raise ValueError(f"duplicate ids: {sorted(duplicates)[:5] or 'within the batch'}")
+            vectors = normalize_rows(embeddings)
+            if self.ids and vectors.shape[1] != self.embeddings.shape[1]:
+                raise ValueError(f"expected {self.embeddings.shape[1]}-dim vectors, got {vectors.shape[1]}")
+            ids, documents = list(ids), list(documents)
+            metadatas = [dict(m or {}) for m in metadatas]
+            self._append_rows(vectors)
+            records = self.directory / "records.jsonl"
+            committed = self.manifest.get("records_bytes")
+            with open(records, "ab") as f:
+                if committed is not None:
+                    f.truncate(committed)   # drop the tail of an add that never committed
+                f.write(self._record_lines(ids, documents, metadatas))
+                records_bytes = f.tell()
+            start = len(self.ids)
+            self.ids += ids
+            self.documents += documents
+            self.metadatas += metadatas
+            self.manifest = {**self.manifest, "count": len(self.ids), "records_bytes": records_bytes}
+            self._write_manifest(self.manifest)
+            self._rows.update((chunk_id, start + row) for row, chunk_id in enumerate(ids))
+            self._postings = {}
+            self._open_matrix()
+
+    def update(self, ids, metadatas) -> None:
+        self._check_writable()
+        with self._lock:
+            for chunk_id, meta in zip(ids, metadatas):
+                if chunk_id in self._rows:
+                    self.metadatas[self._rows[chunk_id]] = dict(meta)
+            records_bytes = self._write_records()
+            self.manifest = {**self.manifest, "count": len(self.ids), "records_bytes": records_bytes}
+            self._write_manifest(self.manifest)
+            self._postings = {}
+
+    def reset(self, metadata: dict) -> None:
+        self._check_writable()
+        with self._lock:
+            self._create(self.name, metadata)
+            self._load()
+
+    # Metadata filtering
+    def _posting(self, key: str) -> dict:
+        if key not in self._postings:
+            index: dict = {}
+            for row, meta in enumerate(self.metadatas):
+                if key in meta:
+                    index.setdefault(meta[key], []).append(row)
+            self._postings[key] = {value: np.array(rows, dtype=np.int64) for value, rows in index.items()}
+        return self._postings[key]
+
+    def _match(self, where: dict | None) -> np.ndarray:
+        """Row numbers matching a Chroma-style ``where`` clause (equality, $in, $ne, $nin, $and, $or)."""
+        every = np.arange(len(self.ids))
+        if not where:
+            return every
+        rows = every
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    rows = np.intersect1d(rows, self._match(clause))
+                continue
+            if key == "$or":
+                matched = [self._match(clause) for clause in condition]
+                rows = np.intersect1d(rows, np.unique(np.concatenate(matched)) if matched else every[:0])
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            posting = self._posting(key)
+            for op, value in condition.items():
+                if op not in ("$eq", "$in", "$ne", "$nin"):
+                    raise ValueError(f"unsupported where operator {op!r}")
+                values = value if op in ("$in", "$nin") else [value]
+                hits = [posting[v] for v in values if v in posting]
+                found = np.unique(np.concatenate(hits)) if hits else every[:0]
+                rows = np.intersect1d(rows, found) if op in ("$eq", "$in") else np.setdiff1d(rows, found)
+        return rows
+
+    def _result(self, rows, include) -> dict:
+        result = {"ids": [self.ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[r] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[r] for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.asarray(self.embeddings[r]) for r in rows]
+        return result
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0) -> dict:
+        rows = self._match(where)
+        if ids is not None:
+            wanted = np.array([self._rows[i] for i in ids if i in self._rows], dtype=np.int64)
+            rows = wanted[np.isin(wanted, rows)]
+        end = None if limit is None else offset + limit
+        return self._result(rows[offset:end], include)
+
+    def query(self, query_embeddings, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")) -> dict:
+        """Exact cosine top-``n_results`` for every query row, from one matmul over the batch."""
+        rows = self._match(where)
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        out = {key: [[] for _ in queries] for key in ("ids", *include)}
+        if not len(rows):
+            return out
+        if self.quantize == "int8":
+            return self._query_int8(queries, rows, n_results, include, out)
+        matrix = self.embeddings if len(rows) == len(self.ids) else self.embeddings[rows]
+        scores = queries @ matrix.T
+        k = min(n_results, len(rows))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for q, candidates in enumerate(top):
+            order = candidates[np.argsort(-scores[q, candidates])]
+            for key, values in self._result(rows[order], include).items():
+                out[key][q] = values
+            if "distances" in include:
+                out["distances"][q] = [float(1.0 - scores[q, i]) for i in order]
+        return out
+
+    def _query_int8(self, queries, rows, n_results, include, out) -> dict:
+        codes, scales = self._int8()
+        subset = None if len(rows) == len(self.ids) else rows
+        for q, query in enumerate(queries):
+            found, scores = int8_search(codes, scales, self.embeddings, query, k=min(n_results, len(rows)),
+                                        rescore=self.rescore, rows=subset)
+            for key, values in self._result(found, include).items():
+                out[key][q] = values
+            if "distances" in include:
+                out["distances"][q] = [float(1.0 - score) for score in scores]
+        return out
+
+    @classmethod
+    def drop(cls, directory) -> None:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,270 @@
+"""
+Blue/green rebuilds for lab 4's vector store.
+
+A rebuild never touches the version that is serving. Instead it:
+
+1. takes a build lock (``BUILDING``, so one rebuild runs at a time across
+   processes) and creates a new versioned collection, e.g.
+   ``Lab4Collection-20261019-142233-1a2b3c`` (Chroma) or
+   ``lab4_memmap/20261019-142233-1a2b3c/`` (memmap);
+2. ingests into it while every session keeps querying the old version;
+3. validates it (every source file with exactly the chunks ingested from
+   it, settings, and that sampled chunks retrieve themselves);
+4. switches the ``ACTIVE`` pointer file with one atomic ``os.replace``, so a
+   session sees either the old version or the new one, never a half-built
+   one;
+5. garbage-collects retired versions once no query in this process holds
+   them (``lease``) and ``$LAB4_RETIRE_GRACE`` seconds have passed, for
+   sessions in other processes. The unversioned store from before versioning
+   (the ``Lab4Collection`` collection, or the files at the top of
+   ``lab4_memmap/``) is dropped once a version is active.
+
+    versions = VersionedStore(ChromaCatalog(client), DB_PATH)
+    build = versions.begin(settings.collection_metadata())
+    if build is not None:
+        version, store = build
+        ...ingest into store, aborting on any failure...
+        versions.validate(store, expected={"a.pdf": 12, "b.pdf": 30})
+        versions.commit(version)
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from labs.lab4_index import COLLECTION
+from labs.lab4_store import ChromaStore, MemmapStore
+
+POINTER = "ACTIVE"
+BUILD_LOCK = "BUILDING"
+BUILD_TIMEOUT = 30 * 60   # a lock older than this was left by a crashed build
+RETIRE_GRACE = float(os.getenv("LAB4_RETIRE_GRACE", 300))
+
+
+def new_version() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+# ── Catalogs: where each backend keeps its versions ─────────────────────────
+class ChromaCatalog:
+    """Versions as Chroma collections named ``<base>-<version>`` in one client."""
+
+    def __init__(self, client, base: str = COLLECTION):
+        self.client = client
+        self.base = base
+
+    def open(self, version: str, metadata: dict | None = None) -> ChromaStore:
+        return ChromaStore(self.client, f"{self.base}-{version}", metadata)
+
+    def versions(self) -> list[str]:
+        prefix = f"{self.base}-"
+        names = [getattr(c, "name", c) for c in self.client.list_collections()]
+        return sorted(n[len(prefix):] for n in names if n.startswith(prefix))
+
+    def drop(self, version: str) -> None:
+        self.client.delete_collection(name=f"{self.base}-{version}")
+
+    def drop_legacy(self) -> bool:
+        """Delete the unversioned ``<base>`` collection, if one is left over."""
+        names = [getattr(c, "name", c) for c in self.client.list_collections()]
+        if self.base not in names:
+            return False
+        self.client.delete_collection(name=self.base)
+        return True
+
+
+class MemmapCatalog:
+    """Versions as ``MemmapStore`` directories under ``root``; ``store_options`` go to every store opened."""
+
+    def __init__(self, root, base: str = COLLECTION, **store_options):
+        self.root = Path(root)
+        self.base = base
+        self.store_options = store_options
+
+    def open(self, version: str, metadata: dict | None = None) -> MemmapStore:
+        path = self.root / version
+        if metadata is None and not (path / "manifest.json").exists():
+            raise FileNotFoundError(f"no version {version} under {self.root}")
+        return MemmapStore(path, name=self.base, metadata=metadata, **self.store_options)
+
+    def versions(self) -> list[str]:
+        if not self.root.is_dir():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if (p / "manifest.json").exists())
+
+    def drop(self, version: str) -> None:
+        MemmapStore.drop(self.root / version)
+
+    def drop_legacy(self) -> bool:
+        """Delete an unversioned store written directly into ``root``, if one is left over."""
+        if not (self.root / "manifest.json").exists():
+            return False
+        for name in ("embeddings.npy", "records.jsonl", "embeddings.tmp.npy", "records.jsonl.tmp", "manifest.json"):
+            (self.root / name).unlink(missing_ok=True)
+        return True
+
+
+# ── Pointer, lock, leases ────────────────────────────────────────────────────
+class VersionedStore:
+    """The ``ACTIVE`` pointer over a catalog, plus the build lock and garbage collection."""
+
+    def __init__(self, catalog, root, grace: float = RETIRE_GRACE):
+        self.catalog = catalog
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.grace = grace
+        self._leases: Counter = Counter()
+        self._lock = threading.Lock()
+        self._collected = 0.0
+
+    def _pointer(self) -> dict:
+        try:
+            return json.loads((self.root / POINTER).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"version": None, "retired": []}
+
+    def active(self) -> str | None:
+        return self._pointer()["version"]
+
+    def open_active(self):
+        version = self.active()
+        return (version, self.catalog.open(version)) if version else (None, None)
+
+    @contextmanager
+    def lease(self, version: str | None):
+        """Hold ``version`` for the duration of a query so GC can't drop it underneath."""
+        with self._lock:
+            self._leases[version] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._leases[version] -= 1
+
+    # Building
+    def begin(self, metadata: dict):
+        """``(version, empty store)`` for a new build, or ``None`` if another build holds the lock."""
+        lock = self.root / BUILD_LOCK
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if time.time() - lock.stat().st_mtime < BUILD_TIMEOUT:
+                return None
+            lock.unlink(missing_ok=True)   # abandoned by a crashed build
+            return self.begin(metadata)
+        version = new_version()
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps({"version": version, "pid": os.getpid(), "started": time.time()}))
+        try:
+            return version, self.catalog.open(version, metadata)
+        except BaseException:
+            lock.unlink(missing_ok=True)
+            raise
+
+    def validate(self, store, expected: dict[str, int] | None = None, min_count: int = 1,
+                 metadata: dict | None = None, samples: int = 5, min_recall: float = 0.8,
+                 source_key: str = "filename") -> None:
+        """Raise ``ValueError`` unless ``store`` is fit to serve.
+
+        ``expected`` maps each source file to the chunks ingested from it; the
+        store must hold exactly those (by ``source_key`` metadata), so a build
+        that lost a file, or part of one, is never committed.
+        """
+        count = store.count()
+        if count < min_count:
+            raise ValueError(f"new index has {count} chunks, expected at least {min_count}")
+        if expected is not None:
+            if count != sum(expected.values()):
+                raise ValueError(f"new index has {count} chunks, expected {sum(expected.values())}")
+            found = {source: len(store.get(where={source_key: source}, include=[])["ids"])
+                     for source in expected}
+            wrong = {source: f"{found[source]}/{n}" for source, n in expected.items() if found[source] != n}
+            if wrong:
+                raise ValueError(f"new index has the wrong chunks for: {wrong}")
+        if metadata is not None:
+            wrong = {k: store.metadata.get(k) for k, v in metadata.items() if store.metadata.get(k) != v}
+            if wrong:
+                raise ValueError(f"new index has unexpected settings: {wrong}")
+        sample = store.get(include=["embeddings"], limit=samples)
+        if len(sample["ids"]):
+            found = store.query(query_embeddings=list(sample["embeddings"]), n_results=1, include=[])
+            hits = sum(ids[:1] == [chunk_id] for chunk_id, ids in zip(sample["ids"], found["ids"]))
+            if hits < min_recall * len(sample["ids"]):
+                raise ValueError(f"only {hits}/{len(sample['ids'])} sampled chunks retrieve themselves")
+
+    def commit(self, version: str) -> None:
+        """Point ``ACTIVE`` at ``version`` atomically, retire the old one and collect garbage."""
+        pointer = self._pointer()
+        existing = set(self.catalog.versions())
+        retired = [r for r in pointer.get("retired", []) if r["version"] in existing]
+        if pointer["version"] and pointer["version"] != version:
+            retired.append({"version": pointer["version"], "retired_at": time.time()})
+        tmp = self.root / f"{POINTER}.tmp"
+        tmp.write_text(json.dumps({"version": version, "switched_at": time.time(), "retired": retired}))
+        os.replace(tmp, self.root / POINTER)
+        (self.root / BUILD_LOCK).unlink(missing_ok=True)
+        self.collect()
+
+    def abort(self, version: str) -> None:
+        """Drop a failed build and release the lock; the active version is untouched."""
+        try:
+            self.catalog.drop(version)
+        finally:
+            (self.root / BUILD_LOCK).unlink(missing_ok=True)
+
+    # Garbage collection
+    def maybe_collect(self, interval: float = 60.0) -> list[str]:
+        """``collect()`` at most every ``interval`` seconds; cheap enough to call on every page run."""
+        if time.time() - self._collected < interval:
+            return []
+        self._collected = time.time()
+        try:
+            return self.collect()
+        except Exception:
+            return []
+
+    def collect(self) -> list[str]:
+        """Drop retired versions past the grace period with no leases here; returns what was dropped."""
+        pointer = self._pointer()
+        active = pointer["version"]
+        retired_at = {r["version"]: r["retired_at"] for r in pointer.get("retired", [])}
+        building = None
+        try:
+            building = json.loads((self.root / BUILD_LOCK).read_text())["version"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+        now = time.time()
+        dropped = []
+        for version in self.catalog.versions():
+            if version in (active, building):
+                continue
+            with self._lock:
+                if self._leases[version] > 0:
+                    continue
+            # Versions never made active (a crashed build) age out from their own timestamp
+            since = retired_at.get(version)
+            if since is None:
+                try:
+                    since = time.mktime(time.strptime(version[:15], "%Y%m%d-%H%M%S"))
+                except ValueError:
+                    continue
+            if now - since < self.grace:
+                continue
+            try:
+                self.catalog.drop(version)
+                dropped.append(version)
+            except Exception:
+                continue   # still open elsewhere; try again next time
+        if active is not None:
+            try:
+                self.catalog.drop_legacy()   # superseded by the first committed version
+            except Exception:
+                pass   # still open elsewhere; try again next time
+        # The pointer is only ever written by commit() (under the build lock); dropped
+        # versions fall out of its retired list on the next switch
+        return dropped
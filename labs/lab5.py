@@ -1,13 +1,25 @@
-import requests
 import streamlit as st
 import os
 import json
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from labs.instrumentation import span
+from labs.lab5_gazetteer import DEFAULT_CITIES, Gazetteer
+from labs.lab5_tools import execute_tool_calls, tool_messages
+from labs.lab5_weather import OPENWEATHERMAP_URL, WeatherCache, WeatherError, normalize_location, shared_client
+from labs.startup import get_openai_client
 
 # ========================================
 # PART A: WEATHER DATA FUNCTION
 # ========================================
 
+def get_weather_client(api_key, base_url):
+    """One pooled client (and circuit breaker) per API key, shared by every session."""
+    return shared_client(api_key, base_url)
+
+
 def get_current_weather(location, api_key, units='imperial'):
     """
     Get current weather for a location.
@@ -20,36 +32,104 @@ def get_current_weather(location, api_key, units='imperial'):
     Returns:
         Dictionary with weather information
     """
-    url = (
-        f'https://api.openweathermap.org/data/2.5/weather'
-        f'?q={location}&appid={api_key}&units={units}'
+    return get_weather_client(api_key, WEATHER_API_URL).current(location, units)
+
+
+@st.cache_resource
+def get_weather_cache(ttl, maxsize):
+    """One cache for every session on this server, so popular cities hit the API once per TTL."""
+    return WeatherCache(ttl=ttl, maxsize=maxsize)
+
+
+@st.cache_resource
+def get_gazetteer(path):
+    """Offline city index; a downloaded OpenWeatherMap city.list.json can replace the bundled CSV."""
+    if str(path).endswith('.json'):
+        return Gazetteer.from_owm_city_list(path)
+    return Gazetteer.from_csv(path)
+
+
+def get_cached_weather(location, api_key, units='imperial'):
+    """``get_current_weather`` behind the shared TTL cache (concurrent misses are coalesced).
+
+    The location is first resolved against the offline gazetteer: known
+    cities (including typos) are fetched by coordinates and cached under
+    their canonical id, and obviously bad input fails here without an HTTP
+    request. Unknown places still go to OpenWeatherMap by name.
+
+    Uses the ``weather_cache``/``weather_client``/``gazetteer`` resolved on the
+    script thread, so it is safe to call from tool worker threads.
+    """
+    if gazetteer.looks_invalid(location):
+        raise WeatherError(f'City not found: {location}. Try including the country code (e.g., "London, UK" or "Paris, France")')
+
+    client = weather_client if api_key == weather_api_key else shared_client(api_key, WEATHER_API_URL)
+    city = gazetteer.resolve(location)
+    with span("weather", "current", page="lab5") as weather_span:
+        def fetch():
+            if city is None:
+                return client.current(location, units)
+            return client.current_at(city['lat'], city['lon'], city['label'], units)
+
+        weather, outcome = weather_cache.lookup(f"city:{city['id']}" if city else location, units, fetch)
+        # A coalesced call waited on another session's request: neither a hit nor a miss
+        weather_span["cache_hit"] = {"hit": True, "miss": False}.get(outcome)
+        weather_span["coalesced"] = outcome == "coalesced"
+        return weather
+
+
+def format_weather(weather_data):
+    return (
+        f"Current weather in {weather_data['location']}:\n"
+        f"- Condition: {weather_data['condition']}\n"
+        f"- Temperature: {weather_data['temperature']}°F\n"
+        f"- Feels like: {weather_data['feels_like']}°F\n"
+        f"- Low/High: {weather_data['temp_min']}°F / {weather_data['temp_max']}°F\n"
+        f"- Humidity: {weather_data['humidity']}%"
     )
-    response = requests.get(url, timeout=20)
-    if response.status_code == 401:
-        raise Exception('Authentication failed: Invalid API key (401 Unauthorized)')
-    if response.status_code == 404:
-        error_message = response.json().get('message', 'City not found')
-        raise Exception(f'City not found: {location}. Try including the country code (e.g., "London, UK" or "Paris, France")')
-    if response.status_code != 200:
-        raise Exception(f'Weather API error: {response.status_code}')
-
-    data = response.json()
-    temp = data['main']['temp']
-    feels_like = data['main']['feels_like']
-    temp_min = data['main']['temp_min']
-    temp_max = data['main']['temp_max']
-    humidity = data['main']['humidity']
-    condition = data['weather'][0]['description']
-
-    return {
-        'location': location,
-        'temperature': round(temp, 2),
-        'feels_like': round(feels_like, 2),
-        'temp_min': round(temp_min, 2),
-        'temp_max': round(temp_max, 2),
-        'humidity': round(humidity, 2),
-        'condition': condition,
-    }
+
+
+def weather_tool_handler(args):
+    """Tool handler for ``get_current_weather``; runs in a worker thread, so no ``st.*`` calls here."""
+    location = args.get("location") or "Syracuse, NY, US"
+    if not str(location).strip():
+        location = "Syracuse, NY, US"
+
+    try:
+        return format_weather(get_cached_weather(location, weather_api_key))
+    except Exception as weather_error:
+        # If city not found and it's not Syracuse, try Syracuse as fallback
+        if "City not found" in str(weather_error) and location.lower() != "syracuse, ny, us":
+            fallback_location = "Syracuse, NY, US"
+            return (
+                f"Note: couldn't find weather for '{location}', showing {fallback_location} instead.\n"
+                + format_weather(get_cached_weather(fallback_location, weather_api_key))
+            )
+        # Re-raise if it's a different error or if Syracuse itself failed
+        raise
+
+
+@st.cache_resource
+def get_prefetch_pool():
+    """Threads for speculative weather fetches, shared by every session."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix='lab5-prefetch')
+
+
+def weather_key(location):
+    """Canonical identity of a location, used to match a prefetch against the model's tool call."""
+    city = gazetteer.resolve(location)
+    return f"city:{city['id']}" if city else normalize_location(location)
+
+
+def make_weather_handler(prefetched=None):
+    """``weather_tool_handler`` that reuses a speculative fetch when the model asks for the same place."""
+    def handler(args):
+        location = args.get("location") or "Syracuse, NY, US"
+        if prefetched and prefetched["key"] == weather_key(location):
+            prefetched["used"] = True
+            return prefetched["future"].result()
+        return weather_tool_handler(args)
+    return handler
 
 # ========================================
 # PAGE SETUP
@@ -61,6 +141,26 @@ st.set_page_config(page_title='Lab 5: What to Wear Bot', initial_sidebar_state='
 weather_api_key = st.secrets.get('OPENWEATHERMAP_API_KEY', '') or os.getenv('OPENWEATHERMAP_API_KEY', '')
 openai_api_key = st.secrets.get('OPENAI_API_KEY', '')
 
+# Point at a local fake server for testing, e.g. WEATHER_API_URL=http://127.0.0.1:8765/data/2.5
+WEATHER_API_URL = st.secrets.get('WEATHER_API_URL', '') or os.getenv('WEATHER_API_URL', OPENWEATHERMAP_URL)
+
+# Offline gazetteer (bundled CSV, or a downloaded OpenWeatherMap city.list.json)
+CITY_LIST = st.secrets.get('CITY_LIST', '') or os.getenv('CITY_LIST', str(DEFAULT_CITIES))
+
+# Weather cache settings (seconds / number of locations)
+WEATHER_CACHE_TTL = float(st.secrets.get('WEATHER_CACHE_TTL', '') or os.getenv('WEATHER_CACHE_TTL', 600))
+WEATHER_CACHE_SIZE = int(st.secrets.get('WEATHER_CACHE_SIZE', '') or os.getenv('WEATHER_CACHE_SIZE', 1024))
+
+# How the weather fetch is scheduled relative to the first gpt-4o call:
+# - Fast path: skip the first call when the city resolves offline; otherwise speculate
+# - Speculative: start the fetch for the typed city while the first call runs
+# - Sequential: the original call → fetch → call chain
+FETCH_MODES = ["Fast path", "Speculative", "Sequential"]
+
+# Tool execution limits (parallel calls per turn / seconds per call)
+TOOL_MAX_WORKERS = 5
+TOOL_TIMEOUT = 15.0
+
 if not weather_api_key:
     st.error('⚠️ OpenWeather API key not configured. Add OPENWEATHERMAP_API_KEY to secrets.toml')
     st.stop()
@@ -93,15 +193,25 @@ with st.expander("💡 City Name Examples"):
     - Check spelling carefully
     """)
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=openai_api_key)
+# Weather cache stats
+weather_client = get_weather_client(weather_api_key, WEATHER_API_URL)
+weather_cache = get_weather_cache(WEATHER_CACHE_TTL, WEATHER_CACHE_SIZE)
+gazetteer = get_gazetteer(CITY_LIST)
+
+with st.sidebar.expander("🌦️ Weather cache"):
+    st.write(f"TTL: {WEATHER_CACHE_TTL:.0f}s · entries: {len(weather_cache)}/{WEATHER_CACHE_SIZE}")
+    st.json(weather_cache.stats)
+    st.write("Upstream client:")
+    st.json(weather_client.metrics())
+
+fetch_mode = st.sidebar.selectbox("⚡ Weather fetch mode", FETCH_MODES, index=0)
 
 # Define weather tool for OpenAI function calling
 weather_tool = {
     "type": "function",
     "function": {
         "name": "get_current_weather",
-        "description": "Get the current weather for a given location. If no location is provided, use 'Syracuse, NY, US' as default.",
+        "description": "Get the current weather for a given location. If no location is provided, use 'Syracuse, NY, US' as default. Call once per location when comparing several places.",
         "parameters": {
             "type": "object",
             "properties": {
@@ -139,66 +249,70 @@ if st.button("Get Clothing Advice"):
         ]
         
         try:
-            # Step 1: First API call with tool
-            response = openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                tools=[weather_tool],
-                tool_choice="auto"  # Model decides when to call the tool
-            )
-            
-            response_message = response.choices[0].message
+            started = time.perf_counter()
+            openai_client = get_openai_client(openai_api_key, page="lab5")
+
+            # Speculatively fetch the typed city while the model decides what to call
+            prefetched = None
+            if fetch_mode != "Sequential":
+                prefetched = {
+                    "key": weather_key(user_city),
+                    "future": get_prefetch_pool().submit(weather_tool_handler, {"location": user_city}),
+                    "used": False,
+                }
+
+            fast_path = fetch_mode == "Fast path" and gazetteer.resolve(user_city) is not None
+            if fast_path:
+                # The button always asks about exactly one known city, so the
+                # tool call is deterministic and the first model call can be skipped
+                tool_calls = [SimpleNamespace(
+                    id="call_fastpath",
+                    type="function",
+                    function=SimpleNamespace(name="get_current_weather", arguments=json.dumps({"location": user_city})),
+                )]
+                response_message = {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {"id": c.id, "type": c.type, "function": {"name": c.function.name, "arguments": c.function.arguments}}
+                        for c in tool_calls
+                    ],
+                }
+            else:
+                # Step 1: First API call with tool
+                response = openai_client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    tools=[weather_tool],
+                    tool_choice="auto"  # Model decides when to call the tool
+                )
+                
+                response_message = response.choices[0].message
+                tool_calls = response_message.tool_calls
             
             # Step 2: Check if model wants to call weather function
-            if response_message.tool_calls:
-                tool_call = response_message.tool_calls[0]
-                function_args = json.loads(tool_call.function.arguments)
-                location = function_args.get("location", "Syracuse, NY, US")
-                
-                # Handle empty location
-                if not location or not str(location).strip():
-                    location = "Syracuse, NY, US"
-                
-                st.info(f"🔍 Fetching weather for: {location}")
-                
-                # Step 3: Get weather data with fallback
-                try:
-                    weather_data = get_current_weather(location, weather_api_key)
-                except Exception as weather_error:
-                    error_message = str(weather_error)
-                    
-                    # If city not found and it's not Syracuse, try Syracuse as fallback
-                    if "City not found" in error_message and location.lower() != "syracuse, ny, us":
-                        fallback_location = "Syracuse, NY, US"
+            if tool_calls:
+                # Step 3: Run every weather lookup concurrently (results keep the call order)
+                results = execute_tool_calls(
+                    tool_calls,
+                    {"get_current_weather": make_weather_handler(prefetched)},
+                    max_workers=TOOL_MAX_WORKERS,
+                    timeout=TOOL_TIMEOUT,
+                )
+                locations = [r["args"].get("location") or "Syracuse, NY, US" for r in results]
+                st.info(f"🔍 Fetched weather for: {'; '.join(locations)}")
+                for result in results:
+                    if result["error"]:
+                        st.warning(f"⚠️ {result['args'].get('location', 'Syracuse, NY, US')}: {result['error']}")
+                    elif result["content"].startswith("Note:"):
                         st.warning(
-                            f"⚠️ Couldn't find weather for '{location}'. "
-                            f"Using default location: {fallback_location}.\n\n"
+                            f"⚠️ {result['content'].splitlines()[0][len('Note: '):]}\n\n"
                             f"**Tip:** Try including the country code (e.g., 'London, UK' or 'Paris, France')"
                         )
-                        weather_data = get_current_weather(fallback_location, weather_api_key)
-                        location = fallback_location
-                    else:
-                        # Re-raise if it's a different error or if Syracuse itself failed
-                        raise
                 
-                # Format weather info
-                weather_info = (
-                    f"Current weather in {weather_data['location']}:\n"
-                    f"- Condition: {weather_data['condition']}\n"
-                    f"- Temperature: {weather_data['temperature']}°F\n"
-                    f"- Feels like: {weather_data['feels_like']}°F\n"
-                    f"- Low/High: {weather_data['temp_min']}°F / {weather_data['temp_max']}°F\n"
-                    f"- Humidity: {weather_data['humidity']}%"
-                )
-                
-                # Step 4: Add tool response to messages
+                # Step 4: Add tool responses to messages
                 messages.append(response_message)
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "name": "get_current_weather",
-                    "content": weather_info
-                })
+                messages.extend(tool_messages(results))
                 
                 # Step 5: Second API call with weather context
                 second_response = openai_client.chat.completions.create(
@@ -211,6 +325,11 @@ if st.button("Get Clothing Advice"):
                 # Display results
                 st.success("**Clothing & Activity Suggestions:**")
                 st.markdown(final_response)
+                st.caption(
+                    f"⏱️ {time.perf_counter() - started:.2f}s · mode: {fetch_mode}"
+                    + (" · first model call skipped" if fast_path else "")
+                    + (" · prefetch reused" if prefetched and prefetched["used"] else "")
+                )
                 
             else:
                 # Model responded without needing weather
@@ -227,7 +346,7 @@ if st.button("Get Clothing Advice"):
         if test_city:
             try:
                 with st.spinner(f"Fetching weather for {test_city}..."):
-                    result = get_current_weather(test_city, weather_api_key)
+                    result = get_cached_weather(test_city, weather_api_key)
                     st.success(f"✅ Weather data for {test_city}:")
                     st.json(result)
             except Exception as e:
@@ -0,0 +1,265 @@
+"""
+Offline location lookup for lab 5.
+
+A small in-memory gazetteer (``lab5_data/cities.csv``, or OpenWeatherMap's
+``city.list.json`` if you download it) that turns free-form input like
+"syracuse ny" or "Londn, UK" into one canonical city with coordinates before
+any network call is made. Exact names are a dict lookup; typos fall back to a
+trigram index scored with the Dice coefficient, and a fuzzy candidate is only
+accepted when it is within a typo or two of the input (edit distance), so an
+unknown place is passed to the API as typed rather than snapped onto a
+similar-looking city.
+"""
+
+import csv
+import json
+import re
+from pathlib import Path
+
+DEFAULT_CITIES = Path(__file__).parent / "lab5_data" / "cities.csv"
+
+# Common ways people write a country -> ISO 3166 alpha-2 code
+COUNTRY_ALIASES = {
+    "us": "US", "usa": "US", "united states": "US", "united states of america": "US", "america": "US",
+    "uk": "GB", "gb": "GB", "united kingdom": "GB", "great britain": "GB", "britain": "GB",
+    "england": "GB", "scotland": "GB", "wales": "GB",
+    "ca": "CA", "canada": "CA", "mx": "MX", "mexico": "MX", "cu": "CU", "cuba": "CU",
+    "co": "CO", "colombia": "CO", "pe": "PE", "peru": "PE", "cl": "CL", "chile": "CL",
+    "ar": "AR", "argentina": "AR", "br": "BR", "brazil": "BR", "brasil": "BR",
+    "ie": "IE", "ireland": "IE", "fr": "FR", "france": "FR", "es": "ES", "spain": "ES",
+    "pt": "PT", "portugal": "PT", "it": "IT", "italy": "IT", "de": "DE", "germany": "DE",
+    "nl": "NL", "netherlands": "NL", "holland": "NL", "be": "BE", "belgium": "BE",
+    "ch": "CH", "switzerland": "CH", "at": "AT", "austria": "AT", "cz": "CZ", "czechia": "CZ",
+    "czech republic": "CZ", "pl": "PL", "poland": "PL", "dk": "DK", "denmark": "DK",
+    "se": "SE", "sweden": "SE", "no": "NO", "norway": "NO", "fi": "FI", "finland": "FI",
+    "gr": "GR", "greece": "GR", "tr": "TR", "turkey": "TR", "turkiye": "TR", "ru": "RU", "russia": "RU",
+    "eg": "EG", "egypt": "EG", "ng": "NG", "nigeria": "NG", "ke": "KE", "kenya": "KE",
+    "za": "ZA", "south africa": "ZA", "ae": "AE", "uae": "AE", "united arab emirates": "AE",
+    "il": "IL", "israel": "IL", "in": "IN", "india": "IN", "th": "TH", "thailand": "TH",
+    "sg": "SG", "singapore": "SG", "id": "ID", "indonesia": "ID", "ph": "PH", "philippines": "PH",
+    "hk": "HK", "hong kong": "HK", "cn": "CN", "china": "CN", "kr": "KR", "korea": "KR",
+    "south korea": "KR", "jp": "JP", "japan": "JP", "tw": "TW", "taiwan": "TW",
+    "au": "AU", "australia": "AU", "nz": "NZ", "new zealand": "NZ", "is": "IS", "iceland": "IS",
+}
+
+# US states and Canadian provinces by full name -> postal code
+REGION_ALIASES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY", "louisiana": "LA",
+    "maine": "ME", "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK", "oregon": "OR",
+    "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC", "south dakota": "SD",
+    "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+    "alberta": "AB", "british columbia": "BC", "manitoba": "MB", "new brunswick": "NB",
+    "newfoundland and labrador": "NL", "nova scotia": "NS", "ontario": "ON", "quebec": "QC",
+    "saskatchewan": "SK",
+}
+
+REGION_CODES = set(REGION_ALIASES.values())
+
+
+def normalize(text: str) -> str:
+    text = re.sub(r"[^a-z0-9, ]", " ", str(text).lower().replace(".", ""))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int, substitution: int = 1) -> int:
+    """Levenshtein distance between ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``.
+
+    With ``substitution=2`` a changed letter costs as much as a dropped plus
+    an extra one, so only insertions and deletions fit a limit of 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (substitution if ca != cb else 0)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edits(name: str) -> tuple[int, int]:
+    """``(limit, substitution cost)`` tolerated for a name of this length.
+
+    Very short names must match exactly. Short ones allow one dropped or
+    doubled letter but no changed letter, since "Sidney" and "Sydney" are
+    both real places. Long names allow two edits of any kind.
+    """
+    if len(name) < 4:
+        return 0, 1
+    if len(name) < 8:
+        return 1, 2
+    return 2, 1
+
+
+def label_of(city: dict) -> str:
+    """Display/query form, e.g. "Syracuse, NY, US" or "London, GB"."""
+    return ", ".join(p for p in (city["name"], city["state"], city["country"]) if p)
+
+
+class Gazetteer:
+    """In-memory city index: exact name dict, trigram postings and an id lookup.
+
+    ``min_score`` is the trigram Dice floor for fuzzy candidates; a candidate
+    must also be within ``max_edits`` of the input to be accepted.
+    """
+
+    def __init__(self, cities: list[dict], min_score: float = 0.4):
+        self.cities = cities
+        self.min_score = min_score
+        self.by_id = {c["id"]: c for c in cities}
+        self.by_name: dict[str, list[dict]] = {}
+        self.postings: dict[str, list[int]] = {}
+        self._grams: list[set[str]] = []
+        self._keys: list[str] = []
+        for pos, city in enumerate(cities):
+            key = normalize(city["name"])
+            self._keys.append(key)
+            self.by_name.setdefault(key, []).append(city)
+            grams = trigrams(key)
+            self._grams.append(grams)
+            for g in grams:
+                self.postings.setdefault(g, []).append(pos)
+
+    # ── Loading ──────────────────────────────────────────────────────────────
+    @classmethod
+    def from_csv(cls, path=DEFAULT_CITIES, **kwargs) -> "Gazetteer":
+        with open(path, newline="", encoding="utf-8") as f:
+            cities = [
+                {**row, "lat": float(row["lat"]), "lon": float(row["lon"])}
+                for row in csv.DictReader(f)
+            ]
+        return cls(cities, **kwargs)
+
+    @classmethod
+    def from_owm_city_list(cls, path, **kwargs) -> "Gazetteer":
+        """Load OpenWeatherMap's bulk ``city.list.json`` (ids are OWM city ids)."""
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        cities = [
+            {
+                "id": str(c["id"]),
+                "name": c["name"],
+                "state": c.get("state", ""),
+                "country": c.get("country", ""),
+                "lat": c["coord"]["lat"],
+                "lon": c["coord"]["lon"],
+            }
+            for c in raw
+        ]
+        return cls(cities, **kwargs)
+
+    # ── Lookups ──────────────────────────────────────────────────────────────
+    def get(self, city_id: str) -> dict | None:
+        return self.by_id.get(city_id)
+
+    @staticmethod
+    def looks_invalid(text: str) -> bool:
+        """Input that can't be a place name at all (empty, digits/punctuation only, ...)."""
+        letters = re.sub(r"[^a-z]", "", str(text).lower())
+        return len(letters) < 2
+
+    def _qualifiers(self, parts: list[str]) -> tuple[list[tuple[set[str], set[str]]], bool]:
+        """One ``(region codes, country codes)`` pair per known trailing part, plus saw_unknown.
+
+        A part is usually one or the other; only codes like "CA" (California
+        or Canada) or "IN" (Indiana or India) fill both sides.
+        """
+        qualifiers, unknown = [], False
+        for part in parts:
+            regions, countries = set(), set()
+            if part in REGION_ALIASES:
+                regions.add(REGION_ALIASES[part])
+            if part.upper() in REGION_CODES:
+                regions.add(part.upper())
+            if part in COUNTRY_ALIASES:
+                countries.add(COUNTRY_ALIASES[part])
+            if regions or countries:
+                qualifiers.append((regions, countries))
+            else:
+                unknown = True
+        return qualifiers, unknown
+
+    @staticmethod
+    def _fits(city: dict, qualifiers: list[tuple[set[str], set[str]]]) -> bool:
+        # Every qualifier must match: "Portland, ME, US" needs state ME and country US
+        return all(city["state"] in regions or city["country"] in countries for regions, countries in qualifiers)
+
+    def _split(self, text: str) -> tuple[str, list[str]]:
+        parts = [p.strip() for p in normalize(text).split(",") if p.strip()]
+        if len(parts) == 1:
+            # "syracuse ny" / "paris france": peel known qualifiers off the end
+            words = parts[0].split()
+            trailing = []
+            while len(words) > 1:
+                for n in (3, 2, 1):
+                    tail = " ".join(words[-n:])
+                    if n < len(words) and (tail in COUNTRY_ALIASES or tail in REGION_ALIASES
+                                           or (n == 1 and tail.upper() in REGION_CODES)):
+                        trailing.insert(0, tail)
+                        words = words[:-n]
+                        break
+                else:
+                    break
+            if trailing and " ".join(words) in self.by_name:
+                return " ".join(words), trailing
+        return (parts[0] if parts else ""), parts[1:]
+
+    def resolve(self, text: str) -> dict | None:
+        """Best canonical city for ``text`` or ``None`` if the gazetteer doesn't know it.
+
+        The returned dict is the city row plus ``label`` (canonical query
+        string), ``score`` (1.0 for exact names) and ``corrected`` (whether
+        the input was spelled differently).
+        """
+        if self.looks_invalid(text):
+            return None
+        name, parts = self._split(text)
+        qualifiers, unknown = self._qualifiers(parts)
+
+        candidates = [c for c in self.by_name.get(name, []) if self._fits(c, qualifiers)]
+        if candidates:
+            city, score = candidates[0], 1.0
+        else:
+            city, score = self._fuzzy(name, qualifiers)
+            if city is None:
+                return None
+        if unknown and not qualifiers:
+            return None   # "London, Ontario"-style input we can't vouch for
+        return {**city, "label": label_of(city), "score": score, "corrected": score < 1.0}
+
+    def _fuzzy(self, name: str, qualifiers: list[tuple[set[str], set[str]]]) -> tuple[dict | None, float]:
+        grams = trigrams(name)
+        overlap: dict[int, int] = {}
+        for g in grams:
+            for pos in self.postings.get(g, ()):
+                overlap[pos] = overlap.get(pos, 0) + 1
+        limit, substitution = max_edits(name)
+        best, best_rank = None, None
+        for pos, shared in overlap.items():
+            score = 2 * shared / (len(grams) + len(self._grams[pos]))
+            if score < self.min_score or not self._fits(self.cities[pos], qualifiers):
+                continue
+            # "York" shares most trigrams with "New York" but is a different place, not a typo
+            edits = edit_distance(name, self._keys[pos], limit, substitution)
+            if edits > limit:
+                continue
+            rank = (edits, -score)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = self.cities[pos], rank
+        return best, (round(-best_rank[1], 3) if best else 0.0)
@@ -0,0 +1,98 @@
+"""
+Tool-call executor for lab 5.
+
+Runs every tool call from one model turn concurrently (bounded by
+``max_workers``), gives each call its own timeout, and hands the results back
+in the same order the model asked for them, ready to append as ``tool``
+messages.
+"""
+
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+def execute_tool_calls(tool_calls, handlers, max_workers=4, timeout=10.0):
+    """Run ``tool_calls`` concurrently and return one result dict per call, in order.
+
+    Args:
+        tool_calls: ``response_message.tool_calls`` from the OpenAI SDK
+        handlers: Mapping of function name -> callable taking the parsed arguments
+            and returning the tool message content (a string)
+        max_workers: Upper bound on calls in flight at once
+        timeout: Seconds each call may take once it starts running before it is
+            reported as timed out (time spent queued for a worker doesn't count)
+
+    Returns:
+        List of dicts with ``tool_call``, ``args``, ``content``, ``error`` and
+        ``seconds``. ``content`` is always set, so a failed call still yields a
+        valid ``tool`` message the model can react to.
+    """
+    if not tool_calls:
+        return []
+
+    def run(call, args, started):
+        started["at"] = time.monotonic()
+        started["event"].set()
+        content = handlers[call.function.name](args)
+        return content, time.monotonic() - started["at"]
+
+    workers = max(1, min(max_workers, len(tool_calls)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    # A queued call waits at most this long for a worker: every wave ahead of it timing out
+    queue_deadline = time.monotonic() + timeout * math.ceil(len(tool_calls) / workers)
+    try:
+        submitted = []
+        for call in tool_calls:
+            try:
+                args = json.loads(call.function.arguments or "{}")
+            except json.JSONDecodeError:
+                args = {}
+            if call.function.name not in handlers:
+                submitted.append((call, args, None))
+                continue
+            started = {"event": threading.Event(), "at": None}
+            submitted.append((call, args, (started, pool.submit(run, call, args, started))))
+
+        results = []
+        for call, args, job in submitted:
+            result = {"tool_call": call, "args": args, "content": None, "error": None, "seconds": None}
+            if job is None:
+                result["error"] = f"Unknown tool: {call.function.name}"
+            else:
+                started, future = job
+                if not started["event"].wait(timeout=max(0.0, queue_deadline - time.monotonic())):
+                    future.cancel()
+                    result["error"] = "Timed out waiting for a free worker"
+                else:
+                    # Each call gets its own budget, measured from when it started running
+                    remaining = max(0.0, timeout - (time.monotonic() - started["at"]))
+                    try:
+                        result["content"], result["seconds"] = future.result(timeout=remaining)
+                    except FutureTimeout:
+                        future.cancel()
+                        result["error"] = f"Timed out after {timeout:g}s"
+                    except Exception as e:
+                        result["error"] = str(e)
+            if result["error"]:
+                result["content"] = f"Error: {result['error']}"
+            results.append(result)
+        return results
+    finally:
+        # Don't block the page on calls that already timed out
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def tool_messages(results):
+    """``tool`` role messages for ``results``, in the original call order."""
+    return [
+        {
+            "role": "tool",
+            "tool_call_id": r["tool_call"].id,
+            "name": r["tool_call"].function.name,
+            "content": r["content"],
+        }
+        for r in results
+    ]
@@ -0,0 +1,310 @@
+"""
+Shared weather helpers for lab 5.
+
+``WeatherClient`` talks to OpenWeatherMap over a pooled ``requests.Session``
+with separate connect/read timeouts, bounded retries with jittered backoff and
+a circuit breaker that fails fast while the upstream is unhealthy.
+
+``WeatherCache`` is a process-wide TTL cache for OpenWeatherMap lookups. It is
+bounded (least-recently-used entries are evicted first) and coalesces
+concurrent misses: when several sessions ask for the same city at once, only
+the first one goes upstream and the rest wait for its answer.
+"""
+
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OPENWEATHERMAP_URL = 'https://api.openweathermap.org/data/2.5'
+
+
+class WeatherError(Exception):
+    """Raised for any failed weather lookup."""
+
+
+class CircuitOpenError(WeatherError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Classic closed → open → half-open breaker.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    every call fails fast for ``reset_timeout`` seconds. The first call after
+    that is let through as a probe; success closes the breaker again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class WeatherClient:
+    """Pooled, retrying OpenWeatherMap client with a circuit breaker and metrics."""
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    # The upstream is healthy and answered; the request itself was wrong
+    CALLER_ERRORS = {400, 401, 404}
+
+    def __init__(self, api_key: str, base_url: str = OPENWEATHERMAP_URL,
+                 connect_timeout: float = 3.05, read_timeout: float = 5.0,
+                 retries: int = 2, backoff: float = 0.25, pool_size: int = 20,
+                 breaker: CircuitBreaker | None = None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._metrics_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=1000)
+        self._counts = {'requests': 0, 'retries': 0, 'errors': 0, 'short_circuited': 0}
+
+    # ── Metrics ──────────────────────────────────────────────────────────────
+    def _count(self, name: str) -> None:
+        with self._metrics_lock:
+            self._counts[name] += 1
+
+    def metrics(self) -> dict:
+        """Counters plus p50/p95 latency (seconds) of recent upstream attempts."""
+        with self._metrics_lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4) if latencies else None
+
+        return {**counts, 'p50': pct(0.50), 'p95': pct(0.95), 'breaker': self.breaker.state}
+
+    # ── Requests ─────────────────────────────────────────────────────────────
+    def _sleep_before_retry(self, attempt: int) -> None:
+        # Full jitter: sleep somewhere in [0, backoff * 2^attempt]
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _send(self, path: str, params: dict) -> requests.Response:
+        """One request with bounded retries; raises ``WeatherError`` once they are used up."""
+        params = {**params, 'appid': self.api_key}
+        for attempt in range(self.retries + 1):
+            self._count('requests')
+            start = time.perf_counter()
+            try:
+                response = self.session.get(f'{self.base_url}/{path}', params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                response, error = None, e
+            else:
+                error = None
+            finally:
+                with self._metrics_lock:
+                    self._latencies.append(time.perf_counter() - start)
+
+            if response is not None and response.status_code not in self.RETRY_STATUS:
+                return response
+            if attempt < self.retries:
+                self._count('retries')
+                self._sleep_before_retry(attempt)
+
+        self._count('errors')
+        if error is not None:
+            raise WeatherError(f'Weather API unreachable: {error}') from error
+        raise WeatherError(f'Weather API error: {response.status_code}')
+
+    def _get(self, path: str, params: dict, location: str) -> dict:
+        """Request and parse through the circuit breaker.
+
+        Every outcome is reported to the breaker, including unexpected
+        exceptions, so a half-open probe can never leave it stuck. Every
+        non-2xx counts in ``errors``, but only ``CALLER_ERRORS`` (a bad key,
+        an unknown city) leave the breaker healthy.
+        """
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError('Weather service is temporarily unavailable (circuit open). Try again shortly.')
+
+        healthy = False
+        try:
+            response = self._send(path, params)
+            if not 200 <= response.status_code < 300:
+                self._count('errors')
+            healthy = response.status_code in self.CALLER_ERRORS
+            result = self._parse(response, location)
+            healthy = True
+            return result
+        finally:
+            if healthy:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def current(self, location: str, units: str = 'imperial') -> dict:
+        """Current weather for ``location``, in the same shape lab 5 has always used."""
+        return self._get('weather', {'q': location, 'units': units}, location)
+
+    def current_at(self, lat: float, lon: float, label: str, units: str = 'imperial') -> dict:
+        """Current weather by coordinates (no server-side name matching, so no 404s)."""
+        return self._get('weather', {'lat': lat, 'lon': lon, 'units': units}, label)
+
+    def _parse(self, response: requests.Response, location: str) -> dict:
+        if response.status_code == 401:
+            raise WeatherError('Authentication failed: Invalid API key (401 Unauthorized)')
+        if response.status_code == 404:
+            raise WeatherError(f'City not found: {location}. Try including the country code (e.g., "London, UK" or "Paris, France")')
+        if not 200 <= response.status_code < 300:
+            raise WeatherError(f'Weather API error: {response.status_code}')
+
+        data = response.json()
+        return {
+            'location': location,
+            'temperature': round(data['main']['temp'], 2),
+            'feels_like': round(data['main']['feels_like'], 2),
+            'temp_min': round(data['main']['temp_min'], 2),
+            'temp_max': round(data['main']['temp_max'], 2),
+            'humidity': round(data['main']['humidity'], 2),
+            'condition': data['weather'][0]['description'],
+        }
+
+
+_clients: dict[tuple, WeatherClient] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(api_key: str, base_url: str = OPENWEATHERMAP_URL) -> WeatherClient:
+    """One pooled client (and circuit breaker) per API key and endpoint, for the whole process."""
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            client = _clients[(api_key, base_url)] = WeatherClient(api_key, base_url=base_url)
+        return client
+
+
+def normalize_location(location: str) -> str:
+    """Canonical cache key form: lowercase, single spaces, no spaces around commas."""
+    location = re.sub(r"\s+", " ", str(location).strip().lower())
+    return re.sub(r"\s*,\s*", ",", location)
+
+
+class _Flight:
+    """One in-progress upstream request that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: BaseException | None = None
+
+
+class WeatherCache:
+    """TTL + LRU cache with single-flight request coalescing."""
+
+    def __init__(self, ttl: float = 600.0, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()   # key -> (expires_at, value)
+        self._inflight: dict = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "upstream": 0, "evictions": 0}
+
+    @staticmethod
+    def key(location: str, units: str) -> tuple:
+        return (normalize_location(location), units)
+
+    def get_or_fetch(self, location: str, units: str, fetch):
+        """Return the cached value for ``(location, units)`` or call ``fetch()`` once to fill it.
+
+        Errors raised by ``fetch`` are passed to every waiting caller and are
+        not cached.
+        """
+        return self.lookup(location, units, fetch)[0]
+
+    def lookup(self, location: str, units: str, fetch) -> tuple:
+        """``get_or_fetch`` plus how it was answered: ``"hit"``, ``"coalesced"`` or ``"miss"``."""
+        key = self.key(location, units)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1], "hit"
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                leader = True
+                self.stats["misses"] += 1
+                self.stats["upstream"] += 1
+            else:
+                leader = False
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "coalesced"
+
+        try:
+            flight.value = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._entries[key] = (time.monotonic() + self.ttl, flight.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                        self.stats["evictions"] += 1
+                del self._inflight[key]
+            flight.done.set()
+        return flight.value, "miss"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,7 +1,23 @@
+import hashlib
+
 import streamlit as st
-from langchain.chat_models import init_chat_model
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+
+from labs.instrumentation import event, instrument_chain, span
+from labs.lab6_recommend import (
+    GENRES,
+    MOODS,
+    PERSONAS,
+    RECOMMENDER_MODEL,
+    RECOMMENDER_PROVIDER,
+    RecommendationCache,
+    build_followup_chain,
+    build_recommendation_chain,
+)
+from labs.scheduler import client_options, schedule_chain
+from labs.startup import timed_import
+
+# Cached recommendations older than this are regenerated on the next click
+RECOMMENDATION_MAX_AGE = 7 * 24 * 3600
 
 # ── Page config ──────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -14,37 +30,48 @@ st.title("🎬 Movie Recommendation Chatbot")
 st.caption("Powered by LangChain · Anthropic Claude")
 
 # ── Part D: Model initialization ──────────────────────────────────────────────
-# Anthropic (default)
-llm = init_chat_model(
-    "claude-haiku-4-5-20251001",
-    model_provider="anthropic",
-    api_key=st.secrets["ANTHROPIC_API_KEY"],
-)
+# LangChain is only imported the first time a chain is actually needed (a
+# cache miss or a follow-up), so cached clicks never pay for it.
+@st.cache_resource(show_spinner=False)
+def get_chains(api_key: str) -> dict:
+    init_chat_model = timed_import("langchain.chat_models", "lab6").init_chat_model
+
+    # Anthropic (default)
+    llm = init_chat_model(
+        RECOMMENDER_MODEL,
+        model_provider=RECOMMENDER_PROVIDER,
+        api_key=api_key,
+        **client_options(),   # the scheduler retries 429s and 5xx itself
+    )
+
+    # OpenAI (Part D — swap by commenting the block above and uncommenting below)
+    # llm = init_chat_model(
+    #     "gpt-4o-mini",
+    #     model_provider="openai",
+    #     api_key=st.secrets["OPENAI_API_KEY"],
+    # )
+
+    chains = {
+        "recommendation": instrument_chain(
+            build_recommendation_chain(llm), page="lab6", model=RECOMMENDER_MODEL, name="recommendation"
+        ),
+        "followup": instrument_chain(
+            build_followup_chain(llm), page="lab6", model=RECOMMENDER_MODEL, name="followup"
+        ),
+    }
+    # Same per-model limits and fair queue as the SDK clients in labs.startup
+    return {name: schedule_chain(chain, RECOMMENDER_PROVIDER, RECOMMENDER_MODEL, page="lab6")
+            for name, chain in chains.items()}
 
-# OpenAI (Part D — swap by commenting the block above and uncommenting below)
-# llm = init_chat_model(
-#     "gpt-4o-mini",
-#     model_provider="openai",
-#     api_key=st.secrets["OPENAI_API_KEY"],
-# )
 
 # ── Part A: Sidebar controls ──────────────────────────────────────────────────
 st.sidebar.header("🎛️ Your Preferences")
 
-genre = st.sidebar.selectbox(
-    "Genre",
-    ["Action", "Comedy", "Horror", "Drama", "Sci-Fi", "Thriller", "Romance"],
-)
+genre = st.sidebar.selectbox("Genre", GENRES)
 
-mood = st.sidebar.selectbox(
-    "Your Mood",
-    ["Excited", "Happy", "Sad", "Bored", "Scared", "Romantic", "Curious", "Tense", "Melancholy"],
-)
+mood = st.sidebar.selectbox("Your Mood", MOODS)
 
-persona = st.sidebar.selectbox(
-    "Recommender Persona",
-    ["Film Critic", "Casual Friend", "Movie Journalist"],
-)
+persona = st.sidebar.selectbox("Recommender Persona", PERSONAS)
 
 st.sidebar.markdown("---")
 st.sidebar.markdown(
@@ -52,35 +79,35 @@ st.sidebar.markdown(
 )
 
 # ── Part B: Recommendation Chain ─────────────────────────────────────────────
+@st.cache_resource
+def get_recommendation_cache():
+    # Shared by every session; fill it offline with `python -m labs.lab6_recommend warm`
+    return RecommendationCache()
 
-recommendation_template = PromptTemplate(
-    input_variables=["genre", "mood", "persona"],
-    template="""You are a {persona}. A user is feeling {mood} and wants to watch a {genre} movie.
-
-Recommend exactly 3 movies that fit their mood and genre. For each movie, provide:
-- The movie title and release year
-- A 2–3 sentence description
-- Why it matches their current mood
-
-Write in the natural voice and tone of a {persona}. Be specific, opinionated, and genuine.
-""",
-)
 
-recommendation_chain = recommendation_template | llm | StrOutputParser()
+recommendation_cache = get_recommendation_cache()
 
 # Session state
 if "last_recommendation" not in st.session_state:
     st.session_state.last_recommendation = ""
+if "followup_answers" not in st.session_state:
+    # (sha256 of recommendation text, question) -> answer, so reruns never re-bill
+    st.session_state.followup_answers = {}
 
 # Recommendation button
 if st.button("🎥 Get Recommendations", type="primary"):
-    with st.spinner("Finding the perfect movies for you..."):
-        response = recommendation_chain.invoke({
-            "genre": genre,
-            "mood": mood,
-            "persona": persona,
-        })
-        st.session_state.last_recommendation = response
+    with span("cache", "recommendation", page="lab6") as cache_span:
+        response = recommendation_cache.get(genre, mood, persona, RECOMMENDER_MODEL, max_age=RECOMMENDATION_MAX_AGE)
+        cache_span["cache_hit"] = response is not None
+    if response is None:
+        with st.spinner("Finding the perfect movies for you..."):
+            response = get_chains(st.secrets["ANTHROPIC_API_KEY"])["recommendation"].invoke({
+                "genre": genre,
+                "mood": mood,
+                "persona": persona,
+            })
+        recommendation_cache.put(genre, mood, persona, RECOMMENDER_MODEL, response)
+    st.session_state.last_recommendation = response
 
 # Display recommendation
 if st.session_state.last_recommendation:
@@ -91,28 +118,23 @@ if st.session_state.last_recommendation:
 st.divider()
 follow_up = st.text_input("💬 Ask a follow-up question about these movies:")
 
-followup_template = PromptTemplate(
-    input_variables=["recommendations", "question"],
-    template="""Here are some movie recommendations that were given to a user:
-
-{recommendations}
-
-The user now has a follow-up question: {question}
-
-Answer the question helpfully and specifically, referencing the movies above where relevant.
-""",
-)
-
-followup_chain = followup_template | llm | StrOutputParser()
-
 if follow_up:
     if not st.session_state.last_recommendation:
         st.warning("Get recommendations first, then ask a follow-up question!")
     else:
-        with st.spinner("Looking that up..."):
-            followup_response = followup_chain.invoke({
+        memo_key = (
+            hashlib.sha256(st.session_state.last_recommendation.encode()).hexdigest(),
+            follow_up.strip(),
+        )
+        st.subheader("🔍 Follow-Up Answer")
+        memo_hit = memo_key in st.session_state.followup_answers
+        event("cache", "followup", page="lab6", cache_hit=memo_hit)
+        if memo_hit:
+            st.markdown(st.session_state.followup_answers[memo_key])
+        else:
+            followup_chain = get_chains(st.secrets["ANTHROPIC_API_KEY"])["followup"]
+            followup_response = st.write_stream(followup_chain.stream({
                 "recommendations": st.session_state.last_recommendation,
                 "question": follow_up,
-            })
-        st.subheader("🔍 Follow-Up Answer")
-        st.markdown(followup_response)
\ No newline at end of file
+            }))
+            st.session_state.followup_answers[memo_key] = followup_response
\ No newline at end of file
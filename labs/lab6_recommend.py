@@ -0,0 +1,195 @@
+"""
+Recommendation chain and cache for lab 6.
+
+The recommender has a small, finite input space (genre × mood × persona), so
+answers are cached in SQLite keyed by (genre, mood, persona, model). The page
+serves clicks from the cache and only calls the model on a miss or when an
+entry is older than the refresh age. The cache can be filled offline:
+
+    python -m labs.lab6_recommend warm --concurrency 8
+    python -m labs.lab6_recommend warm --refresh-older-than 86400
+"""
+
+import argparse
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+GENRES = ["Action", "Comedy", "Horror", "Drama", "Sci-Fi", "Thriller", "Romance"]
+MOODS = ["Excited", "Happy", "Sad", "Bored", "Scared", "Romantic", "Curious", "Tense", "Melancholy"]
+PERSONAS = ["Film Critic", "Casual Friend", "Movie Journalist"]
+
+RECOMMENDER_MODEL = "claude-haiku-4-5-20251001"
+RECOMMENDER_PROVIDER = "anthropic"
+CACHE_PATH = Path(__file__).parent / "lab6_data" / "recommendations.db"
+
+RECOMMENDATION_TEMPLATE = """You are a {persona}. A user is feeling {mood} and wants to watch a {genre} movie.
+
+Recommend exactly 3 movies that fit their mood and genre. For each movie, provide:
+- The movie title and release year
+- A 2–3 sentence description
+- Why it matches their current mood
+
+Write in the natural voice and tone of a {persona}. Be specific, opinionated, and genuine.
+"""
+
+FOLLOWUP_TEMPLATE = """Here are some movie recommendations that were given to a user:
+
+{recommendations}
+
+The user now has a follow-up question: {question}
+
+Answer the question helpfully and specifically, referencing the movies above where relevant.
+"""
+
+
+def build_recommendation_chain(llm):
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    template = PromptTemplate(
+        input_variables=["genre", "mood", "persona"],
+        template=RECOMMENDATION_TEMPLATE,
+    )
+    return template | llm | StrOutputParser()
+
+
+def build_followup_chain(llm):
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    template = PromptTemplate(
+        input_variables=["recommendations", "question"],
+        template=FOLLOWUP_TEMPLATE,
+    )
+    return template | llm | StrOutputParser()
+
+
+class RecommendationCache:
+    """SQLite-backed cache of recommendation text keyed by (genre, mood, persona, model)."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS recommendations (
+        genre       TEXT NOT NULL,
+        mood        TEXT NOT NULL,
+        persona     TEXT NOT NULL,
+        model       TEXT NOT NULL,
+        text        TEXT NOT NULL,
+        created_at  REAL NOT NULL,
+        PRIMARY KEY (genre, mood, persona, model)
+    )
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute(self.SCHEMA)
+        self.stats = {"hits": 0, "misses": 0, "stale": 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, genre: str, mood: str, persona: str, model: str, max_age: float | None = None) -> str | None:
+        """Cached text, or ``None`` if missing or older than ``max_age`` seconds."""
+        row = self._conn().execute(
+            "SELECT text, created_at FROM recommendations "
+            "WHERE genre = ? AND mood = ? AND persona = ? AND model = ?",
+            (genre, mood, persona, model),
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        if max_age is not None and time.time() - row[1] > max_age:
+            self.stats["stale"] += 1
+            return None
+        self.stats["hits"] += 1
+        return row[0]
+
+    def put(self, genre: str, mood: str, persona: str, model: str, text: str) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO recommendations VALUES (?, ?, ?, ?, ?, ?)",
+            (genre, mood, persona, model, text, time.time()),
+        )
+
+    def ages(self, model: str) -> dict[tuple, float]:
+        """Age in seconds of every cached (genre, mood, persona) for ``model``."""
+        now = time.time()
+        rows = self._conn().execute(
+            "SELECT genre, mood, persona, created_at FROM recommendations WHERE model = ?", (model,)
+        ).fetchall()
+        return {(g, m, p): now - t for g, m, p, t in rows}
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM recommendations").fetchone()[0]
+
+
+def warm(chain, cache: RecommendationCache, model: str = RECOMMENDER_MODEL,
+         concurrency: int = 8, refresh_older_than: float | None = None, batch_size: int = 32) -> dict:
+    """Fill ``cache`` for every missing (or stale) combination using ``chain.batch``.
+
+    Combinations are sent in batches of ``batch_size`` with at most
+    ``concurrency`` requests in flight, and each batch is written as soon as
+    it finishes so an interrupted warm-up keeps its progress.
+    """
+    ages = cache.ages(model)
+    todo = [
+        combo for combo in itertools.product(GENRES, MOODS, PERSONAS)
+        if combo not in ages or (refresh_older_than is not None and ages[combo] > refresh_older_than)
+    ]
+    done = failed = 0
+    for i in range(0, len(todo), batch_size):
+        batch = todo[i:i + batch_size]
+        outputs = chain.batch(
+            [{"genre": g, "mood": m, "persona": p} for g, m, p in batch],
+            config={"max_concurrency": concurrency},
+            return_exceptions=True,
+        )
+        for (g, m, p), out in zip(batch, outputs):
+            if isinstance(out, Exception):
+                failed += 1
+                continue
+            cache.put(g, m, p, model, out)
+            done += 1
+    return {"combinations": len(GENRES) * len(MOODS) * len(PERSONAS), "warmed": done, "failed": failed,
+            "skipped": len(GENRES) * len(MOODS) * len(PERSONAS) - len(todo)}
+
+
+def _anthropic_key() -> str:
+    key = os.getenv("ANTHROPIC_API_KEY", "")
+    secrets = Path(".streamlit") / "secrets.toml"
+    if not key and secrets.exists():
+        import tomllib
+        with open(secrets, "rb") as f:
+            key = tomllib.load(f).get("ANTHROPIC_API_KEY", "")
+    return key
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-compute lab 6 movie recommendations.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    w = sub.add_parser("warm", help="fill the cache for every genre × mood × persona")
+    w.add_argument("--concurrency", type=int, default=8)
+    w.add_argument("--refresh-older-than", type=float, default=None, metavar="SECONDS")
+    w.add_argument("--cache", default=str(CACHE_PATH))
+    args = parser.parse_args(argv)
+
+    from langchain.chat_models import init_chat_model
+
+    llm = init_chat_model(RECOMMENDER_MODEL, model_provider=RECOMMENDER_PROVIDER, api_key=_anthropic_key())
+    start = time.perf_counter()
+    report = warm(build_recommendation_chain(llm), RecommendationCache(args.cache),
+                  concurrency=args.concurrency, refresh_older_than=args.refresh_older_than)
+    print(f"{report} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
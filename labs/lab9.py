@@ -1,41 +1,82 @@
+import time
+
 import streamlit as st
-import json
-import os
-from anthropic import Anthropic
+
+from labs.lab9_compact import Compactor
+from labs.lab9_extract import ExtractionWorker
+from labs.lab9_memory import MemoryStore
+from labs.startup import get_anthropic_client
 
 # ── Page config ──────────────────────────────────────────────────────────────
 st.set_page_config(page_title="Long-Term Memory Chatbot", page_icon="🧠")
 
 # ── API client ───────────────────────────────────────────────────────────────
-client = Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
+client = get_anthropic_client(st.secrets["ANTHROPIC_API_KEY"], page="lab9")
 
-MEMORIES_FILE = "memories.json"
+MEMORIES_FILE = "memories.json"   # legacy store, imported once into MEMORIES_DB
+MEMORIES_DB   = "memories.db"
 MAIN_MODEL    = "claude-sonnet-4-20250514"
 EXTRACT_MODEL = "claude-haiku-4-5-20251001"   # cheap model for extraction
+MEMORY_TOP_K  = 8    # relevant memories injected per turn
+MEMORY_PINNED = 3    # always-on memories (e.g. the user's name)
+EXTRACT_BATCH = 4    # turns per background extraction call
+EXTRACT_WAIT  = 5.0  # seconds to wait for a batch to fill
+SIDEBAR_POLL  = 3    # seconds between sidebar memory refreshes
+COMPACT_EVERY = 50   # new memories between compaction passes
+COMPACT_AFTER = 3600 # ...or seconds, whichever comes first
 
 # ── Memory helpers ────────────────────────────────────────────────────────────
-def load_memories() -> list[str]:
-    if os.path.exists(MEMORIES_FILE):
-        with open(MEMORIES_FILE, "r") as f:
-            return json.load(f)
-    return []
+@st.cache_resource
+def get_memory_store() -> MemoryStore:
+    # Shared by every session in this server process
+    return MemoryStore(MEMORIES_DB, legacy_json=MEMORIES_FILE)
+
+@st.cache_resource
+def get_extraction_worker() -> ExtractionWorker:
+    # One background extraction thread per server process
+    return ExtractionWorker(
+        get_anthropic_client(st.secrets["ANTHROPIC_API_KEY"], page="lab9", name="extract"),
+        EXTRACT_MODEL,
+        get_memory_store(),
+        batch_size=EXTRACT_BATCH,
+        batch_wait=EXTRACT_WAIT,
+        compactor=Compactor(get_memory_store(), threshold=COMPACT_EVERY, interval=COMPACT_AFTER),
+    )
 
-def save_memories(memories: list[str]) -> None:
-    with open(MEMORIES_FILE, "w") as f:
-        json.dump(memories, f, indent=2)
+store = get_memory_store()
+extractor = get_extraction_worker()
+
+def load_memories() -> list[str]:
+    return store.load()
 
 # ── Sidebar ───────────────────────────────────────────────────────────────────
-st.sidebar.title("🧠 Long-Term Memory")
-memories = load_memories()
-if memories:
-    for i, mem in enumerate(memories, 1):
-        st.sidebar.markdown(f"**{i}.** {mem}")
-else:
-    st.sidebar.info("No memories yet. Start chatting!")
-
-if st.sidebar.button("🗑️ Clear All Memories"):
-    save_memories([])
-    st.rerun()
+# A fragment re-runs on its own timer, so facts extracted in the background
+# show up without rerunning the whole page.
+@st.fragment(run_every=SIDEBAR_POLL)
+def memory_sidebar():
+    memory_list = st.container()
+    if st.button("🗑️ Clear All Memories"):
+        store.clear()
+
+    with memory_list:
+        memories = load_memories()
+        if memories:
+            for i, mem in enumerate(memories, 1):
+                st.markdown(f"**{i}.** {mem}")
+        else:
+            st.info("No memories yet. Start chatting!")
+        if extractor.pending():
+            st.caption(f"⏳ {extractor.pending()} turn(s) waiting for memory extraction")
+        report = extractor.compactor.last_report
+        if report:
+            st.caption(
+                f"🧹 Last compaction: {report['duplicates']} duplicate(s), "
+                f"{report['superseded']} superseded, ~{report['tokens_saved']} tokens saved"
+            )
+
+with st.sidebar:
+    st.title("🧠 Long-Term Memory")
+    memory_sidebar()
 
 # ── Main UI ───────────────────────────────────────────────────────────────────
 st.title("🧠 Chatbot with Long-Term Memory")
@@ -44,6 +85,8 @@ st.caption("I remember facts about you across conversations — even after you r
 # ── Session state ─────────────────────────────────────────────────────────────
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "turn_timings" not in st.session_state:
+    st.session_state.turn_timings = []   # {"ttft": s, "total": s} per turn
 
 # Render chat history
 for msg in st.session_state.messages:
@@ -57,8 +100,8 @@ if prompt := st.chat_input("Say something…"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Build system prompt, injecting long-term memories
-    memories = load_memories()
+    # Build system prompt, injecting only the long-term memories relevant to this turn
+    memories = store.relevant(prompt, k=MEMORY_TOP_K, max_pinned=MEMORY_PINNED)
     system_prompt = (
         "You are a helpful, friendly assistant with long-term memory. "
         "You remember facts about the user from previous conversations."
@@ -72,52 +115,28 @@ if prompt := st.chat_input("Say something…"):
         )
 
     # ── Main LLM call ─────────────────────────────────────────────────────────
+    timing = {"ttft": None, "total": None}
+    started = time.perf_counter()
+
+    def stream_reply():
+        with client.messages.stream(
+            model=MAIN_MODEL,
+            max_tokens=1024,
+            system=system_prompt,
+            messages=st.session_state.messages,
+        ) as stream:
+            for text in stream.text_stream:
+                if timing["ttft"] is None:
+                    timing["ttft"] = time.perf_counter() - started
+                yield text
+
     with st.chat_message("assistant"):
-        with st.spinner("Thinking…"):
-            response = client.messages.create(
-                model=MAIN_MODEL,
-                max_tokens=1024,
-                system=system_prompt,
-                messages=st.session_state.messages,
-            )
-        reply = response.content[0].text
-        st.markdown(reply)
+        reply = st.write_stream(stream_reply())
+        timing["total"] = time.perf_counter() - started
+        st.caption(f"⏱️ first token {timing['ttft'] or 0:.2f}s · total {timing['total']:.2f}s")
 
     st.session_state.messages.append({"role": "assistant", "content": reply})
+    st.session_state.turn_timings.append(timing)
 
-    # ── Memory extraction (second LLM call) ───────────────────────────────────
-    existing = "\n".join(f"- {m}" for m in memories) if memories else "None yet."
-    extract_prompt = f"""You are a memory extraction assistant.
-
-Analyze the user message and assistant response below and identify any NEW facts
-worth remembering about the user — such as their name, location, occupation,
-hobbies, preferences, or personal details.
-
-Do NOT repeat facts already in the existing memories.
-Return ONLY a JSON array of short strings (one fact per string).
-If there is nothing new to remember, return an empty array: []
-
-Existing memories:
-{existing}
-
-User message: {prompt}
-Assistant response: {reply}
-
-Return ONLY valid JSON. No explanation, no markdown fences."""
-
-    try:
-        extract_resp = client.messages.create(
-            model=EXTRACT_MODEL,
-            max_tokens=256,
-            messages=[{"role": "user", "content": extract_prompt}],
-        )
-        raw = extract_resp.content[0].text.strip()
-        # Strip markdown fences if present
-        raw = raw.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
-        new_facts: list[str] = json.loads(raw)
-        if new_facts:
-            updated = memories + new_facts
-            save_memories(updated)
-            st.rerun()   # refresh sidebar
-    except (json.JSONDecodeError, Exception):
-        pass  # silently ignore extraction failures
+    # ── Memory extraction (background, batched) ───────────────────────────────
+    extractor.submit(prompt, reply)
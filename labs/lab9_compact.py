@@ -0,0 +1,186 @@
+"""
+Memory compaction for lab 9.
+
+Near-duplicates are found with MinHash signatures over word shingles and
+LSH banding, then confirmed with an exact Jaccard check. Contradictions are
+only detected for single-valued facts (name, home town, job, ...): when two
+memories fill the same slot, the newer one supersedes the older one.
+Everything runs locally — no model calls.
+"""
+
+import re
+import time
+import zlib
+
+from labs.instrumentation import estimate_tokens
+from labs.lab9_memory import MemoryStore
+
+NUM_HASHES    = 32
+BANDS         = 8       # NUM_HASHES / BANDS rows per band
+DUP_THRESHOLD = 0.75    # Jaccard similarity at which two memories are duplicates
+
+_PRIME = (1 << 61) - 1
+_HASH_PARAMS = [
+    (zlib.crc32(f"a{i}".encode()) | 1, zlib.crc32(f"b{i}".encode())) for i in range(NUM_HASHES)
+]
+
+ARTICLES = {"a", "an", "the"}
+
+# Facts that can only have one current value, as (slot, pattern) pairs. The
+# extractor usually writes "User lives in ...", but the subject is optional so
+# "Lives in ..." and "Name is ..." fill the same slots.
+_OWNER = r"^(?:(?:the )?user'?s? )?"   # "The user's", "User", or nothing
+_SUBJECT = r"^(?:(?:the )?user )?"      # "The user", "User", or nothing
+SINGLE_VALUED = [
+    (slot, re.compile(pattern, re.IGNORECASE)) for slot, pattern in (
+        ("name", _OWNER + r"name is\b"),
+        ("name", _SUBJECT + r"(?:is named|is called|goes by)\b"),
+        ("home", _SUBJECT + r"(?:lives|is based|resides) in\b"),
+        ("age", _OWNER + r"age is\b"),
+        ("age", _SUBJECT + r"is \d+ years old\b"),
+        ("job", _SUBJECT + r"(?:works|is employed) as\b"),
+        ("job", _OWNER + r"(?:job|occupation) is\b"),
+        ("major", _OWNER + r"major is\b"),
+        ("major", _SUBJECT + r"(?:studies|is majoring in)\b"),
+        ("pronouns", _OWNER + r"pronouns are\b"),
+    )
+]
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9' ]", " ", text.lower())).strip()
+
+
+def shingles(text: str) -> set[str]:
+    """Words plus word bigrams; memories are short, so this is plenty of signal."""
+    words = [w for w in normalize(text).split() if w not in ARTICLES]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])} or {""}
+
+
+def minhash(shingle_set: set[str]) -> list[int]:
+    hashed = [zlib.crc32(s.encode()) for s in shingle_set]
+    return [min((a * h + b) % _PRIME for h in hashed) for a, b in _HASH_PARAMS]
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def slot_of(text: str) -> str | None:
+    """The single-valued slot ``text`` fills, or ``None``."""
+    for slot, pattern in SINGLE_VALUED:
+        if pattern.search(text.strip()):
+            return slot
+    return None
+
+
+def find_duplicates(records: list[dict], threshold: float = DUP_THRESHOLD) -> dict[int, int]:
+    """Map of ``{removed_id: kept_id}`` for near-duplicate memories.
+
+    The newest memory of a group is kept, so a corrected fact ("lives in
+    Austin, TX") is never replaced by the stale wording it corrected.
+    """
+    sets = {r["id"]: shingles(r["text"]) for r in records}
+    rows = NUM_HASHES // BANDS
+    buckets: dict[tuple, list[int]] = {}
+    for r in records:
+        sig = minhash(sets[r["id"]])
+        for band in range(BANDS):
+            key = (band, tuple(sig[band * rows:(band + 1) * rows]))
+            buckets.setdefault(key, []).append(r["id"])
+
+    # Union-find so chains of duplicates collapse onto one survivor
+    parent = {r["id"]: r["id"] for r in records}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    checked = set()
+    for ids in buckets.values():
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                if (a, b) in checked:
+                    continue
+                checked.add((a, b))
+                if jaccard(sets[a], sets[b]) >= threshold:
+                    parent[find(a)] = find(b)
+
+    groups: dict[int, list[int]] = {}
+    for rid in parent:
+        groups.setdefault(find(rid), []).append(rid)
+
+    removed = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        keep = max(members)   # ids are assigned in insertion order
+        for m in members:
+            if m != keep:
+                removed[m] = keep
+    return removed
+
+
+def find_superseded(records: list[dict]) -> dict[int, int]:
+    """Map of ``{old_id: new_id}`` for single-valued facts that were overwritten."""
+    latest: dict[str, int] = {}
+    superseded = {}
+    for r in sorted(records, key=lambda r: r["id"]):
+        slot = slot_of(r["text"])
+        if slot is None:
+            continue
+        if slot in latest:
+            superseded[latest[slot]] = r["id"]
+        latest[slot] = r["id"]
+    return superseded
+
+
+def compact(store: MemoryStore) -> dict:
+    """Run one compaction pass over ``store`` and report what it removed."""
+    start = time.perf_counter()
+    records = store.records()
+    by_id = {r["id"]: r for r in records}
+
+    duplicates = find_duplicates(records)
+    remaining = [r for r in records if r["id"] not in duplicates]
+    superseded = find_superseded(remaining)
+
+    store.supersede({**duplicates, **superseded})
+    removed = list(duplicates) + list(superseded)
+    return {
+        "scanned": len(records),
+        "duplicates": len(duplicates),
+        "superseded": len(superseded),
+        # Each memory is injected as a "- " bullet line
+        "tokens_saved": sum(estimate_tokens(f"- {by_id[i]['text']}\n") for i in removed),
+        "seconds": round(time.perf_counter() - start, 3),
+        "at": time.time(),
+    }
+
+
+class Compactor:
+    """Decides when to compact: every ``interval`` seconds or ``threshold`` new memories."""
+
+    def __init__(self, store: MemoryStore, threshold: int = 50, interval: float = 3600.0):
+        self.store = store
+        self.threshold = threshold
+        self.interval = interval
+        self.last_report: dict | None = None
+        self._last_size = len(store)
+        self._last_run = time.time()
+
+    def maybe_compact(self) -> dict | None:
+        size = len(self.store)
+        due = (size - self._last_size >= self.threshold
+               or time.time() - self._last_run >= self.interval)
+        if not due:
+            return None
+        return self.run()
+
+    def run(self) -> dict:
+        self.last_report = compact(self.store)
+        self._last_size = len(self.store)
+        self._last_run = time.time()
+        return self.last_report
@@ -0,0 +1,124 @@
+"""
+Background memory extraction for lab 9.
+
+The chat page only enqueues finished turns; a single daemon thread per server
+process drains the queue, batches several turns into one extraction call and
+appends whatever facts come back to the ``MemoryStore``. The user never waits
+for extraction, and its calls queue behind chat at ``BACKGROUND`` priority.
+When a ``Compactor`` is attached, the same thread runs compaction once it is
+due.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from labs.lab9_compact import Compactor
+from labs.lab9_memory import MemoryStore
+from labs.scheduler import BACKGROUND, priority
+
+EXTRACT_PROMPT = """You are a memory extraction assistant.
+
+Analyze the conversation turns below and identify any NEW facts
+worth remembering about the user — such as their name, location, occupation,
+hobbies, preferences, or personal details.
+
+Do NOT repeat facts already in the existing memories.
+Return ONLY a JSON array of short strings (one fact per string).
+If there is nothing new to remember, return an empty array: []
+
+Existing memories:
+{existing}
+
+{turns}
+
+Return ONLY valid JSON. No explanation, no markdown fences."""
+
+
+def build_extract_prompt(turns: list[dict], existing: list[str]) -> str:
+    existing_block = "\n".join(f"- {m}" for m in existing) if existing else "None yet."
+    turns_block = "\n\n".join(
+        f"User message: {t['user']}\nAssistant response: {t['assistant']}" for t in turns
+    )
+    return EXTRACT_PROMPT.format(existing=existing_block, turns=turns_block)
+
+
+def parse_facts(raw: str) -> list[str]:
+    raw = raw.strip()
+    # Strip markdown fences if present
+    raw = raw.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    facts = json.loads(raw)
+    if not isinstance(facts, list):
+        return []
+    return [str(f) for f in facts if str(f).strip()]
+
+
+class ExtractionWorker:
+    """Daemon thread that batches chat turns into extraction calls.
+
+    A batch is sent once ``batch_size`` turns are waiting or ``batch_wait``
+    seconds have passed since the first turn of the batch arrived.
+    """
+
+    def __init__(self, client, model: str, store: MemoryStore,
+                 batch_size: int = 4, batch_wait: float = 5.0, existing_k: int = 20,
+                 compactor: Compactor | None = None):
+        self.client = client
+        self.model = model
+        self.store = store
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.existing_k = existing_k
+        self.compactor = compactor
+        self.queue: queue.Queue = queue.Queue()
+        self.failures = 0
+        self.calls = 0
+        self._thread = threading.Thread(target=self._run, name="lab9-extract", daemon=True)
+        self._thread.start()
+
+    def submit(self, user: str, assistant: str) -> None:
+        self.queue.put({"user": user, "assistant": assistant})
+
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+    def _next_batch(self) -> list[dict]:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        # A new thread starts with a fresh context, so the priority has to be set here
+        with priority(BACKGROUND):
+            while True:
+                batch = self._next_batch()
+                try:
+                    self.extract(batch)
+                    if self.compactor:
+                        self.compactor.maybe_compact()
+                except Exception:
+                    self.failures += 1  # extraction failures are never user-visible
+
+    def extract(self, turns: list[dict]) -> list[str]:
+        query = " ".join(f"{t['user']} {t['assistant']}" for t in turns)
+        existing = self.store.relevant(query, k=self.existing_k)
+        self.calls += 1
+        resp = self.client.messages.create(
+            model=self.model,
+            max_tokens=256 * len(turns),
+            messages=[{"role": "user", "content": build_extract_prompt(turns, existing)}],
+        )
+        facts = parse_facts(resp.content[0].text)
+        known = {m.lower() for m in self.store.load()}
+        facts = [f for f in facts if f.lower() not in known]
+        self.store.append(facts)
+        return facts
@@ -0,0 +1,278 @@
+"""
+Long-term memory store for lab 9.
+
+Memories live in a SQLite database in WAL mode so that several Streamlit
+sessions (and several server processes) can read and write at the same time.
+Writes are append-only inserts wrapped in a single transaction; nothing ever
+rewrites the whole file. Reads are served from an in-process cache that is
+only refreshed when the store's version counter moves.
+
+Each memory is embedded when it is written (a cheap, local hashed
+bag-of-words vector, so no extra API call) and the cache keeps an inverted
+index over those vectors. Prompts then only carry the memories relevant to
+the current message plus a small pinned set, instead of the whole store.
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from labs import hashing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    text        TEXT    NOT NULL,
+    created_at  REAL    NOT NULL,
+    deleted_at  REAL,
+    embedding   TEXT,
+    pinned      INTEGER NOT NULL DEFAULT 0,
+    superseded_by INTEGER
+);
+CREATE INDEX IF NOT EXISTS memories_active ON memories (deleted_at, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key    TEXT PRIMARY KEY,
+    value  INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+# Columns added after the first release of the store
+MIGRATIONS = {
+    "embedding": "ALTER TABLE memories ADD COLUMN embedding TEXT",
+    "pinned": "ALTER TABLE memories ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0",
+    "superseded_by": "ALTER TABLE memories ADD COLUMN superseded_by INTEGER",
+}
+
+# Nearly every extracted memory starts with "User ...", so it carries no signal
+STOPWORDS = hashing.STOPWORDS | {"user"}
+
+# Facts that should be in every prompt no matter what the user is asking about
+PINNED_PATTERN = re.compile(r"\b(name|called|goes by|pronouns?)\b", re.IGNORECASE)
+
+
+# ── Embeddings ───────────────────────────────────────────────────────────────
+def embed_text(text: str, dims: int = 1 << 20) -> dict[int, float]:
+    """Sparse hashed bag-of-words (unigrams + bigrams) with log term frequency."""
+    counts: dict[int, float] = {}
+    for feature, count in hashing.ngram_counts(text, STOPWORDS).items():
+        index, _ = hashing.bucket(feature, dims)
+        counts[index] = counts.get(index, 0.0) + count
+    return {k: 1.0 + math.log(v) for k, v in counts.items()}
+
+
+def is_pinned(fact: str) -> bool:
+    return bool(PINNED_PATTERN.search(fact))
+
+
+class MemoryIndex:
+    """Inverted index over memory embeddings, scored by TF-IDF cosine similarity."""
+
+    def __init__(self, records: list[dict]):
+        self.records = records
+        df: dict[int, int] = {}
+        for r in records:
+            for k in r["embedding"]:
+                df[k] = df.get(k, 0) + 1
+        n = len(records)
+        self.idf = {k: math.log((1 + n) / (1 + c)) + 1.0 for k, c in df.items()}
+
+        self.postings: dict[int, list[tuple[int, float]]] = {}
+        for pos, r in enumerate(records):
+            weighted = {k: v * self.idf[k] for k, v in r["embedding"].items()}
+            norm = math.sqrt(sum(v * v for v in weighted.values())) or 1.0
+            for k, v in weighted.items():
+                self.postings.setdefault(k, []).append((pos, v / norm))
+
+    def search(self, query: str, k: int) -> list[dict]:
+        """Top-``k`` records by similarity to ``query`` (only records sharing a term)."""
+        q = {f: w * self.idf[f] for f, w in embed_text(query).items() if f in self.idf}
+        if not q or k <= 0:
+            return []
+        norm = math.sqrt(sum(v * v for v in q.values()))
+        scores: dict[int, float] = {}
+        for f, w in q.items():
+            for pos, v in self.postings[f]:
+                scores[pos] = scores.get(pos, 0.0) + w * v / norm
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [dict(self.records[pos], score=score) for pos, score in best]
+
+
+class MemoryStore:
+    """Append-only, transactional memory store backed by SQLite (WAL mode)."""
+
+    def __init__(self, path: str, legacy_json: str | None = None, busy_timeout: float = 10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._cache_lock = threading.Lock()
+        self._cache_version = -1
+        self._cache: list[dict] = []
+        self._index: MemoryIndex | None = None
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        if legacy_json:
+            self._import_legacy_json(legacy_json)
+
+    # ── Connections ──────────────────────────────────────────────────────────
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; SQLite connections are not thread-safe."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Run ``fn(conn)`` inside a ``BEGIN IMMEDIATE`` transaction and bump the version.
+
+        ``BEGIN IMMEDIATE`` takes SQLite's write lock up front, so concurrent
+        writers queue on ``busy_timeout`` instead of losing each other's rows.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(memories)")}
+        for column, ddl in MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(ddl)
+        # Backfill embeddings for rows written before they existed
+        missing = conn.execute(
+            "SELECT id, text FROM memories WHERE embedding IS NULL AND deleted_at IS NULL"
+        ).fetchall()
+        if missing:
+            self._write(lambda c: c.executemany(
+                "UPDATE memories SET embedding = ?, pinned = ? WHERE id = ?",
+                [(json.dumps(embed_text(text)), int(is_pinned(text)), i) for i, text in missing],
+            ))
+
+    def _import_legacy_json(self, legacy_json: str) -> None:
+        """One-time import of the old ``memories.json`` file into an empty store."""
+        if not os.path.exists(legacy_json):
+            return
+        if self._conn().execute("SELECT 1 FROM memories LIMIT 1").fetchone():
+            return
+        try:
+            with open(legacy_json, "r") as f:
+                facts = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if facts:
+            self.append([str(f) for f in facts])
+
+    # ── Reads ────────────────────────────────────────────────────────────────
+    def version(self) -> int:
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _refresh(self) -> None:
+        current = self.version()
+        with self._cache_lock:
+            if current == self._cache_version:
+                return
+        rows = self._conn().execute(
+            "SELECT id, text, created_at, embedding, pinned FROM memories "
+            "WHERE deleted_at IS NULL ORDER BY id"
+        ).fetchall()
+        records = [
+            {
+                "id": r[0],
+                "text": r[1],
+                "created_at": r[2],
+                "embedding": {int(k): v for k, v in json.loads(r[3] or "{}").items()},
+                "pinned": bool(r[4]),
+            }
+            for r in rows
+        ]
+        index = MemoryIndex(records)
+        with self._cache_lock:
+            if current >= self._cache_version:
+                self._cache_version = current
+                self._cache = records
+                self._index = index
+
+    def records(self) -> list[dict]:
+        """Active memories as dicts (``id``, ``text``, ``created_at``, ``embedding``, ``pinned``), oldest first."""
+        self._refresh()
+        return self._cache
+
+    def relevant(self, query: str, k: int = 8, max_pinned: int = 3) -> list[str]:
+        """Pinned memories plus the ``k`` memories most relevant to ``query``.
+
+        The result size is bounded by ``k + max_pinned`` no matter how many
+        memories are stored, so the prompt stays flat as the store grows.
+        """
+        self._refresh()
+        pinned = [r for r in self._cache if r["pinned"]][-max_pinned:]
+        pinned_ids = {r["id"] for r in pinned}
+        hits = [r for r in self._index.search(query, k + len(pinned)) if r["id"] not in pinned_ids]
+        return [r["text"] for r in pinned] + [r["text"] for r in hits[:k]]
+
+    def load(self) -> list[str]:
+        return [r["text"] for r in self.records()]
+
+    def __len__(self) -> int:
+        return len(self.records())
+
+    # ── Writes ───────────────────────────────────────────────────────────────
+    def append(self, facts: list[str]) -> list[int]:
+        """Append new facts in one transaction and return their row ids."""
+        facts = [f.strip() for f in facts if f and f.strip()]
+        if not facts:
+            return []
+        now = time.time()
+
+        def insert(conn):
+            ids = []
+            for fact in facts:
+                cur = conn.execute(
+                    "INSERT INTO memories (text, created_at, embedding, pinned) VALUES (?, ?, ?, ?)",
+                    (fact, now, json.dumps(embed_text(fact)), int(is_pinned(fact))),
+                )
+                ids.append(cur.lastrowid)
+            return ids
+
+        return self._write(insert)
+
+    def delete(self, ids: list[int]) -> None:
+        """Soft-delete memories by id (the rows are kept, only flagged)."""
+        if not ids:
+            return
+        now = time.time()
+        self._write(lambda conn: conn.executemany(
+            "UPDATE memories SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL",
+            [(now, i) for i in ids],
+        ))
+
+    def supersede(self, replacements: dict[int, int]) -> None:
+        """Soft-delete ``old_id`` rows, recording the ``new_id`` that replaced each one."""
+        if not replacements:
+            return
+        now = time.time()
+        self._write(lambda conn: conn.executemany(
+            "UPDATE memories SET deleted_at = ?, superseded_by = ? "
+            "WHERE id = ? AND deleted_at IS NULL",
+            [(now, new, old) for old, new in replacements.items()],
+        ))
+
+    def clear(self) -> None:
+        now = time.time()
+        self._write(lambda conn: conn.execute(
+            "UPDATE memories SET deleted_at = ? WHERE deleted_at IS NULL", (now,)
+        ))
@@ -0,0 +1,137 @@
+"""
+Size-aware model routing for the document pages (labs 1 and 2).
+
+``complete`` estimates how many tokens the document and task need and how
+hard the task is. It then calls the cheapest model whose context window fits
+and whose quality tier meets that difficulty:
+
+    response, decision = complete(client, build_messages, document, task=question, page="lab1")
+    decision["model"], decision["reason"]
+
+If the API still rejects the prompt as too long (the 4-characters-per-token
+estimate is rough), the call is retried on the next model with a larger
+window. When no window is large enough, the document is cut to fit the
+largest one and ``decision["truncated"]`` is set. Every decision and fallback
+is recorded as a ``routing`` span.
+"""
+
+import re
+
+from labs.instrumentation import PRICES, estimate_tokens, event
+
+
+class ModelSpec:
+    """A routable chat model: context window, output limit and a coarse quality tier (1-3)."""
+
+    def __init__(self, name: str, context: int, max_output: int, quality: int):
+        self.name = name
+        self.context = context
+        self.max_output = max_output
+        self.quality = quality
+
+    @property
+    def price(self) -> float:
+        price_in, price_out = PRICES.get(self.name, (0.0, 0.0))
+        return price_in + price_out
+
+
+MODELS = [
+    ModelSpec("gpt-3.5-turbo", context=16_385, max_output=4_096, quality=1),
+    ModelSpec("gpt-4o-mini", context=128_000, max_output=16_384, quality=2),
+    ModelSpec("gpt-4o", context=128_000, max_output=16_384, quality=3),
+]
+
+# Words that suggest the answer needs reasoning across the document, not lookup
+HARD_TASK = re.compile(
+    r"\b(why|compare|contrast|analy[sz]e|evaluate|critique|implications?|infer|reason|argue|"
+    r"calculate|derive|prove|trade-?offs?|relationship|connect(?:ing)?)\b",
+    re.IGNORECASE,
+)
+SAFETY_MARGIN = 1.15   # the token estimate is rough; leave headroom inside the window
+MAX_SHRINKS = 3
+TRUNCATION_NOTE = "\n\n[… document truncated to fit the model's context window …]"
+
+
+def estimate_difficulty(task: str, document_tokens: int) -> int:
+    """Quality tier a task needs: 1 lookup/short summary, 2 default, 3 reasoning over a long document."""
+    hard = bool(HARD_TASK.search(task or ""))
+    if hard and document_tokens > 20_000:
+        return 3
+    if hard or document_tokens > 8_000:
+        return 2
+    return 1
+
+
+def route(input_tokens: int, quality: int = 1, output_tokens: int = 1024, models=MODELS) -> list[ModelSpec]:
+    """Models that fit and meet ``quality``, cheapest first; the first one is the choice."""
+    needed = int(input_tokens * SAFETY_MARGIN) + output_tokens
+    fits = [m for m in models if m.quality >= quality and m.context >= needed]
+    return sorted(fits, key=lambda m: (m.price, m.quality))
+
+
+def is_context_error(error: Exception) -> bool:
+    """Whether the API rejected the request for exceeding the model's context window."""
+    code = getattr(error, "code", None)
+    body = getattr(error, "body", None)
+    if code is None and isinstance(body, dict):
+        code = body.get("code") or (body.get("error") or {}).get("code")
+    text = str(error).lower()
+    return code == "context_length_exceeded" or "maximum context length" in text or "context_length" in text
+
+
+def truncate_to_tokens(document: str, tokens: int) -> str:
+    chars = max(0, tokens * 4 - len(TRUNCATION_NOTE))
+    return document if len(document) <= chars else document[:chars] + TRUNCATION_NOTE
+
+
+def complete(client, build_messages, document: str, task: str, page: str, min_quality: int = 1,
+             output_tokens: int = 1024, models=MODELS, **kwargs):
+    """Route, call and fall back; returns ``(response, decision)``.
+
+    ``build_messages(document)`` turns the (possibly truncated) document into
+    the chat messages, so the prompt is rebuilt whenever the document changes.
+    """
+    document_tokens = estimate_tokens(document)
+    overhead = estimate_tokens(" ".join(str(m["content"]) for m in build_messages(""))) + 16
+    quality = max(min_quality, estimate_difficulty(task, document_tokens))
+    candidates = route(document_tokens + overhead, quality, output_tokens, models)
+    decision = {
+        "input_tokens": document_tokens + overhead, "quality": quality, "truncated": False,
+        "fallbacks": [], "model": None, "reason": "",
+    }
+    if candidates:
+        decision["reason"] = f"cheapest model with quality ≥ {quality} that fits ~{document_tokens + overhead} tokens"
+    else:
+        # Nothing fits: use the largest window available at the highest quality, and cut the document
+        largest = max(models, key=lambda m: (m.context, m.quality))
+        budget = int((largest.context - output_tokens) / SAFETY_MARGIN) - overhead
+        document = truncate_to_tokens(document, budget)
+        decision.update(truncated=True, reason=f"~{document_tokens} tokens exceeds every window; truncated")
+        candidates = [largest]
+
+    tried, shrinks = set(), 0
+    while True:
+        model = candidates[0]
+        tried.add(model.name)
+        decision["model"] = model.name
+        event("routing", "decision", page, model.name, input_tokens=decision["input_tokens"], quality=quality,
+              truncated=decision["truncated"], fallback=len(decision["fallbacks"]), reason=decision["reason"])
+        try:
+            response = client.chat.completions.create(model=model.name, messages=build_messages(document), **kwargs)
+            return response, decision
+        except Exception as e:
+            if not is_context_error(e):
+                raise
+            decision["fallbacks"].append(model.name)
+            bigger = [m for m in models if m.context > model.context and m.name not in tried]
+            if bigger:
+                candidates = sorted(bigger, key=lambda m: (m.context, m.price))
+                decision["reason"] = f"{model.name} rejected the prompt as too long"
+                continue
+            # The largest window still refused: shrink the document by a quarter and retry
+            shrinks += 1
+            if shrinks > MAX_SHRINKS:
+                raise
+            document = truncate_to_tokens(document, int(estimate_tokens(document) * 0.75))
+            decision.update(truncated=True, reason=f"{model.name} rejected the prompt as too long; truncated")
+            candidates = [model]
@@ -0,0 +1,543 @@
+"""
+Process-wide scheduler for LLM and embedding calls.
+
+Every Streamlit session shares one server process, so without coordination
+a burst of users turns into a burst of 429s and SDK retries. Clients built
+by ``labs.startup`` send every call through the scheduler here:
+
+- each (provider, model) pair is a *lane* with a concurrency limit and a
+  tokens-per-minute budget (a token bucket refilled continuously);
+- waiting calls are ordered by priority class first (``INTERACTIVE`` chat
+  before ``BACKGROUND`` work such as ingestion), then by start-time fair
+  queueing across sessions. A session's tag grows with the tokens it has
+  asked for, so one heavy user can't starve the others;
+- a 429 pauses the lane for the server's ``retry-after`` instead of letting
+  every waiting call retry on its own. Scheduled clients are built with
+  ``max_retries=0`` (see ``client_options``), so the scheduler does the
+  retrying: a 429 rejoins the queue once the pause ends, and a 5xx or
+  connection error is retried after a short backoff.
+
+    with priority(BACKGROUND):
+        embedder.embed(chunks)            # queued behind any interactive call
+
+Limits default per provider and can be overridden per model with
+``LAB_SCHEDULER_LIMITS`` (JSON), e.g.
+``{"openai": {"concurrency": 8, "tpm": 200000}, "openai:gpt-4o": {"concurrency": 2, "tpm": 30000}}``.
+``LAB_SCHEDULER=0`` turns scheduling off. Every wait is recorded as a
+``scheduler`` span, and queue depth, in-flight calls and available tokens
+are exported as gauges on ``/metrics``.
+"""
+
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from labs.instrumentation import add_gauges, estimate_tokens, event
+
+INTERACTIVE, BACKGROUND = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+DEFAULT_LIMITS = {
+    "openai": {"concurrency": 8, "tpm": 200_000},
+    "anthropic": {"concurrency": 4, "tpm": 80_000},
+}
+DEFAULT_OUTPUT_TOKENS = 512   # reserved for a chat call that doesn't set max_tokens
+MAX_RETRIES = 2               # per call, for 429s, 5xx and connection errors
+RETRY_BACKOFF = 0.5           # seconds before the first retry of a 5xx, doubled each time
+ENABLED = os.getenv("LAB_SCHEDULER", "1") != "0"
+
+_priority: ContextVar[int] = ContextVar("lab_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Run the calls made inside the block at ``level`` (``INTERACTIVE`` or ``BACKGROUND``)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def session_id() -> str:
+    """The calling Streamlit session, or ``"background"`` outside a script run."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        ctx = None
+    return ctx.session_id if ctx is not None else "background"
+
+
+class Ticket:
+    """One queued or running call."""
+
+    def __init__(self, seq: int, level: int, start: float, tag: float, tokens: int, session: str):
+        self.seq = seq
+        self.level = level
+        self.start = start
+        self.tag = tag
+        self.tokens = tokens
+        self.session = session
+        self.enqueued = time.monotonic()
+        self.wait = 0.0
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.level, self.tag, self.seq) < (other.level, other.tag, other.seq)
+
+
+class Lane:
+    """Concurrency slots, token bucket and fair queue for one (provider, model)."""
+
+    def __init__(self, provider: str, model: str, concurrency: int, tpm: int):
+        self.provider = provider
+        self.model = model
+        self.concurrency = concurrency
+        self.tpm = tpm
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.waiting: list[Ticket] = []
+        self.virtual_time = 0.0
+        self.finish: dict[str, float] = {}
+        self.waits: deque = deque(maxlen=1000)
+        self.served = 0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(float(self.tpm), self.tokens + (now - self.updated) * self.tpm / 60.0)
+        self.updated = now
+
+    def depth(self, level: int | None = None) -> int:
+        return sum(1 for t in self.waiting if level is None or t.level == level)
+
+
+class Scheduler:
+    """Admits calls lane by lane; ``run`` is the only entry point pages need."""
+
+    def __init__(self, limits: dict | None = None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.lanes: dict[tuple[str, str], Lane] = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def lane(self, provider: str, model: str | None) -> Lane:
+        key = (provider, model or "")
+        with self._cond:
+            if key not in self.lanes:
+                limit = self.limits.get(f"{provider}:{model}") or self.limits.get(provider) or {}
+                self.lanes[key] = Lane(provider, model or "", int(limit.get("concurrency", 4)),
+                                       int(limit.get("tpm", 100_000)))
+            return self.lanes[key]
+
+    # Admission
+    def _dispatch(self, lane: Lane) -> float | None:
+        """Grant queued tickets while slots and tokens allow; returns seconds until the head could run."""
+        while lane.waiting:
+            if lane.in_flight >= lane.concurrency:
+                return None   # woken by release()
+            now = time.monotonic()
+            if now < lane.paused_until:
+                return lane.paused_until - now
+            lane.refill(now)
+            head = lane.waiting[0]
+            if lane.tokens < head.tokens:
+                return (head.tokens - lane.tokens) * 60.0 / lane.tpm
+            heapq.heappop(lane.waiting)
+            lane.in_flight += 1
+            lane.tokens -= head.tokens
+            lane.virtual_time = max(lane.virtual_time, head.start)
+            lane.served += 1
+            head.wait = now - head.enqueued
+            head.granted = True
+            lane.waits.append(head.wait)
+            if len(lane.finish) > 1000:
+                lane.finish = {s: f for s, f in lane.finish.items() if f > lane.virtual_time}
+            self._cond.notify_all()
+        return None
+
+    def acquire(self, provider: str, model: str | None, tokens: int, session: str | None = None,
+                level: int | None = None) -> tuple[Lane, Ticket, int]:
+        """Block until the call may start; returns its lane, ticket and the queue depth it joined."""
+        lane = self.lane(provider, model)
+        session = session or session_id()
+        level = _priority.get() if level is None else level
+        with self._cond:
+            tokens = max(1, min(int(tokens), lane.tpm))   # a call bigger than the budget still runs, alone
+            start = max(lane.virtual_time, lane.finish.get(session, 0.0))
+            ticket = Ticket(next(self._seq), level, start, start + tokens, tokens, session)
+            lane.finish[session] = ticket.tag
+            heapq.heappush(lane.waiting, ticket)
+            depth = len(lane.waiting)
+            while not ticket.granted:
+                delay = self._dispatch(lane)
+                if not ticket.granted:
+                    self._cond.wait(timeout=delay)
+        return lane, ticket, depth
+
+    def release(self, lane: Lane, ticket: Ticket, used_tokens: int | None = None) -> None:
+        with self._cond:
+            lane.in_flight -= 1
+            if used_tokens is not None:
+                lane.refill(time.monotonic())
+                lane.tokens = min(float(lane.tpm), lane.tokens + ticket.tokens - used_tokens)
+            self._dispatch(lane)
+            self._cond.notify_all()
+
+    def pause(self, lane: Lane, seconds: float) -> None:
+        """Hold the lane after a 429; queued calls wait instead of retrying."""
+        with self._cond:
+            lane.paused_until = max(lane.paused_until, time.monotonic() + seconds)
+            lane.tokens = min(lane.tokens, 0.0)
+            self._cond.notify_all()
+
+    def retry_delay(self, lane: Lane, error: Exception, attempt: int) -> float | None:
+        """Seconds to wait before retrying after ``error``, or ``None`` to give up.
+
+        A 429 pauses the lane and retries right away: the retry queues like
+        any other call until the pause ends.
+        """
+        if _is_rate_limit(error):
+            self.pause(lane, _retry_after(error))
+            return 0.0 if attempt < MAX_RETRIES else None
+        if _is_transient(error) and attempt < MAX_RETRIES:
+            return RETRY_BACKOFF * 2 ** attempt
+        return None
+
+    def run(self, provider: str, model: str | None, tokens: int, call, page: str, stream: bool = False,
+            usage=None, session: str | None = None):
+        """Call ``call()`` once its lane admits it, retrying 429s, 5xx and connection errors.
+
+        With ``stream`` the slot is held until the returned iterator is
+        exhausted, closed or garbage-collected, even if it was never
+        iterated. ``usage(response)`` may return the tokens the call actually
+        used, to settle the reservation.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            lane, ticket, depth = self.acquire(provider, model, tokens, session)
+            event("scheduler", "wait", page, model, seconds=round(ticket.wait, 6), queue_depth=depth,
+                  priority=PRIORITY_NAMES.get(ticket.level, ticket.level), reserved_tokens=ticket.tokens,
+                  attempt=attempt)
+            try:
+                response = call()
+                break
+            except Exception as e:
+                self.release(lane, ticket)
+                delay = self.retry_delay(lane, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+        if stream:
+            return self._held(response, lane, ticket)
+        used = None
+        if usage is not None:
+            try:
+                used = usage(response)
+            except Exception:
+                pass
+        self.release(lane, ticket, used)
+        return response
+
+    def _held(self, iterator, lane: Lane, ticket: Ticket):
+        return _HeldStream(self, iterator, lane, ticket)
+
+    # Reporting
+    def stats(self) -> list[dict]:
+        with self._cond:
+            now = time.monotonic()
+            rows = []
+            for lane in self.lanes.values():
+                lane.refill(now)
+                waits = sorted(lane.waits)
+                rows.append({
+                    "provider": lane.provider, "model": lane.model,
+                    "queued": {name: lane.depth(level) for level, name in PRIORITY_NAMES.items()},
+                    "in_flight": lane.in_flight, "concurrency": lane.concurrency,
+                    "tokens_available": int(lane.tokens), "tpm": lane.tpm, "served": lane.served,
+                    "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p95": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+                })
+            return rows
+
+    def prometheus_lines(self) -> list[str]:
+        rows = self.stats()
+        lines = []
+        for metric, help_text, value_of in (
+            ("lab_scheduler_queue_depth", "Calls waiting for a slot.", None),
+            ("lab_scheduler_in_flight", "Calls running.", lambda r: r["in_flight"]),
+            ("lab_scheduler_tokens_available", "Tokens left in the per-minute budget.",
+             lambda r: r["tokens_available"]),
+            ("lab_scheduler_wait_seconds_p95", "95th percentile queue wait.", lambda r: round(r["wait_p95"], 4)),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for r in rows:
+                labels = f'provider="{r["provider"]}",model="{r["model"]}"'
+                if value_of is None:
+                    for name, depth in r["queued"].items():
+                        lines.append(f'{metric}{{{labels},priority="{name}"}} {depth}')
+                else:
+                    lines.append(f"{metric}{{{labels}}} {value_of(r)}")
+        return lines
+
+
+class _HeldStream:
+    """A streamed response that releases its slot once exhausted, closed or garbage-collected.
+
+    Unlike a generator's ``finally``, the release also runs for a stream that
+    was never iterated.
+    """
+
+    def __init__(self, scheduler: Scheduler, iterator, lane: Lane, ticket: Ticket):
+        self._scheduler = scheduler
+        self._iterator = iterator
+        self._it = None
+        self._lane = lane
+        self._ticket = ticket
+        self._released = False
+        self._release_lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._released:
+            raise StopIteration
+        try:
+            if self._it is None:
+                self._it = iter(self._iterator)
+            return next(self._it)
+        except BaseException:
+            self.close()
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._iterator, name)   # e.g. the SDK stream's .response
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _release(self) -> bool:
+        with self._release_lock:
+            if self._released:
+                return False
+            self._released = True
+        self._scheduler.release(self._lane, self._ticket)
+        return True
+
+    def close(self) -> None:
+        if self._release():
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+
+    def __del__(self):
+        try:
+            self._release()
+        except Exception:
+            pass
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+def _is_transient(error: Exception) -> bool:
+    """A 5xx or a connection failure/timeout, which the SDKs would have retried themselves."""
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+def client_options() -> dict:
+    """Constructor options for an SDK client (or LangChain model) whose calls the scheduler retries."""
+    return {"max_retries": 0} if ENABLED else {}
+
+
+def _retry_after(error: Exception, default: float = 1.0) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """The process-wide scheduler, built from ``$LAB_SCHEDULER_LIMITS`` on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(json.loads(os.getenv("LAB_SCHEDULER_LIMITS", "") or "{}"))
+            add_gauges(_scheduler.prometheus_lines)
+        return _scheduler
+
+
+# ── Client wrappers ──────────────────────────────────────────────────────────
+def _message_tokens(messages) -> int:
+    return sum(estimate_tokens(str(m.get("content", ""))) if isinstance(m, dict) else 0 for m in messages or [])
+
+
+def _output_tokens(kwargs) -> int:
+    return kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or DEFAULT_OUTPUT_TOKENS
+
+
+def schedule_openai(client, page: str):
+    """Send ``chat.completions.create`` and ``embeddings.create`` through the scheduler."""
+    if not ENABLED or getattr(client, "_lab_scheduled", False):
+        return client
+    chat_create = client.chat.completions.create
+    embed_create = client.embeddings.create
+
+    def scheduled_chat(*args, **kwargs):
+        tokens = _message_tokens(kwargs.get("messages")) + _output_tokens(kwargs)
+        return get_scheduler().run(
+            "openai", kwargs.get("model"), tokens, lambda: chat_create(*args, **kwargs), page,
+            stream=bool(kwargs.get("stream")), usage=lambda r: r.usage.total_tokens,
+        )
+
+    def scheduled_embed(*args, **kwargs):
+        texts = kwargs.get("input")
+        texts = [texts] if isinstance(texts, str) else texts or []
+        tokens = sum(estimate_tokens(t) for t in texts if isinstance(t, str))
+        return get_scheduler().run(
+            "openai", kwargs.get("model"), tokens, lambda: embed_create(*args, **kwargs), page,
+            usage=lambda r: r.usage.total_tokens,
+        )
+
+    client.chat.completions.create = scheduled_chat
+    client.embeddings.create = scheduled_embed
+    client._lab_scheduled = True
+    return client
+
+
+class _ScheduledMessageStream:
+    """Holds a scheduler slot for the lifetime of a ``messages.stream(...)`` block."""
+
+    def __init__(self, open_stream, kwargs: dict, page: str):
+        self._open_stream = open_stream
+        self._kwargs = kwargs
+        self._page = page
+        self._manager = None
+        self._lane = self._ticket = None
+
+    def __enter__(self):
+        scheduler = get_scheduler()
+        model = self._kwargs.get("model")
+        tokens = _message_tokens(self._kwargs.get("messages")) + estimate_tokens(str(self._kwargs.get("system", "")))
+        for attempt in range(MAX_RETRIES + 1):
+            self._lane, self._ticket, depth = scheduler.acquire("anthropic", model,
+                                                                tokens + _output_tokens(self._kwargs))
+            event("scheduler", "wait", self._page, model, seconds=round(self._ticket.wait, 6), queue_depth=depth,
+                  priority=PRIORITY_NAMES.get(self._ticket.level), reserved_tokens=self._ticket.tokens,
+                  attempt=attempt)
+            try:
+                self._manager = self._open_stream()
+                return self._manager.__enter__()
+            except Exception as e:
+                scheduler.release(self._lane, self._ticket)
+                delay = scheduler.retry_delay(self._lane, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._manager.__exit__(exc_type, exc, tb)
+        finally:
+            get_scheduler().release(self._lane, self._ticket)
+            if exc is not None and _is_rate_limit(exc):
+                get_scheduler().pause(self._lane, _retry_after(exc))
+
+
+def schedule_anthropic(client, page: str):
+    """Send ``messages.create`` and ``messages.stream`` through the scheduler."""
+    if not ENABLED or getattr(client, "_lab_scheduled", False):
+        return client
+    create = client.messages.create
+    stream = client.messages.stream
+
+    def scheduled_create(*args, **kwargs):
+        tokens = (_message_tokens(kwargs.get("messages")) + estimate_tokens(str(kwargs.get("system", "")))
+                  + _output_tokens(kwargs))
+        return get_scheduler().run(
+            "anthropic", kwargs.get("model"), tokens, lambda: create(*args, **kwargs), page,
+            usage=lambda r: r.usage.input_tokens + r.usage.output_tokens,
+        )
+
+    def scheduled_stream(*args, **kwargs):
+        return _ScheduledMessageStream(lambda: stream(*args, **kwargs), kwargs, page)
+
+    client.messages.create = scheduled_create
+    client.messages.stream = scheduled_stream
+    client._lab_scheduled = True
+    return client
+
+
+class ScheduledChain:
+    """A LangChain runnable whose ``invoke``/``stream``/``batch`` calls go through the scheduler."""
+
+    def __init__(self, chain, provider: str, model: str, page: str):
+        self.chain = chain
+        self.provider = provider
+        self.model = model
+        self.page = page
+
+    def _tokens(self, inputs) -> int:
+        return estimate_tokens(json.dumps(inputs, default=str)) + DEFAULT_OUTPUT_TOKENS
+
+    def invoke(self, inputs, session: str | None = None, **kwargs):
+        return get_scheduler().run(self.provider, self.model, self._tokens(inputs),
+                                   lambda: self.chain.invoke(inputs, **kwargs), self.page, session=session)
+
+    def stream(self, inputs, **kwargs):
+        return get_scheduler().run(self.provider, self.model, self._tokens(inputs),
+                                   lambda: self.chain.stream(inputs, **kwargs), self.page, stream=True)
+
+    def batch(self, inputs, config=None, return_exceptions: bool = False, **kwargs):
+        """``invoke`` per item, each with its own slot and token reservation.
+
+        At most the lane's concurrency (or ``config["max_concurrency"]``, if
+        lower) items run at once. Items are queued under the calling session
+        and priority, since worker threads have neither.
+        """
+        inputs = list(inputs)
+        if not inputs:
+            return []
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        workers = get_scheduler().lane(self.provider, self.model).concurrency
+        max_concurrency = next((c.get("max_concurrency") for c in configs if c and c.get("max_concurrency")), None)
+        workers = min(len(inputs), workers, max_concurrency or workers)
+        session = session_id()
+
+        def one(item, item_config):
+            try:
+                return self.invoke(item, session=session, config=item_config, **kwargs)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lab-batch") as pool:
+            futures = [pool.submit(contextvars.copy_context().run, one, item, item_config)
+                       for item, item_config in zip(inputs, configs)]
+            return [future.result() for future in futures]
+
+
+def schedule_chain(chain, provider: str, model: str, page: str):
+    return ScheduledChain(chain, provider, model, page) if ENABLED else chain
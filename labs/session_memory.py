@@ -0,0 +1,238 @@
+"""
+Per-session memory accounting for ``st.session_state``.
+
+Every session keeps its own transcripts, retrieval results, recommendations
+and uploads, and nothing used to bound them. ``account_session`` runs after
+each page (see ``streamlit_app.py``) and, at most every
+``$LAB_SESSION_MEMORY_INTERVAL`` seconds per session:
+
+- measures each session-state key by walking it (containers, strings, bytes,
+  NumPy arrays, uploaded files). Opaque objects are counted shallowly, so
+  shared clients and collections aren't billed to every session;
+- records a ``memory`` span with the session's total and per-key sizes;
+- raises a ``growth`` alarm when the session's size keeps climbing faster
+  than ``$LAB_SESSION_GROWTH_KB_PER_MIN`` over its recent samples;
+- compacts keys over ``$LAB_SESSION_KEY_CAP_MB``, and then the largest keys
+  while the session is over ``$LAB_SESSION_CAP_MB``. Only keys with a policy
+  in ``POLICIES`` are touched (trim a transcript, drop cached results);
+  anything else is only reported.
+
+Live totals are exported on ``/metrics`` as aggregates, never per session
+(``lab_sessions``, ``lab_session_bytes`` total and max, the largest keys in
+``lab_session_key_bytes``, ``lab_session_memory_alarms_total``).
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from labs.instrumentation import add_gauges, event, label_value
+from labs.scheduler import session_id
+
+INTERVAL = float(os.getenv("LAB_SESSION_MEMORY_INTERVAL", 10))
+KEY_CAP = float(os.getenv("LAB_SESSION_KEY_CAP_MB", 20)) * 1024 * 1024
+SESSION_CAP = float(os.getenv("LAB_SESSION_CAP_MB", 100)) * 1024 * 1024
+GROWTH_ALARM = float(os.getenv("LAB_SESSION_GROWTH_KB_PER_MIN", 512)) * 1024 / 60   # bytes per second
+TREND_SAMPLES = 6
+IDLE_AFTER = 3600   # forget sessions not seen for an hour
+TOP_KEYS = 20       # per-key series on /metrics; the rest are summed into one
+
+CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+LEAVES = (str, bytes, bytearray, int, float, bool, type(None))
+
+
+def deep_size(obj, seen: set | None = None) -> int:
+    """Approximate bytes held by ``obj`` and what it contains, each object counted once."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, LEAVES):
+        return sys.getsizeof(obj)
+    if hasattr(obj, "nbytes") and hasattr(obj, "base"):   # NumPy array; views share their base's buffer
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    if isinstance(obj, io.BytesIO):   # st.file_uploader's UploadedFile
+        return sys.getsizeof(obj) + obj.getbuffer().nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return size + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, CONTAINERS):
+        return size + sum(deep_size(item, seen) for item in obj)
+    return size   # clients, collections, widgets: shared or opaque, count the shell only
+
+
+# ── Compaction policies ──────────────────────────────────────────────────────
+def trim_list(keep: int):
+    """Keep leading system messages and the newest ``keep`` items."""
+    def policy(value):
+        if not isinstance(value, list) or len(value) <= keep:
+            return value
+        head = [m for m in value[:1] if isinstance(m, dict) and m.get("role") == "system"]
+        return head + value[-keep:]
+    return policy
+
+
+def trim_dict(keep: int):
+    """Keep the newest ``keep`` entries (dicts preserve insertion order)."""
+    def policy(value):
+        if not isinstance(value, dict) or len(value) <= keep:
+            return value
+        return dict(list(value.items())[-keep:])
+    return policy
+
+
+def drop(value):
+    return None
+
+
+POLICIES = {
+    "messages": trim_list(40),
+    "turn_timings": trim_list(200),
+    "followup_answers": trim_dict(20),
+    "last_results": drop,
+}
+
+
+def _compact(state, key: str) -> bool:
+    policy = POLICIES.get(key)
+    if policy is None:
+        return False
+    compacted = policy(state[key])
+    if compacted is None:
+        del state[key]
+    elif compacted is not state[key]:
+        state[key] = compacted
+    else:
+        return False
+    return True
+
+
+# ── Accounting ───────────────────────────────────────────────────────────────
+class SessionRecord:
+    def __init__(self, session: str):
+        self.session = session
+        self.checked = 0.0
+        self.total = 0
+        self.keys: dict[str, int] = {}
+        self.samples: deque = deque(maxlen=TREND_SAMPLES)
+        self.alarms = 0
+        self.compactions = 0
+
+
+_lock = threading.Lock()
+_sessions: dict[str, SessionRecord] = {}
+_alarms = 0
+
+
+def measure(state) -> dict[str, int]:
+    """Bytes per session-state key, largest first."""
+    sizes = {}
+    seen: set = set()
+    for key in list(state.keys()):
+        try:
+            sizes[str(key)] = deep_size(state[key], seen)
+        except Exception:
+            continue   # a key removed or widget not yet materialised mid-run
+    return dict(sorted(sizes.items(), key=lambda kv: -kv[1]))
+
+
+def growth_rate(samples) -> float:
+    """Least-squares slope of (time, bytes) samples in bytes per second; 0 if not clearly rising."""
+    if len(samples) < TREND_SAMPLES:
+        return 0.0
+    t = [s[0] - samples[0][0] for s in samples]
+    b = [s[1] for s in samples]
+    rises = sum(later > earlier for earlier, later in zip(b, b[1:]))
+    if t[-1] <= 0 or rises < len(b) - 2:   # needs a mostly monotonic climb
+        return 0.0
+    t_mean, b_mean = sum(t) / len(t), sum(b) / len(b)
+    return (sum((ti - t_mean) * (bi - b_mean) for ti, bi in zip(t, b))
+            / sum((ti - t_mean) ** 2 for ti in t))
+
+
+def account_session(state, page: str, force: bool = False) -> SessionRecord | None:
+    """Measure, alarm on and cap the calling session's ``state``; rate-limited per session."""
+    global _alarms
+    session = session_id()
+    now = time.time()
+    with _lock:
+        record = _sessions.setdefault(session, SessionRecord(session))
+        if not force and now - record.checked < INTERVAL:
+            return None
+        record.checked = now
+        for stale in [s for s, r in _sessions.items() if now - r.checked > IDLE_AFTER]:
+            del _sessions[stale]
+
+    sizes = measure(state)
+    compacted = []
+    for key, size in sizes.items():
+        if size > KEY_CAP and _compact(state, key):
+            compacted.append(key)
+    remaining = sum(size for key, size in sizes.items() if key not in compacted)
+    if remaining > SESSION_CAP:
+        for key in sizes:   # largest first
+            if key not in compacted and _compact(state, key):
+                compacted.append(key)
+                remaining -= sizes[key]
+                if remaining <= SESSION_CAP:
+                    break
+    total = sum(sizes.values())
+    if compacted:
+        sizes = measure(state)
+        total = sum(sizes.values())
+
+    with _lock:
+        record.total, record.keys = total, sizes
+        record.samples.append((now, total))
+        record.compactions += len(compacted)
+        rate = growth_rate(record.samples)
+        alarm = rate > GROWTH_ALARM
+        if alarm:
+            record.alarms += 1
+            _alarms += 1
+            record.samples.clear()   # don't re-alarm on the same climb
+
+    top = dict(list(sizes.items())[:10])
+    event("memory", "session", page, bytes=total, keys=top, compacted=compacted or None)
+    if alarm:
+        event("memory", "growth", page, bytes=total, bytes_per_min=round(rate * 60), keys=top,
+              error="SessionMemoryGrowth")
+    return record
+
+
+def sessions() -> list[dict]:
+    with _lock:
+        return [{"session": r.session, "bytes": r.total, "keys": dict(r.keys), "alarms": r.alarms,
+                 "compactions": r.compactions} for r in _sessions.values()]
+
+
+def prometheus_lines() -> list[str]:
+    """Aggregates over sessions and the ``TOP_KEYS`` largest keys, so series don't grow with traffic."""
+    rows = sessions()
+    sizes = [r["bytes"] for r in rows]
+    lines = ["# HELP lab_sessions Sessions seen in the last hour.", "# TYPE lab_sessions gauge",
+             f"lab_sessions {len(rows)}",
+             "# HELP lab_session_bytes Session-state size over live sessions.", "# TYPE lab_session_bytes gauge",
+             f'lab_session_bytes{{stat="total"}} {sum(sizes)}',
+             f'lab_session_bytes{{stat="max"}} {max(sizes, default=0)}']
+    per_key: dict[str, int] = {}
+    for r in rows:
+        for key, size in r["keys"].items():
+            per_key[key] = per_key.get(key, 0) + size
+    ranked = sorted(per_key.items(), key=lambda kv: -kv[1])
+    top, rest = ranked[:TOP_KEYS], sum(v for _, v in ranked[TOP_KEYS:])
+    lines += ["# HELP lab_session_key_bytes Session-state size per key, summed over sessions "
+              f"(largest {TOP_KEYS}, the rest as key=\"_other\").",
+              "# TYPE lab_session_key_bytes gauge"]
+    lines += [f'lab_session_key_bytes{{key="{label_value(k)}"}} {v}' for k, v in top]
+    if rest:
+        lines.append(f'lab_session_key_bytes{{key="_other"}} {rest}')
+    lines += ["# HELP lab_session_memory_alarms_total Sessions flagged for sustained growth.",
+              "# TYPE lab_session_memory_alarms_total counter", f"lab_session_memory_alarms_total {_alarms}"]
+    return lines
+
+
+add_gauges(prometheus_lines)
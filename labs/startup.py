@@ -0,0 +1,259 @@
+"""
+Cold-start helpers: lazily built SDK clients, optional warm-up and an
+import-time report.
+
+Heavy SDKs (openai, anthropic, chromadb, langchain, the PDF readers) are
+imported inside the getters below rather than at the top of a page, so a page
+only pays for an import on the code path that uses it, and each client is
+built once per server process instead of on every rerun (keys typed into a
+page get a per-session client instead):
+
+    client = get_openai_client(st.secrets["OPENAI_API_KEY"], page="lab3")
+
+Set ``LAB_WARMUP`` to import heavy modules on a background thread as soon as
+the server starts (``1`` for all of them, or a comma-separated list):
+
+    LAB_WARMUP=1 streamlit run streamlit_app.py
+    LAB_WARMUP=openai,anthropic streamlit run streamlit_app.py
+
+Per-page import cost, each page measured in a fresh interpreter:
+
+    python -m labs.startup report
+"""
+
+import argparse
+import ast
+import hashlib
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import streamlit as st
+
+from labs.instrumentation import instrument_anthropic, instrument_openai, span
+from labs.scheduler import client_options, schedule_anthropic, schedule_openai
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["openai", "anthropic", "chromadb", "langchain_core", "langchain.chat_models", "PyPDF2", "pypdf"]
+
+# Modules the getters below import on first use, for the report
+GETTER_MODULES = {"get_openai_client": "openai", "get_anthropic_client": "anthropic", "get_chroma_client": "chromadb"}
+
+
+def use_pysqlite3() -> None:
+    """Swap in ``pysqlite3`` for chromadb on hosts whose sqlite3 is too old (e.g. Streamlit Cloud)."""
+    if "pysqlite3" in sys.modules:
+        return
+    try:
+        import pysqlite3
+    except ImportError:
+        return
+    sys.modules["sqlite3"] = pysqlite3
+
+
+def timed_import(module: str, page: str = "startup"):
+    """Import ``module``, recording an ``import`` span the first time it is loaded."""
+    if module in sys.modules:
+        return sys.modules[module]
+    if module.split(".")[0] == "chromadb":
+        use_pysqlite3()
+    with span("import", module, page=page):
+        return importlib.import_module(module)
+
+
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+def warm_up(modules: list[str] | None = None) -> threading.Thread | None:
+    """Import ``modules`` (default: ``$LAB_WARMUP``) on a daemon thread; no-op when empty.
+
+    Runs once per process: ``streamlit_app.py`` calls this on every rerun, and
+    later calls return ``None`` without retrying imports that failed.
+    """
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return None
+        _warmup_started = True
+    if modules is None:
+        setting = os.getenv("LAB_WARMUP", "").strip()
+        if setting.lower() in ("", "0", "false", "no"):
+            return None
+        modules = HEAVY_MODULES if setting.lower() in ("1", "true", "yes", "all") else setting.split(",")
+
+    def run():
+        for module in modules:
+            try:
+                timed_import(module.strip(), page="warmup")
+            except Exception:
+                pass   # an optional dependency that isn't installed
+
+    thread = threading.Thread(target=run, name="lab-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+# ── Clients ──────────────────────────────────────────────────────────────────
+# Clients for the key in secrets/env are built once per server process. A key
+# typed into a page (lab 1) never enters the process-wide cache: its client
+# lives in that session's state and goes away with the session.
+def _is_configured_key(api_key: str, name: str) -> bool:
+    try:
+        configured = st.secrets.get(name, "")
+    except Exception:
+        configured = ""   # no secrets file: lab 1 runs on typed keys alone
+    return bool(api_key) and api_key == (configured or os.getenv(name, ""))
+
+
+def _session_client(sdk: str, page: str, api_key: str, build):
+    """One client per SDK and page in this session, rebuilt when the key changes."""
+    if "_api_clients" not in st.session_state:
+        st.session_state._api_clients = {}
+    clients = st.session_state._api_clients
+    fingerprint = hashlib.sha256(api_key.encode()).hexdigest()
+    cached = clients.get((sdk, page))
+    if cached is None or cached[0] != fingerprint:
+        cached = clients[(sdk, page)] = (fingerprint, build())
+    return cached[1]
+
+
+def _build_openai_client(api_key: str, page: str):
+    openai = timed_import("openai", page)
+    client = instrument_openai(openai.OpenAI(api_key=api_key, **client_options()), page=page)
+    return schedule_openai(client, page=page)
+
+
+def _build_anthropic_client(api_key: str, page: str, name: str):
+    anthropic = timed_import("anthropic", page)
+    client = instrument_anthropic(anthropic.Anthropic(api_key=api_key, **client_options()), page=page, name=name)
+    return schedule_anthropic(client, page=page)
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_openai_client(api_key: str, page: str):
+    return _build_openai_client(api_key, page)
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_anthropic_client(api_key: str, page: str, name: str):
+    return _build_anthropic_client(api_key, page, name)
+
+
+def get_openai_client(api_key: str, page: str):
+    if _is_configured_key(api_key, "OPENAI_API_KEY"):
+        return _shared_openai_client(api_key, page)
+    return _session_client("openai", page, api_key, lambda: _build_openai_client(api_key, page))
+
+
+def get_anthropic_client(api_key: str, page: str, name: str = "create"):
+    if _is_configured_key(api_key, "ANTHROPIC_API_KEY"):
+        return _shared_anthropic_client(api_key, page, name)
+    return _session_client(f"anthropic-{name}", page, api_key,
+                           lambda: _build_anthropic_client(api_key, page, name))
+
+
+@st.cache_resource(show_spinner=False)
+def get_chroma_client(path: str):
+    chromadb = timed_import("chromadb", "lab4")
+    return chromadb.PersistentClient(path=path)
+
+
+# ── Import-time report ───────────────────────────────────────────────────────
+_MEASURE = """
+import importlib, json, sys, time
+import streamlit
+out = {}
+for name in json.loads(sys.argv[1]):
+    start = time.perf_counter()
+    try:
+        importlib.import_module(name)
+        out[name] = time.perf_counter() - start
+    except Exception as e:
+        out[name] = type(e).__name__
+print(json.dumps(out))
+"""
+
+
+def page_imports(path) -> tuple[list[str], list[str]]:
+    """(imports paid on every render, imports deferred into functions/branches) of a page."""
+    tree = ast.parse(Path(path).read_text())
+    eager, deferred = [], []
+    # Nodes that run on every render: top-level imports and unconditional statements
+    top = {id(n) for stmt in tree.body if isinstance(stmt, (ast.Import, ast.ImportFrom, ast.Assign, ast.Expr))
+           for n in ast.walk(stmt)}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in GETTER_MODULES:
+            names = [GETTER_MODULES[node.id]]
+        elif (isinstance(node, ast.Call) and getattr(node.func, "id", None) == "timed_import"
+              and node.args and isinstance(node.args[0], ast.Constant)):
+            names = [node.args[0].value]
+        elif isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            if name.split(".")[0] != "streamlit":
+                target = eager if id(node) in top else deferred
+                if name not in target:
+                    target.append(name)
+    deferred = [name for name in deferred if name not in eager]
+    return eager, deferred
+
+
+def measure(modules: list[str]) -> dict:
+    """Seconds to import each module in turn in a fresh interpreter (after streamlit)."""
+    if not modules:
+        return {}
+    out = subprocess.run(
+        [sys.executable, "-c", _MEASURE, json.dumps(modules)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def report() -> list[dict]:
+    source = (ROOT / "streamlit_app.py").read_text()
+    pages = ["streamlit_app.py"] + re.findall(r"st\.Page\(\s*['\"]([^'\"]+)['\"]", source)
+    rows = []
+    for page in pages:
+        eager, deferred = page_imports(ROOT / page)
+        timings = measure(eager + deferred)
+        loaded = {n: t for n, t in timings.items() if isinstance(t, float)}
+        rows.append({
+            "page": page,
+            "eager_seconds": sum(t for n, t in loaded.items() if n in eager),
+            "deferred_seconds": sum(t for n, t in loaded.items() if n in deferred),
+            "slowest": sorted(((t, n) for n, t in loaded.items()), reverse=True)[:3],
+            "missing": [n for n, t in timings.items() if not isinstance(t, float)],
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-page import-time report.")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    rows = report()
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'page':<22} {'first render':>12} {'deferred':>9}  slowest imports")
+    for r in rows:
+        slowest = ", ".join(f"{n} {t:.2f}s" for t, n in r["slowest"])
+        missing = f"  (not installed: {', '.join(r['missing'])})" if r["missing"] else ""
+        print(f"{r['page']:<22} {r['eager_seconds']:>11.2f}s {r['deferred_seconds']:>8.2f}s  {slowest}{missing}")
+
+
+if __name__ == "__main__":
+    main()
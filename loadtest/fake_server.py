@@ -0,0 +1,312 @@
+"""
+Local stand-in for the OpenAI, Anthropic and OpenWeatherMap APIs.
+
+Responses are deterministic (seeded from the request body), latency follows a
+log-normal distribution, streaming runs at a fixed tokens/second, and a
+configurable fraction of requests fail with 500 or 429. Point the app at it
+with the SDKs' own environment variables:
+
+    python -m loadtest.fake_server --port 8765 --latency-ms 300 --tokens-per-sec 80
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 \\
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 \\
+    WEATHER_API_URL=http://127.0.0.1:8765/data/2.5 \\
+    streamlit run streamlit_app.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "weather jacket layers sunny rain wind coat boots scarf hike park museum movie classic "
+    "thriller drama comedy syllabus course grade exam project python data analysis memory "
+    "friendly helpful warm light cozy bright outdoor indoor walk run bike picnic coffee"
+).split()
+
+
+class FakeConfig:
+    def __init__(self, latency_ms=200.0, latency_sigma=0.5, tokens_per_sec=100.0,
+                 error_rate=0.0, rate_limit_rate=0.0, reply_tokens=60, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.reply_tokens = reply_tokens
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts: dict[str, int] = {}
+
+    def latency(self) -> float:
+        """Log-normal latency in seconds with median ``latency_ms``."""
+        with self._lock:
+            return self.latency_ms / 1000 * math.exp(self._rng.gauss(0, self.latency_sigma))
+
+    def roll(self) -> int | None:
+        """Status code to fail with, or ``None`` to succeed."""
+        with self._lock:
+            r = self._rng.random()
+        if r < self.rate_limit_rate:
+            return 429
+        if r < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+
+def seeded(*parts) -> random.Random:
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def fake_text(rng: random.Random, n: int) -> list[str]:
+    return [rng.choice(WORDS) + " " for _ in range(n)]
+
+
+def fake_embedding(text: str, dims: int) -> list[float]:
+    rng = seeded("embedding", text)
+    vec = [rng.gauss(0, 1) for _ in range(dims)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeConfig = FakeConfig()
+
+    def log_message(self, *args):
+        pass
+
+    # ── Plumbing ─────────────────────────────────────────────────────────────
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sse_start(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _sse(self, data: str, event: str | None = None) -> None:
+        frame = (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+        raw = frame.encode()
+        self.wfile.write(f"{len(raw):X}\r\n".encode() + raw + b"\r\n")
+        self.wfile.flush()
+
+    def _sse_end(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _gate(self, route: str) -> bool:
+        """Apply latency and injected failures; ``False`` means a failure was sent."""
+        self.config.count(route)
+        time.sleep(self.config.latency())
+        status = self.config.roll()
+        if status is None:
+            return True
+        self._json(status, {"error": {"type": "rate_limit_error" if status == 429 else "api_error",
+                                      "message": f"fake {status}"}})
+        return False
+
+    def _token_sleep(self) -> None:
+        if self.config.tokens_per_sec > 0:
+            time.sleep(1 / self.config.tokens_per_sec)
+
+    # ── Routes ───────────────────────────────────────────────────────────────
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.endswith("/models"):
+            return self._json(200, {"object": "list", "data": [{"id": "gpt-4o", "object": "model"}]})
+        if url.path.endswith("/weather"):
+            return self.weather(parse_qs(url.query))
+        if url.path == "/stats":
+            return self._json(200, self.config.counts)
+        self._json(404, {"message": "not found"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if path.endswith("/chat/completions"):
+            return self.openai_chat(body)
+        if path.endswith("/embeddings"):
+            return self.openai_embeddings(body)
+        if path.endswith("/messages"):
+            return self.anthropic_messages(body)
+        self._json(404, {"error": {"message": "not found"}})
+
+    def weather(self, query: dict) -> None:
+        if not self._gate("weather"):
+            return
+        location = query.get("q", [""])[0] or f"{query.get('lat', ['0'])[0]},{query.get('lon', ['0'])[0]}"
+        if "nowhere" in location.lower():
+            return self._json(404, {"cod": "404", "message": "city not found"})
+        rng = seeded("weather", location.lower())
+        temp = round(rng.uniform(10, 90), 2)
+        self._json(200, {
+            "name": location,
+            "main": {"temp": temp, "feels_like": temp - 2, "temp_min": temp - 5,
+                     "temp_max": temp + 5, "humidity": rng.randint(20, 95)},
+            "weather": [{"description": rng.choice(["clear sky", "light rain", "overcast clouds", "snow"])}],
+        })
+
+    def openai_embeddings(self, body: dict) -> None:
+        if not self._gate("openai.embeddings"):
+            return
+        inputs = body.get("input", "")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        dims = int(body.get("dimensions") or 1536)
+        self._json(200, {
+            "object": "list",
+            "model": body.get("model", "text-embedding-3-small"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(str(t), dims)}
+                     for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": sum(len(str(t)) // 4 for t in inputs),
+                      "total_tokens": sum(len(str(t)) // 4 for t in inputs)},
+        })
+
+    def openai_chat(self, body: dict) -> None:
+        if not self._gate("openai.chat"):
+            return
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4o")
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+        rng = seeded("chat", model, messages)
+
+        # Weather tool: ask for it once per user turn, then answer with text
+        last = messages[-1] if messages else {}
+        if body.get("tools") and last.get("role") == "user":
+            match = re.search(r" in (.+?) today", str(last.get("content", "")))
+            location = match.group(1) if match else "Syracuse, NY, US"
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{rng.randrange(10**8)}", "type": "function",
+                "function": {"name": "get_current_weather", "arguments": json.dumps({"location": location})},
+            }]}
+            return self._json(200, self._completion(model, message, "tool_calls", prompt_tokens, 10))
+
+        tokens = fake_text(rng, self.config.reply_tokens)
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": "".join(tokens)}
+            return self._json(200, self._completion(model, message, "stop", prompt_tokens, len(tokens)))
+
+        self._sse_start()
+        for i, tok in enumerate(tokens):
+            self._token_sleep()
+            delta = {"role": "assistant", "content": tok} if i == 0 else {"content": tok}
+            self._sse(json.dumps({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                                  "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}))
+        self._sse(json.dumps({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                              "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        self._sse("[DONE]")
+        self._sse_end()
+
+    @staticmethod
+    def _completion(model, message, finish_reason, prompt_tokens, completion_tokens) -> dict:
+        return {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def anthropic_messages(self, body: dict) -> None:
+        if not self._gate("anthropic.messages"):
+            return
+        model = body.get("model", "claude")
+        messages = body.get("messages", [])
+        input_tokens = (len(str(body.get("system", ""))) + sum(len(str(m.get("content", ""))) for m in messages)) // 4
+        rng = seeded("anthropic", model, body.get("system"), messages)
+
+        # Memory extraction prompts expect a JSON array
+        last_content = str(messages[-1].get("content", "")) if messages else ""
+        if "JSON array" in last_content:
+            tokens = [json.dumps([f"User likes {rng.choice(WORDS)}"])]
+        else:
+            tokens = fake_text(rng, self.config.reply_tokens)
+        usage_out = sum(len(t) for t in tokens) // 4
+
+        if not body.get("stream"):
+            return self._json(200, {
+                "id": "msg_fake", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": "".join(tokens)}],
+                "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": usage_out},
+            })
+
+        self._sse_start()
+        self._sse(json.dumps({"type": "message_start", "message": {
+            "id": "msg_fake", "type": "message", "role": "assistant", "model": model, "content": [],
+            "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 0}}}), "message_start")
+        self._sse(json.dumps({"type": "content_block_start", "index": 0,
+                              "content_block": {"type": "text", "text": ""}}), "content_block_start")
+        for tok in tokens:
+            self._token_sleep()
+            self._sse(json.dumps({"type": "content_block_delta", "index": 0,
+                                  "delta": {"type": "text_delta", "text": tok}}), "content_block_delta")
+        self._sse(json.dumps({"type": "content_block_stop", "index": 0}), "content_block_stop")
+        self._sse(json.dumps({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                              "usage": {"output_tokens": usage_out}}), "message_delta")
+        self._sse(json.dumps({"type": "message_stop"}), "message_stop")
+        self._sse_end()
+
+
+def serve(config: FakeConfig, host: str = "127.0.0.1", port: int = 8765, background: bool = False):
+    handler = type("ConfiguredFakeHandler", (FakeHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, name="fake-api", daemon=True).start()
+        return server
+    print(f"Fake APIs on http://{host}:{server.server_port}")
+    server.serve_forever()
+
+
+def add_config_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median response latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread")
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0, help="streaming speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500s")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429s")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args) -> FakeConfig:
+    return FakeConfig(args.latency_ms, args.latency_sigma, args.tokens_per_sec,
+                      args.error_rate, args.rate_limit_rate, args.reply_tokens, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI / Anthropic / OpenWeatherMap server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_args(parser)
+    args = parser.parse_args(argv)
+    serve(config_from_args(args), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
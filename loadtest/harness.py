@@ -0,0 +1,178 @@
+"""
+Multi-session load test for the pages registered in ``streamlit_app.py``.
+
+Each simulated session is a headless ``streamlit.testing.v1.AppTest`` run of
+one page, driven through a few turns (chat messages, button clicks) against
+the fake API server. Sessions run on a thread pool so many are in flight at
+once; the report has throughput, per-page latency percentiles and the
+process's memory (AppTest runs the pages in this process, so this *is* the
+server's memory).
+
+    python -m loadtest.harness --sessions 50 --concurrency 10 --turns 3
+    python -m loadtest.harness --pages lab5,lab9 --latency-ms 400 --rate-limit-rate 0.05
+"""
+
+import argparse
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from loadtest.fake_server import add_config_args, config_from_args, serve
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CITIES = ["Syracuse, NY, US", "London, UK", "Paris, France", "Tokyo, Japan", "Lima, Peru", "Syracus", "Nowhere"]
+QUESTIONS = [
+    "What are the prerequisites for IST 418?",
+    "When is the final project due in IST 488?",
+    "Hi, my name is Sam and I live in Syracuse.",
+    "What should I cook tonight?",
+    "Tell me about grading in IST 256.",
+]
+
+
+# ── Scenarios: one turn of user behaviour per page ───────────────────────────
+def chat_turn(at, rng):
+    at.chat_input[0].set_value(rng.choice(QUESTIONS)).run()
+
+
+def lab5_turn(at, rng):
+    at.text_input(key="wear_city").input(rng.choice(CITIES))
+    at.button[0].click().run()
+
+
+def lab6_turn(at, rng):
+    at.button[0].click().run()
+    at.text_input[0].input(rng.choice(["Which is the scariest?", "Any of these on streaming?"])).run()
+
+
+def humanize_turn(at, rng):
+    at.text_area[0].input("It is important to note that the argument, furthermore, is sound.")
+    at.button[0].click().run()
+
+
+SCENARIOS = {
+    "lab3(Toby).py": chat_turn,
+    "lab4.py": chat_turn,
+    "lab5.py": lab5_turn,
+    "lab6.py": lab6_turn,
+    "lab9.py": chat_turn,
+    "humanize.py": humanize_turn,
+}
+
+
+def registered_pages() -> list[str]:
+    """Page paths from the ``st.Page(...)`` calls in ``streamlit_app.py``."""
+    source = (ROOT / "streamlit_app.py").read_text()
+    return re.findall(r"st\.Page\(\s*['\"]([^'\"]+)['\"]", source)
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turns: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.sessions: dict[str, int] = {}
+        self.peak_rss = rss_mb()
+
+    def add(self, page: str, seconds: float | None) -> None:
+        with self.lock:
+            if seconds is None:
+                self.errors[page] = self.errors.get(page, 0) + 1
+            else:
+                self.turns.setdefault(page, []).append(seconds)
+            self.peak_rss = max(self.peak_rss, rss_mb())
+
+
+def run_session(page: str, turns: int, seed: int, results: Results, secrets: dict) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    name = Path(page).name
+    at = AppTest.from_file(str(ROOT / page), default_timeout=120)
+    for key, value in secrets.items():
+        at.secrets[key] = value
+    at.run()
+    with results.lock:
+        results.sessions[name] = results.sessions.get(name, 0) + 1
+    for _ in range(turns):
+        start = time.perf_counter()
+        try:
+            SCENARIOS[name](at, rng)
+            failed = bool(at.exception)
+        except Exception:
+            failed = True
+        results.add(name, None if failed else time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated sessions through the app.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--pages", default="", help="comma-separated page names (default: all with a scenario)")
+    parser.add_argument("--fake-url", default="", help="use an already running fake server")
+    add_config_args(parser)
+    args = parser.parse_args(argv)
+
+    if args.fake_url:
+        base = args.fake_url.rstrip("/")
+    else:
+        server = serve(config_from_args(args), port=0, background=True)
+        base = f"http://127.0.0.1:{server.server_port}"
+    os.environ["OPENAI_BASE_URL"] = f"{base}/v1"
+    os.environ["ANTHROPIC_BASE_URL"] = base
+    os.environ["WEATHER_API_URL"] = f"{base}/data/2.5"
+    secrets = {"OPENAI_API_KEY": "fake", "ANTHROPIC_API_KEY": "fake", "OPENWEATHERMAP_API_KEY": "fake"}
+
+    wanted = {p.strip() for p in args.pages.split(",") if p.strip()}
+    pages = [p for p in registered_pages()
+             if Path(p).name in SCENARIOS and (not wanted or Path(p).stem in wanted or Path(p).name in wanted)]
+    skipped = [p for p in registered_pages() if Path(p).name not in SCENARIOS]
+    if not pages:
+        parser.error("no pages with a scenario selected")
+
+    results = Results()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        jobs = [pool.submit(run_session, pages[i % len(pages)], args.turns, args.seed + i, results, secrets)
+                for i in range(args.sessions)]
+        for job in jobs:
+            job.result()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(v) for v in results.turns.values())
+    print(f"{args.sessions} sessions × {args.turns} turns, concurrency {args.concurrency}, {elapsed:.1f}s")
+    print(f"throughput: {total / elapsed:.2f} turns/s, peak RSS {results.peak_rss:.0f} MB")
+    print(f"{'page':<16} {'sessions':>8} {'turns':>6} {'errors':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for page in sorted(set(results.turns) | set(results.errors)):
+        lat = results.turns.get(page, [])
+        print(f"{page:<16} {results.sessions.get(page, 0):>8} {len(lat):>6} {results.errors.get(page, 0):>6} "
+              f"{percentile(lat, 0.5):>8.3f} {percentile(lat, 0.95):>8.3f} {percentile(lat, 0.99):>8.3f}")
+    if skipped:
+        print(f"skipped (no scenario — file upload pages): {', '.join(skipped)}")
+
+
+if __name__ == "__main__":
+    main()
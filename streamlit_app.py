@@ -1,6 +1,15 @@
 import streamlit as st
-import openai as openai
 
+from labs.instrumentation import start_metrics_server
+from labs.session_memory import account_session
+from labs.startup import warm_up
+
+# Prometheus /metrics on 127.0.0.1:$LAB_METRICS_PORT (no-op when unset)
+start_metrics_server()
+
+# Import heavy SDKs on a background thread when $LAB_WARMUP is set, once per
+# server process (no-op otherwise and on later reruns)
+warm_up()
 
 st.set_page_config(page_title='IST 488 Lab', initial_sidebar_state='expanded')
 
@@ -13,5 +22,10 @@ lab6 = st.Page('labs/lab6.py', title='lab 6')
 lab9 = st.Page('labs/lab9.py', title='lab 9')
 humanize = st.Page('labs/humanize.py', title='humanize')
 pg = st.navigation([lab1, lab2, lab3, lab4, lab5, lab6, lab9, humanize])
-pg.run()
+try:
+    pg.run()
+finally:
+    # Size this session's state, alarm on steady growth and compact oversized entries
+    # (sampled, so most reruns skip it; also runs when a page calls st.stop())
+    account_session(st.session_state, page=pg.title)
 
@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+import pytest
+
+from labs.lab4_versions import BUILD_LOCK, POINTER, MemmapCatalog, VersionedStore
+
+METADATA = {"embed_model": "test", "embed_dims": 8}
+
+
+def fill(store, n=20, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, 8))
+    store.add([f"chunk-{i}" for i in range(n)], vectors, [f"text {i}" for i in range(n)],
+              [{"source": "a.pdf", "chunk_index": i} for i in range(n)])
+
+
+def build(versions, n=20):
+    version, store = versions.begin(METADATA)
+    fill(store, n)
+    versions.validate(store, min_count=n, metadata=METADATA)
+    versions.commit(version)
+    return version
+
+
+@pytest.fixture
+def versions(tmp_path):
+    return VersionedStore(MemmapCatalog(tmp_path), tmp_path, grace=0)
+
+
+def test_begin_validate_commit_switches_the_active_pointer(versions, tmp_path):
+    assert versions.active() is None
+    version, store = versions.begin(METADATA)
+    assert (tmp_path / BUILD_LOCK).exists()
+    assert versions.begin(METADATA) is None   # one build at a time
+
+    fill(store)
+    versions.validate(store, min_count=20, metadata=METADATA)
+    versions.commit(version)
+
+    assert versions.active() == version
+    assert not (tmp_path / BUILD_LOCK).exists()
+    active, opened = versions.open_active()
+    assert active == version and opened.count() == 20
+
+
+def test_validation_rejects_short_or_mismatched_builds(versions):
+    version, store = versions.begin(METADATA)
+    fill(store, n=5)
+    with pytest.raises(ValueError, match="expected at least 20"):
+        versions.validate(store, min_count=20)
+    with pytest.raises(ValueError, match="unexpected settings"):
+        versions.validate(store, min_count=5, metadata={**METADATA, "embed_dims": 16})
+
+
+def test_validation_rejects_partial_ingests(versions):
+    version, store = versions.begin(METADATA)
+    fill(store, n=5)
+    versions.validate(store, expected={"a.pdf": 5}, source_key="source")
+    with pytest.raises(ValueError, match="expected 8"):
+        versions.validate(store, expected={"a.pdf": 5, "b.pdf": 3}, source_key="source")
+    with pytest.raises(ValueError, match="wrong chunks for"):
+        versions.validate(store, expected={"a.pdf": 2, "b.pdf": 3}, source_key="source")
+
+
+def test_abort_keeps_serving_the_previous_version(versions, tmp_path):
+    first = build(versions)
+    version, store = versions.begin(METADATA)
+    fill(store, n=3)
+    versions.abort(version)
+
+    assert versions.active() == first
+    assert version not in versions.catalog.versions()
+    assert not (tmp_path / BUILD_LOCK).exists()
+    assert versions.begin(METADATA) is not None   # the lock was released
+
+
+def test_commit_retires_and_collects_the_old_version(versions, tmp_path):
+    first = build(versions)
+    second = build(versions)
+
+    assert versions.active() == second
+    assert versions.catalog.versions() == [second]
+    retired = json.loads((tmp_path / POINTER).read_text())["retired"]
+    assert [r["version"] for r in retired] == [first]
+
+
+def test_leased_versions_survive_collection(tmp_path):
+    versions = VersionedStore(MemmapCatalog(tmp_path), tmp_path, grace=0)
+    first = build(versions)
+    with versions.lease(first):
+        second = build(versions)   # commit collects, but the lease holds the old version
+        assert set(versions.catalog.versions()) == {first, second}
+        assert versions.collect() == []
+    assert versions.collect() == [first]
+    assert versions.catalog.versions() == [second]
+
+
+def test_grace_period_delays_collection(tmp_path):
+    versions = VersionedStore(MemmapCatalog(tmp_path), tmp_path, grace=3600)
+    first = build(versions)
+    second = build(versions)
+    assert set(versions.catalog.versions()) == {first, second}
+    versions.grace = 0
+    assert versions.collect() == [first]
@@ -0,0 +1,55 @@
+import time
+from types import SimpleNamespace
+
+from labs.lab5_tools import execute_tool_calls, tool_messages
+
+
+def tool_call(call_id, name, arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def sleeper(args):
+    time.sleep(args["sleep"])
+    return f"slept {args['sleep']}"
+
+
+def test_results_keep_call_order_and_run_concurrently():
+    calls = [tool_call(f"c{i}", "sleep", f'{{"sleep": {delay}}}') for i, delay in enumerate((0.3, 0.2, 0.1, 0.0))]
+    start = time.monotonic()
+    results = execute_tool_calls(calls, {"sleep": sleeper}, max_workers=4, timeout=5)
+    elapsed = time.monotonic() - start
+
+    assert [r["tool_call"].id for r in results] == ["c0", "c1", "c2", "c3"]
+    assert [r["content"] for r in results] == ["slept 0.3", "slept 0.2", "slept 0.1", "slept 0.0"]
+    assert elapsed < 0.55
+    assert [m["tool_call_id"] for m in tool_messages(results)] == ["c0", "c1", "c2", "c3"]
+
+
+def test_slow_call_times_out_without_failing_the_others():
+    calls = [tool_call("slow", "sleep", '{"sleep": 1.0}'), tool_call("fast", "sleep", '{"sleep": 0.0}')]
+    results = execute_tool_calls(calls, {"sleep": sleeper}, max_workers=2, timeout=0.2)
+
+    assert results[0]["error"] == "Timed out after 0.2s"
+    assert results[0]["content"].startswith("Error: Timed out")
+    assert results[1]["error"] is None and results[1]["content"] == "slept 0.0"
+
+
+def test_timeout_starts_when_a_queued_call_begins_running():
+    # One worker: the second call queues behind the first, and each alone fits the budget
+    calls = [tool_call(f"c{i}", "sleep", '{"sleep": 0.25}') for i in range(2)]
+    results = execute_tool_calls(calls, {"sleep": sleeper}, max_workers=1, timeout=0.4)
+
+    assert [r["error"] for r in results] == [None, None]
+
+
+def test_unknown_tools_bad_arguments_and_handler_errors_become_error_messages():
+    def fail(args):
+        raise ValueError(f"bad args {args}")
+
+    calls = [tool_call("a", "missing", "{}"), tool_call("b", "fail", "not json")]
+    results = execute_tool_calls(calls, {"fail": fail})
+
+    assert results[0]["content"] == "Error: Unknown tool: missing"
+    assert results[1]["args"] == {}
+    assert results[1]["content"] == "Error: bad args {}"
+    assert execute_tool_calls([], {}) == []
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+
+from labs.lab5_weather import CircuitBreaker, CircuitOpenError, WeatherCache, WeatherClient, WeatherError
+from loadtest.fake_server import FakeConfig, serve
+
+
+@pytest.fixture
+def fake_api():
+    config = FakeConfig(latency_ms=1, latency_sigma=0)
+    server = serve(config, port=0, background=True)
+    yield config, f"http://127.0.0.1:{server.server_port}/data/2.5"
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(base_url, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+    return WeatherClient("test-key", base_url=base_url, retries=2, backoff=0, **kwargs)
+
+
+def test_success(fake_api):
+    config, base_url = fake_api
+    weather = make_client(base_url).current("Syracuse, NY")
+    assert weather["location"] == "Syracuse, NY"
+    assert config.counts["weather"] == 1
+
+
+@pytest.mark.parametrize("failure", ["error_rate", "rate_limit_rate"])
+def test_retries_5xx_and_429_then_counts_one_error(fake_api, failure):
+    config, base_url = fake_api
+    setattr(config, failure, 1.0)
+    client = make_client(base_url)
+    with pytest.raises(WeatherError):
+        client.current("Syracuse, NY")
+    metrics = client.metrics()
+    assert config.counts["weather"] == 3
+    assert (metrics["requests"], metrics["retries"], metrics["errors"]) == (3, 2, 1)
+
+
+def test_unknown_city_is_an_error_but_not_a_breaker_failure(fake_api):
+    _, base_url = fake_api
+    client = make_client(base_url)
+    for _ in range(3):
+        with pytest.raises(WeatherError, match="City not found"):
+            client.current("Nowhere")
+    metrics = client.metrics()
+    assert metrics["errors"] == 3
+    assert metrics["retries"] == 0
+    assert metrics["breaker"] == "closed"
+
+
+def test_breaker_opens_fails_fast_then_half_opens_and_closes(fake_api):
+    config, base_url = fake_api
+    config.error_rate = 1.0
+    client = make_client(base_url)
+    for _ in range(2):
+        with pytest.raises(WeatherError):
+            client.current("Syracuse, NY")
+    assert client.breaker.state == "open"
+
+    sent = config.counts["weather"]
+    with pytest.raises(CircuitOpenError):
+        client.current("Syracuse, NY")
+    assert config.counts["weather"] == sent
+    assert client.metrics()["short_circuited"] == 1
+
+    time.sleep(0.25)
+    assert client.breaker.state == "half-open"
+    config.error_rate = 0.0
+    client.current("Syracuse, NY")
+    assert client.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker(fake_api):
+    config, base_url = fake_api
+    config.error_rate = 1.0
+    client = make_client(base_url)
+    for _ in range(2):
+        with pytest.raises(WeatherError):
+            client.current("Syracuse, NY")
+    time.sleep(0.25)
+    with pytest.raises(WeatherError):
+        client.current("Syracuse, NY")   # the half-open probe fails
+    assert client.breaker.state == "open"
+
+
+# ── WeatherCache ─────────────────────────────────────────────────────────────
+def test_concurrent_misses_share_one_fetch():
+    cache = WeatherCache()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"temperature": 50}
+
+    outcomes = []
+    threads = [threading.Thread(target=lambda: outcomes.append(cache.lookup("Syracuse, NY", "imperial", fetch)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats["misses"] + cache.stats["coalesced"] < 8:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(outcome for _, outcome in outcomes) == ["coalesced"] * 7 + ["miss"]
+    assert all(value == {"temperature": 50} for value, _ in outcomes)
+    assert cache.stats == {"hits": 0, "misses": 1, "coalesced": 7, "upstream": 1, "evictions": 0}
+    assert cache.lookup("syracuse,ny", "imperial", fetch)[1] == "hit"
+
+
+def test_fetch_errors_reach_every_waiter_and_are_not_cached():
+    cache = WeatherCache()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise WeatherError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_fetch("Ithaca", "imperial", fail)
+        except WeatherError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while cache.stats["misses"] + cache.stats["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    assert len(cache) == 0
+    assert cache.get_or_fetch("Ithaca", "imperial", lambda: "ok") == "ok"
+
+
+def test_entries_expire_after_ttl():
+    cache = WeatherCache(ttl=0.05)
+    cache.get_or_fetch("Albany", "imperial", lambda: 1)
+    assert cache.lookup("Albany", "imperial", lambda: 2) == (1, "hit")
+    time.sleep(0.06)
+    assert cache.lookup("Albany", "imperial", lambda: 2) == (2, "miss")
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = WeatherCache(maxsize=2)
+    cache.get_or_fetch("a", "imperial", lambda: "a")
+    cache.get_or_fetch("b", "imperial", lambda: "b")
+    cache.get_or_fetch("a", "imperial", lambda: "stale")   # touch a, so b is now the oldest
+    cache.get_or_fetch("c", "imperial", lambda: "c")
+
+    assert len(cache) == 2
+    assert cache.stats["evictions"] == 1
+    assert cache.lookup("a", "imperial", lambda: "refetched") == ("a", "hit")
+    assert cache.lookup("b", "imperial", lambda: "refetched") == ("refetched", "miss")
@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from labs import scheduler as scheduler_module
+from labs.scheduler import BACKGROUND, INTERACTIVE, Scheduler
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after="0.2"):
+        super().__init__("429")
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after}})()
+
+
+def queue_behind_blocker(scheduler, requests):
+    """Queue ``(name, session, level)`` calls on a one-slot lane while it is busy; return the grant order."""
+    lane, blocker, _ = scheduler.acquire("test", "m", 10, session="blocker")
+    order = []
+
+    def call(name, session, level):
+        lane_, ticket, _ = scheduler.acquire("test", "m", 100, session=session, level=level)
+        order.append(name)
+        scheduler.release(lane_, ticket)
+
+    threads = []
+    for name, session, level in requests:
+        thread = threading.Thread(target=call, args=(name, session, level))
+        thread.start()
+        threads.append(thread)
+        while lane.depth() < len(threads):   # enqueue in a known order
+            time.sleep(0.005)
+    scheduler.release(lane, blocker)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_fair_queueing_interleaves_sessions():
+    scheduler = Scheduler({"test": {"concurrency": 1, "tpm": 1_000_000}})
+    order = queue_behind_blocker(scheduler, [
+        ("a1", "a", INTERACTIVE), ("a2", "a", INTERACTIVE), ("a3", "a", INTERACTIVE), ("b1", "b", INTERACTIVE),
+    ])
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_interactive_calls_go_before_background_work():
+    scheduler = Scheduler({"test": {"concurrency": 1, "tpm": 1_000_000}})
+    order = queue_behind_blocker(scheduler, [
+        ("ingest1", "a", BACKGROUND), ("ingest2", "a", BACKGROUND), ("chat", "b", INTERACTIVE),
+    ])
+    assert order == ["chat", "ingest1", "ingest2"]
+
+
+def test_token_bucket_waits_for_refill():
+    scheduler = Scheduler({"test": {"concurrency": 4, "tpm": 600}})   # 10 tokens a second
+    lane, first, _ = scheduler.acquire("test", "m", 600, session="a")
+    scheduler.release(lane, first)
+    assert lane.tokens < 1
+
+    lane, second, _ = scheduler.acquire("test", "m", 5, session="a")
+    scheduler.release(lane, second)
+    assert 0.4 <= second.wait < 1.0
+
+
+def test_release_settles_the_reservation_with_actual_usage():
+    scheduler = Scheduler({"test": {"concurrency": 4, "tpm": 600}})
+    lane, ticket, _ = scheduler.acquire("test", "m", 500, session="a")
+    scheduler.release(lane, ticket, used_tokens=100)
+    assert lane.tokens == pytest.approx(500, abs=2)
+
+
+def test_pause_holds_queued_calls():
+    scheduler = Scheduler({"test": {"concurrency": 4, "tpm": 1_000_000}})
+    lane = scheduler.lane("test", "m")
+    scheduler.pause(lane, 0.3)
+    lane, ticket, _ = scheduler.acquire("test", "m", 1, session="a")
+    scheduler.release(lane, ticket)
+    assert ticket.wait >= 0.25
+
+
+def test_run_pauses_on_429_and_retries_after_retry_after():
+    scheduler = Scheduler({"test": {"concurrency": 4, "tpm": 1_000_000}})
+    attempts = []
+
+    def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimited("0.2")
+        return "ok"
+
+    assert scheduler.run("test", "m", 10, call, page="test") == "ok"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.18
+    assert scheduler.lane("test", "m").in_flight == 0
+
+
+def test_run_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RETRY_BACKOFF", 0.0)
+    scheduler = Scheduler({"test": {"concurrency": 4, "tpm": 1_000_000}})
+    attempts = []
+
+    class ServerError(Exception):
+        status_code = 503
+
+    def call():
+        attempts.append(1)
+        raise ServerError()
+
+    with pytest.raises(ServerError):
+        scheduler.run("test", "m", 10, call, page="test")
+    assert len(attempts) == scheduler_module.MAX_RETRIES + 1
+
+    def bad_request():
+        attempts.append(1)
+        raise ValueError("not retried")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        scheduler.run("test", "m", 10, bad_request, page="test")
+    assert len(attempts) == 1
+
+
+def test_chain_batch_reserves_per_item_within_lane_concurrency(monkeypatch):
+    scheduler = Scheduler({"test": {"concurrency": 2, "tpm": 1_000_000}})
+    monkeypatch.setattr(scheduler_module, "_scheduler", scheduler)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    class Chain:
+        def invoke(self, item, config=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return item * 2
+
+    chain = scheduler_module.ScheduledChain(Chain(), "test", "m", page="test")
+    assert chain.batch([1, 2, 3, 4, 5]) == [2, 4, 6, 8, 10]
+    assert peak[0] == 2
+    assert scheduler.lane("test", "m").served == 5
@@ -0,0 +1,22 @@
+from labs import session_memory
+from labs.session_memory import SessionRecord, prometheus_lines
+
+
+def test_metrics_are_aggregated_and_escaped(monkeypatch):
+    records = {}
+    for i in range(50):
+        record = SessionRecord(f"session-{i}")
+        record.total = 100 + i
+        record.keys = {f"widget-{i}": 100 + i, 'odd"key\\\n': 10}
+        records[record.session] = record
+    monkeypatch.setattr(session_memory, "_sessions", records)
+
+    lines = prometheus_lines()
+    assert not any("session=" in line for line in lines)
+    assert "lab_sessions 50" in lines
+    assert f'lab_session_bytes{{stat="total"}} {sum(100 + i for i in range(50))}' in lines
+    assert 'lab_session_bytes{stat="max"} 149' in lines
+    keys = [line for line in lines if line.startswith("lab_session_key_bytes{")]
+    assert len(keys) == session_memory.TOP_KEYS + 1
+    assert 'lab_session_key_bytes{key="odd\\"key\\\\\\n"} 500' in keys
+    assert keys[-1].startswith('lab_session_key_bytes{key="_other"}')